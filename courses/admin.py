@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Course, CourseClass, Enrollment, Announcement
+from .models import AllocationRound, Course, ClassTimeSlot, CourseClass, DeletionJob, EnrollmentPreference, Enrollment, EnrollmentTicket, WaitlistEntry, Announcement
 
 
 @admin.register(Course)
@@ -17,13 +17,26 @@ class CourseClassInline(admin.TabularInline):
     readonly_fields = ('current_students',)
 
 
+class ClassTimeSlotInline(admin.TabularInline):
+    model = ClassTimeSlot
+    extra = 0
+    can_delete = False
+    fields = ('weekday', 'start_period', 'end_period', 'start_week', 'end_week')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        # 时段由上课时间解析生成
+        return False
+
+
 @admin.register(CourseClass)
 class CourseClassAdmin(admin.ModelAdmin):
     list_display = ('class_code', 'course', 'teacher', 'classroom', 'schedule', 'current_students', 'max_students', 'created_at')
     list_filter = ('course__semester', 'course__academic_year', 'teacher', 'created_at')
     search_fields = ('class_code', 'course__course_name', 'course__course_code', 'teacher__username', 'classroom')
     ordering = ('-created_at',)
-    readonly_fields = ('current_students', 'created_at', 'updated_at')
+    readonly_fields = ('current_students', 'counter_shards', 'created_at', 'updated_at')
+    inlines = [ClassTimeSlotInline]
 
 
 class EnrollmentInline(admin.TabularInline):
@@ -42,10 +55,60 @@ class EnrollmentAdmin(admin.ModelAdmin):
     readonly_fields = ('enroll_time', 'approve_time')
 
 
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('student', 'course_class', 'status', 'created_at', 'promoted_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('student__username', 'course_class__class_code', 'course_class__course__course_name')
+    ordering = ('course_class', 'id')
+    readonly_fields = ('created_at', 'promoted_at')
+
+
+@admin.register(EnrollmentTicket)
+class EnrollmentTicketAdmin(admin.ModelAdmin):
+    list_display = ('id', 'student', 'course_class', 'status', 'message', 'created_at', 'processed_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('student__username', 'course_class__class_code')
+    ordering = ('-id',)
+    readonly_fields = ('created_at', 'processed_at')
+
+
+@admin.register(AllocationRound)
+class AllocationRoundAdmin(admin.ModelAdmin):
+    list_display = ('name', 'opens_at', 'closes_at', 'max_choices', 'status', 'allocated_at')
+    list_filter = ('status',)
+    search_fields = ('name',)
+    filter_horizontal = ('classes',)
+    readonly_fields = ('status', 'seed', 'allocated_at', 'created_at')
+
+
+@admin.register(EnrollmentPreference)
+class EnrollmentPreferenceAdmin(admin.ModelAdmin):
+    list_display = ('allocation_round', 'student', 'rank', 'course_class', 'created_at')
+    list_filter = ('allocation_round',)
+    search_fields = ('student__username', 'course_class__class_code')
+    raw_id_fields = ('student', 'course_class')
+
+
 @admin.register(Announcement)
 class AnnouncementAdmin(admin.ModelAdmin):
     list_display = ('title', 'author', 'course_class', 'is_active', 'created_at')
     list_filter = ('is_active', 'created_at', 'author', 'course_class')
     search_fields = ('title', 'content', 'author__username')
     ordering = ('-created_at',)
-    readonly_fields = ('created_at', 'updated_at')
\ No newline at end of file
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'target_type', 'target_label', 'status', 'deleted', 'total', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'target_type')
+    search_fields = ('target_label',)
+    ordering = ('-id',)
+    readonly_fields = ('total', 'deleted', 'created_at', 'started_at', 'finished_at')
+    actions = ['requeue']
+
+    @admin.action(description='重新排队（失败或中断的任务从剩余数据继续删除）')
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status='done').update(status='queued', message='')
+        self.message_user(request, f'已重新排队 {updated} 个任务')
@@ -0,0 +1,274 @@
+"""抽签选课
+
+抽签轮次（AllocationRound）开放期间，学生只提交按顺序排列的志愿
+（EnrollmentPreference），不占用名额、不锁班次行。轮次截止后由
+run_allocation 一次性分配：
+
+1. 把全部志愿读入 NumPy 数组，剔除已选过该班次或该课程、或与已选班次上课
+   时间冲突的志愿；
+2. 每名学生抽一个随机序号，学生对每门课程按志愿顺序竞争该课程的班次；
+3. 用所有班次共用同一优先顺序（抽签序号）的延迟接受算法求解，结果等价于
+   按抽签顺序的随机序列独裁：序号靠前的学生总能拿到其志愿中仍有名额的
+   最优班次。每一轮只做排序与分组计数，全部为向量化操作；
+4. 同一学生中签的班次之间上课时间冲突时，按志愿顺序保留靠前的，删去冲突的
+   志愿后重新分配，直到没有冲突；
+5. 在一个事务内写入选课记录、bulk_update 班次人数。
+
+numpy 为可选依赖，只有执行分配时才需要安装。
+"""
+import random
+from collections import namedtuple
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Subquery
+from django.utils import timezone
+
+from .models import AllocationRound, ClassTimeSlot, CourseClass, Enrollment
+from .schedule import TimeSlot, TimetableIndex
+from .seats import EnrollmentError, fill_seat_shards, fold_seat_counters
+from .signals import enrollments_bulk_changed
+
+AllocationResult = namedtuple('AllocationResult', ['preferences', 'students', 'enrolled', 'seed'])
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImproperlyConfigured('抽签分配需要安装 numpy：pip install numpy')
+    return numpy
+
+
+def _combine(first, second):
+    """把两列 id 合成一个 int64 键，便于用 isin 做集合查找"""
+    return first * 2 ** 32 + second
+
+
+def _pair_keys(np, pairs):
+    pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+    return _combine(pairs[:, 0], pairs[:, 1])
+
+
+def allocate_seats(agent_starts, row_classes, agent_priority, capacity):
+    """按优先顺序分配名额，返回每条志愿是否中签的布尔数组
+
+    agent_starts: 每个申请者（学生 × 课程）第一条志愿的行号，同一申请者的
+        志愿连续存放且按志愿顺序排列；
+    row_classes: 每条志愿对应的班次下标；
+    agent_priority: 每个申请者的优先序号，越小越优先，互不相同；
+    capacity: 每个班次可分配的名额数。
+    """
+    np = _numpy()
+    rows = len(row_classes)
+    agents = len(agent_starts)
+    next_row = np.asarray(agent_starts, dtype=np.int64).copy()
+    end_row = np.append(next_row[1:], rows)
+    held = np.full(agents, -1, dtype=np.int64)
+    capacity = np.asarray(capacity, dtype=np.int64)
+
+    while True:
+        proposing = np.flatnonzero((held < 0) & (next_row < end_row))
+        if not proposing.size:
+            break
+        holding = np.flatnonzero(held >= 0)
+        candidate_agents = np.concatenate([holding, proposing])
+        candidate_rows = np.concatenate([held[holding], next_row[proposing]])
+        next_row[proposing] += 1
+
+        # 每个班次按优先序号保留前 capacity 名，其余退回下一志愿
+        classes = row_classes[candidate_rows]
+        order = np.lexsort((agent_priority[candidate_agents], classes))
+        classes = classes[order]
+        position = np.arange(order.size) - np.searchsorted(classes, classes, side='left')
+        kept = position < capacity[classes]
+        held[candidate_agents[order]] = np.where(kept, candidate_rows[order], -1)
+
+    won = np.zeros(rows, dtype=bool)
+    won[held[held >= 0]] = True
+    return won
+
+
+def allocate_preferences(students, row_classes, row_courses, capacity, seed):
+    """对已过滤的志愿执行随机优先分配，返回每条志愿是否中签（与输入顺序一致）
+
+    students / row_classes / row_courses 为每条志愿的学生 id、班次下标、课程
+    id，同一学生的志愿按志愿顺序排列。
+    """
+    np = _numpy()
+    # 申请者 = 学生 × 课程；同一申请者的志愿保持原有顺序
+    order = np.lexsort((np.arange(len(students)), row_courses, students))
+    students, row_classes, row_courses = students[order], row_classes[order], row_courses[order]
+    boundary = np.ones(len(students), dtype=bool)
+    boundary[1:] = (students[1:] != students[:-1]) | (row_courses[1:] != row_courses[:-1])
+    agent_starts = np.flatnonzero(boundary)
+
+    unique_students, student_index = np.unique(students, return_inverse=True)
+    lottery = np.random.default_rng(seed).permutation(len(unique_students))
+    won = allocate_seats(agent_starts, row_classes, lottery[student_index[agent_starts]], capacity)
+    result = np.empty_like(won)
+    result[order] = won
+    return result
+
+
+def _slots_by_class(queryset):
+    """{班次 id: [TimeSlot]}"""
+    slots = {}
+    for row in queryset.values_list('course_class_id', *TimeSlot._fields):
+        slots.setdefault(row[0], []).append(TimeSlot(*row[1:]))
+    return slots
+
+
+def _clashes(index, slots):
+    return index is not None and any(index.find_clash(slot) is not None for slot in slots)
+
+
+def _student_timetables(allocation_round):
+    """本轮提交了志愿的学生已占用名额的选课组成的课表索引 {学生 id: TimetableIndex}"""
+    timetables = {}
+    rows = ClassTimeSlot.objects.filter(
+        course_class__enrollments__student_id__in=Subquery(allocation_round.preferences.values('student_id')),
+        course_class__enrollments__status__in=Enrollment.SEAT_STATUSES,
+    ).values_list('course_class__enrollments__student_id', 'course_class_id', *TimeSlot._fields)
+    for row in rows:
+        timetables.setdefault(row[0], TimetableIndex()).add(row[1], TimeSlot(*row[2:]))
+    return timetables
+
+
+def _clashing_wins(students, classes, won, slots):
+    """中签志愿中与该学生志愿更靠前的中签班次上课时间冲突的行号"""
+    np = _numpy()
+    clashing = []
+    accepted = {}
+    for row in np.flatnonzero(won).tolist():
+        class_slots = slots.get(classes[row])
+        if not class_slots:
+            continue
+        index = accepted.setdefault(students[row], TimetableIndex())
+        if _clashes(index, class_slots):
+            clashing.append(row)
+        else:
+            for slot in class_slots:
+                index.add(classes[row], slot)
+    return clashing
+
+
+def _insert_enrollments(winners):
+    """用一条 executemany 写入选课记录（student_id, course_class_id）
+
+    分配结果可能有十万行，逐个构造模型实例再经 bulk_create 拼 SQL 的开销远大于
+    插入本身；这里不需要返回主键，也没有需要触发的逐条信号。
+    """
+    meta = Enrollment._meta
+    fields = [meta.get_field(name) for name in ('student', 'course_class', 'status', 'enroll_time', 'remarks')]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    enroll_time = fields[3].get_db_prep_save(timezone.now(), connection)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (student_id, class_id, 'pending', enroll_time, '抽签分配') for student_id, class_id in winners
+        ])
+
+
+def run_allocation(allocation_round, seed=None):
+    """执行一轮抽签分配，返回 AllocationResult
+
+    新建的选课记录为待审核状态，与先到先得选课一样需要教师审核；志愿数已由
+    轮次的 max_choices 限制，分配时不再检查待审核申请数上限。
+    """
+    np = _numpy()
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 62)
+
+    with transaction.atomic():
+        allocation_round = AllocationRound.objects.select_for_update().get(pk=allocation_round.pk)
+        if allocation_round.status != 'open':
+            raise EnrollmentError('该轮次已完成分配。', code='allocated')
+
+        # 先锁住参与的班次，分配期间名额不会被先到先得的选课改变
+        class_qs = CourseClass.objects.filter(allocation_rounds=allocation_round).order_by('pk')
+        list(class_qs.select_for_update().values_list('pk', flat=True))
+        fold_seat_counters(class_qs.filter(counter_shards__gt=0).values_list('pk', flat=True))
+        class_rows = np.array(
+            list(class_qs.values_list('pk', 'course_id', 'max_students', 'current_students')), dtype=np.int64
+        ).reshape(-1, 4)
+        class_ids, class_courses = class_rows[:, 0], class_rows[:, 1]
+        capacity = np.maximum(class_rows[:, 2] - class_rows[:, 3], 0)
+
+        prefs = np.array(list(
+            allocation_round.preferences.order_by('student_id', 'rank').values_list('student_id', 'course_class_id')
+        ), dtype=np.int64).reshape(-1, 2)
+        # 只保留仍属于本轮的班次
+        row_classes = np.searchsorted(class_ids, prefs[:, 1])
+        known = row_classes < len(class_ids)
+        known[known] = class_ids[row_classes[known]] == prefs[known, 1]
+        students, row_classes = prefs[known, 0], row_classes[known]
+        row_courses = class_courses[row_classes]
+
+        # 剔除已有选课记录的班次（任意状态）和已选的课程（被拒绝的除外）
+        round_enrollments = Enrollment.objects.filter(
+            course_class__course_id__in=Subquery(allocation_round.classes.values('course_id'))
+        )
+        taken_classes = _pair_keys(np, round_enrollments.values_list('student_id', 'course_class_id'))
+        taken_courses = _pair_keys(np, round_enrollments.exclude(status='rejected').values_list(
+            'student_id', 'course_class__course_id'
+        ))
+        valid = ~np.isin(_combine(students, class_ids[row_classes]), taken_classes)
+        valid &= ~np.isin(_combine(students, row_courses), taken_courses)
+        students, row_classes, row_courses = students[valid], row_classes[valid], row_courses[valid]
+
+        # 剔除与已选班次上课时间冲突的志愿
+        slots = _slots_by_class(ClassTimeSlot.objects.filter(course_class__in=class_qs))
+        timetables = _student_timetables(allocation_round)
+        if timetables:
+            valid = np.array([
+                not _clashes(timetables.get(student), slots.get(class_id, ()))
+                for student, class_id in zip(students.tolist(), class_ids[row_classes].tolist())
+            ], dtype=bool)
+            students, row_classes, row_courses = students[valid], row_classes[valid], row_courses[valid]
+
+        # 中签班次之间冲突时删去志愿靠后的一条重新分配；每轮至少删去一条志愿，
+        # 且保留的中签志愿不会被删，学生集合和抽签序号不变
+        while True:
+            won = allocate_preferences(students, row_classes, row_courses, capacity, seed)
+            clashing = _clashing_wins(students.tolist(), class_ids[row_classes].tolist(), won, slots)
+            if not clashing:
+                break
+            keep = np.ones(len(students), dtype=bool)
+            keep[clashing] = False
+            students, row_classes, row_courses = students[keep], row_classes[keep], row_courses[keep]
+
+        winners = list(zip(students[won].tolist(), class_ids[row_classes[won]].tolist()))
+        _insert_enrollments(winners)
+
+        awarded = np.bincount(row_classes[won], minlength=len(class_ids))
+        changed = []
+        for index in np.flatnonzero(awarded).tolist():
+            course_class = CourseClass(
+                pk=int(class_ids[index]), max_students=int(class_rows[index, 2]),
+                current_students=int(class_rows[index, 3] + awarded[index]),
+            )
+            changed.append(course_class)
+        CourseClass.objects.bulk_update(changed, ['current_students'], batch_size=500)
+        for course_class in CourseClass.objects.filter(
+            pk__in=[c.pk for c in changed], counter_shards__gt=0
+        ).only('pk', 'max_students', 'current_students', 'counter_shards'):
+            fill_seat_shards(course_class, course_class.counter_shards)
+
+        allocation_round.status = 'allocated'
+        allocation_round.seed = seed
+        allocation_round.allocated_at = timezone.now()
+        allocation_round.save(update_fields=['status', 'seed', 'allocated_at'])
+
+        if winners:
+            student_ids = {student_id for student_id, _ in winners}
+            class_ids_changed = {c.pk for c in changed}
+            transaction.on_commit(lambda: enrollments_bulk_changed.send(
+                sender=Enrollment, student_ids=student_ids, class_ids=class_ids_changed,
+                status_counts={'pending': len(winners)},
+            ))
+
+    return AllocationResult(len(prefs), len(np.unique(students)), len(winners), seed)
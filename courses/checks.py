@@ -0,0 +1,45 @@
+"""系统检查"""
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+# 只在本进程内有效的缓存后端
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# 各进程共享、读写不经过业务数据库的缓存后端
+SHARED_CACHES = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+)
+
+
+def process_local_cache(alias='default'):
+    """缓存后端是否只在本进程内有效（其他进程看不到写入与失效）"""
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_CACHES
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    if not process_local_cache():
+        return []
+    return [Warning(
+        '默认缓存只在本进程内有效，web 进程、worker 和管理命令之间看不到彼此的缓存失效，'
+        '选课快照、仪表板片段、列表总数会读到过期数据，build_recommendations 的结果也无法被 web 进程读取。',
+        hint='设置环境变量 REDIS_URL 使用 Redis，见 settings.CACHES。',
+        id='courses.W001',
+    )]
+
+
+@register(deploy=True)
+def production_cache_check(app_configs, **kwargs):
+    if settings.CACHES.get('default', {}).get('BACKEND') in SHARED_CACHES:
+        return []
+    return [Error(
+        '生产环境的默认缓存须为 Redis 或 Memcached。数据库缓存每次读写都要查询数据库、每次写入还要统计整张'
+        '缓存表，仪表板等页面的查询数会成倍增加；进程内缓存则无法在各进程之间共享。',
+        hint='设置环境变量 REDIS_URL，见 settings.CACHES。',
+        id='courses.E001',
+    )]
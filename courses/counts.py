@@ -0,0 +1,94 @@
+"""列表总数的缓存与估算
+
+分页列表显示的总数按（模型, 视图, 筛选条件）缓存 COUNT_CACHE_TIMEOUT 秒。缓存键
+带模型的版本号，signals 中的处理函数在该模型的记录增删改提交后换新版本号，
+写入后的第一次访问即重新统计。版本号存放在默认缓存中，排队 worker、删除 worker
+等其他进程的写入也要让 web 进程看到新版本号，因此需要各进程共享的缓存后端
+（见 settings.CACHES 与系统检查 courses.W001）。
+
+没有任何筛选条件的大表直接读取数据库统计信息中的行数估计（PostgreSQL 的
+pg_class.reltuples、SQLite ANALYZE 生成的 sqlite_stat1、MySQL 的
+information_schema.TABLES），不做全表 COUNT(*)；估计值低于
+COURSES_COUNT_ESTIMATE_THRESHOLD 或不可用时仍精确统计。
+"""
+import hashlib
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+COUNT_CACHE_TIMEOUT = 60
+
+# value 为总数，estimated 表示取自统计信息的估计值
+Total = namedtuple('Total', ['value', 'estimated'])
+
+
+def _version_key(model):
+    return f'courses:count-version:{model._meta.label_lower}'
+
+
+def bump_count_version(model):
+    """model 的记录变化后调用，使其全部缓存的总数失效"""
+    cache.set(_version_key(model), uuid.uuid4().hex, None)
+
+
+def _version(model):
+    key = _version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def estimated_row_count(model, using='default'):
+    """数据库统计信息中的表行数估计，不可用时返回 None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table]
+    elif connection.vendor == 'sqlite':
+        # 每个索引一行，stat 的第一个数为表的行数
+        sql, params = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table]
+    elif connection.vendor == 'mysql':
+        sql = 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+        params = [table]
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    except DatabaseError:
+        # sqlite_stat1 在首次 ANALYZE 之前不存在
+        return None
+    if connection.vendor == 'sqlite':
+        rows = [(str(stat).split()[0],) for stat, in rows if stat]
+    estimates = [int(float(value)) for value, in rows if value is not None]
+    # PostgreSQL 从未分析过的表 reltuples 为 -1
+    estimate = max(estimates, default=-1)
+    return estimate if estimate >= 0 else None
+
+
+def _is_unfiltered(queryset):
+    return not queryset.query.where and not queryset.query.distinct
+
+
+def cached_count(queryset, scope=''):
+    """queryset 的总数（Total）；scope 区分同一模型下不同视图、筛选条件的列表"""
+    model = queryset.model
+    if _is_unfiltered(queryset):
+        threshold = getattr(settings, 'COURSES_COUNT_ESTIMATE_THRESHOLD', 100000)
+        estimate = estimated_row_count(model, queryset.db)
+        if estimate is not None and estimate >= threshold:
+            return Total(estimate, True)
+
+    digest = hashlib.sha1(scope.encode()).hexdigest()
+    key = f'courses:count:{model._meta.label_lower}:{_version(model)}:{digest}'
+    value = cache.get(key)
+    if value is None:
+        value = queryset.count()
+        cache.set(key, value, COUNT_CACHE_TIMEOUT)
+    return Total(value, False)
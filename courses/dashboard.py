@@ -0,0 +1,457 @@
+"""管理员仪表板统计
+
+compute_admin_stats 用条件聚合统计：用户表、课程表、选课记录表各一条查询。
+
+启用 COURSES_DASHBOARD_STATS 后，统计值物化在 DashboardStats 单行表中，仪表板
+只需按主键读一行。用户、课程、选课记录的变化由 signals 中的处理函数在事务提交
+后以 F() 表达式增量更新该行；批量写入选课记录的调用方通过
+enrollments_bulk_changed 的 status_counts 参数传入各状态的增减数。增量更新与
+业务写入不在同一事务内，不会让所有选课事务排队等这一行的锁，代价是进程在两者
+之间退出时可能产生偏差，可用 manage.py rebuild_dashboard_stats 重建。
+
+教师和学生的仪表板按片段缓存，缓存键带版本号：
+
+- teacher:{id}           教师的班次、课程和已通过学生数；
+- student:{id}           学生已通过的选课；
+- available              全体学生共用的未满班次候选列表（只存班次 id），各学生
+                         再按自己的选课快照剔除已选班次；已构建课程推荐
+                         （courses.recommend）时改为展示推荐结果，不再使用该列表。
+
+候选列表中各班次的展示数据（课程、教师、剩余名额）按班次 id 另行缓存，不带
+版本号，班次变化时直接删除。学生仪表板的版本号、片段各用一次 get_many 取回，
+缓存命中时不写缓存。
+
+signals 中的处理函数在 Enrollment、CourseClass、Course 变化提交后只为受影响
+的教师、学生换新版本号并删除受影响班次的展示数据，旧片段随超时过期。选课只
+改变所选班次的人数，候选列表仅在某个班次因此进出列表（满员、空出名额、新建、
+删除）时才失效。版本号存放在默认缓存中，需配置各进程共享的缓存后端（见
+settings.CACHES）。各片段的命中与未命中次数先在进程内累积，每
+STATS_FLUSH_EVERY 次合并写入缓存，可用 manage.py dashboard_cache_stats 查看。
+
+各函数的 *_async 版本供异步仪表板视图使用，相互独立的查询经有界线程池并发
+执行（COURSES_DASHBOARD_DB_THREADS）。
+"""
+import asyncio
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Course, CourseClass, DashboardStats, Enrollment
+from .recommend import recommend_classes
+from .snapshot import get_enrollment_snapshot
+
+User = get_user_model()
+
+STATS_PK = 1
+
+STAT_FIELDS = (
+    'total_users', 'total_students', 'total_teachers', 'total_courses', 'total_enrollments', 'pending_enrollments',
+)
+
+# 用户类型 / 选课状态 -> 对应的统计字段，不在表中的取值不单独统计
+USER_TYPE_FIELDS = {'student': 'total_students', 'teacher': 'total_teachers'}
+ENROLLMENT_STATUS_FIELDS = {'approved': 'total_enrollments', 'pending': 'pending_enrollments'}
+
+
+def materialized_stats_enabled():
+    return getattr(settings, 'COURSES_DASHBOARD_STATS', False)
+
+
+def _admin_queries():
+    """相互独立的三条统计查询，各返回统计字典的一部分"""
+    return [
+        lambda: User.objects.aggregate(
+            total_users=Count('pk'),
+            total_students=Count('pk', filter=Q(user_type='student')),
+            total_teachers=Count('pk', filter=Q(user_type='teacher')),
+        ),
+        lambda: {'total_courses': Course.objects.count()},
+        lambda: Enrollment.objects.aggregate(
+            total_enrollments=Count('pk', filter=Q(status='approved')),
+            pending_enrollments=Count('pk', filter=Q(status='pending')),
+        ),
+    ]
+
+
+def compute_admin_stats():
+    """直接从业务表统计，返回以 STAT_FIELDS 为键的字典"""
+    stats = {}
+    for query in _admin_queries():
+        stats.update(query())
+    return stats
+
+
+def rebuild_dashboard_stats():
+    """重新统计并写入 DashboardStats，返回统计结果"""
+    with transaction.atomic():
+        # 先锁住统计行，重建期间提交的增量排在重建之后
+        DashboardStats.objects.select_for_update().filter(pk=STATS_PK).first()
+        stats = compute_admin_stats()
+        DashboardStats.objects.update_or_create(pk=STATS_PK, defaults={**stats, 'rebuilt_at': timezone.now()})
+    return stats
+
+
+def admin_dashboard_stats():
+    """管理员仪表板使用的统计值"""
+    if not materialized_stats_enabled():
+        return compute_admin_stats()
+    stats = DashboardStats.objects.filter(pk=STATS_PK).values(*STAT_FIELDS).first()
+    if stats is None:
+        stats = rebuild_dashboard_stats()
+    return stats
+
+
+def apply_stats_delta(deltas):
+    """把 {统计字段: 增减数} 加到统计行上；统计行尚未建立时忽略，首次读取时重建"""
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if changes:
+        DashboardStats.objects.filter(pk=STATS_PK).update(**changes)
+
+
+def add_delta(deltas, field, delta):
+    if field is not None:
+        deltas[field] = deltas.get(field, 0) + delta
+    return deltas
+
+
+def enrollment_status_deltas(status_counts):
+    """把 {选课状态: 增减数} 换算为统计字段的增减数"""
+    deltas = {}
+    for status, delta in status_counts.items():
+        add_delta(deltas, ENROLLMENT_STATUS_FIELDS.get(status), delta)
+    return deltas
+
+
+DASHBOARD_CACHE_TIMEOUT = 300
+FRAGMENTS = ('teacher', 'student', 'available')
+# 学生仪表板展示的可选班次数，以及全体学生共用的候选列表长度
+AVAILABLE_SHOWN = 10
+AVAILABLE_CANDIDATES = 50
+# 命中计数先在进程内累积，每这么多次查找才合并写入缓存一次，读缓存的请求不必写缓存
+STATS_FLUSH_EVERY = 100
+
+_pending_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _version_key(scope):
+    return f'courses:dashboard-version:{scope}'
+
+
+def _versions(*scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            cache.add(key, uuid.uuid4().hex, None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+    return versions
+
+
+def bump_dashboard_versions(scopes):
+    """使这些片段的缓存失效；版本号取随机值，版本键被淘汰后也不会与旧片段重号"""
+    if scopes:
+        cache.set_many({_version_key(scope): uuid.uuid4().hex for scope in scopes}, None)
+
+
+def _stats_key(fragment, outcome):
+    return f'courses:dashboard-stats:{fragment}:{outcome}'
+
+
+def flush_dashboard_cache_stats():
+    """把本进程累积的命中计数写入缓存"""
+    global _pending_stats
+    with _stats_lock:
+        pending, _pending_stats = _pending_stats, Counter()
+    for (fragment, outcome), delta in pending.items():
+        key = _stats_key(fragment, outcome)
+        if not cache.add(key, delta, None):
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                cache.set(key, delta, None)
+
+
+def _count(fragment, outcome):
+    with _stats_lock:
+        _pending_stats[fragment, outcome] += 1
+        full = sum(_pending_stats.values()) >= STATS_FLUSH_EVERY
+    if full:
+        flush_dashboard_cache_stats()
+
+
+def _fragment_lookup(fragment, key, found=None):
+    """读取片段并记录命中；found 为已用 get_many 取回的结果"""
+    value = cache.get(key) if found is None else found.get(key)
+    _count(fragment, 'misses' if value is None else 'hits')
+    return value
+
+
+def _cached_fragment(fragment, key, loader, found=None):
+    """读取片段，未命中时用 loader 生成并写入"""
+    value = _fragment_lookup(fragment, key, found)
+    if value is None:
+        value = loader()
+        cache.set(key, value, DASHBOARD_CACHE_TIMEOUT)
+    return value
+
+
+def dashboard_cache_stats():
+    """{片段: {'hits': 命中次数, 'misses': 未命中次数}}；其他进程尚未写入的计数不含在内"""
+    flush_dashboard_cache_stats()
+    keys = {
+        (fragment, outcome): _stats_key(fragment, outcome) for fragment in FRAGMENTS for outcome in ('hits', 'misses')
+    }
+    values = cache.get_many(keys.values())
+    stats = {fragment: {} for fragment in FRAGMENTS}
+    for (fragment, outcome), key in keys.items():
+        stats[fragment][outcome] = values.get(key, 0)
+    return stats
+
+
+def reset_dashboard_cache_stats():
+    with _stats_lock:
+        _pending_stats.clear()
+    cache.delete_many([_stats_key(fragment, outcome) for fragment in FRAGMENTS for outcome in ('hits', 'misses')])
+
+
+def _teacher_key(teacher):
+    version, = _versions(f'teacher:{teacher.pk}')
+    return f'courses:dashboard:teacher:{teacher.pk}:{version}'
+
+
+def _teacher_queries(teacher):
+    """教师仪表板相互独立的查询，键为模板变量名"""
+    return {
+        'my_classes': lambda: list(CourseClass.objects.filter(teacher=teacher).select_related('course')),
+        'total_students': lambda: Enrollment.objects.filter(course_class__teacher=teacher, status='approved').count(),
+        'my_courses': lambda: list(Course.objects.filter(classes__teacher=teacher).distinct()),
+    }
+
+
+def teacher_dashboard(teacher):
+    """教师仪表板的数据：my_classes、total_students、my_courses"""
+    return _cached_fragment('teacher', _teacher_key(teacher), lambda: {
+        name: query() for name, query in _teacher_queries(teacher).items()
+    })
+
+
+def _available_query():
+    return CourseClass.objects.filter(
+        current_students__lt=F('max_students'), is_active=True
+    ).select_related('course', 'teacher').order_by('pk')
+
+
+def _available_key(version=None):
+    if version is None:
+        version, = _versions('available')
+    return f'courses:dashboard:available:{version}'
+
+
+def _class_key(class_id):
+    return f'courses:dashboard:class:{class_id}'
+
+
+def _student_keys(student):
+    """学生仪表板各片段的缓存键，版本号一次取回"""
+    student_version, available_version = _versions(f'student:{student.pk}', 'available')
+    return {
+        'student': f'courses:dashboard:student:{student.pk}:{student_version}',
+        'available': _available_key(available_version),
+    }
+
+
+def _student_enrollments(student, keys, found):
+    return _cached_fragment(
+        'student', keys['student'],
+        lambda: list(Enrollment.objects.filter(student=student, status='approved').select_related(
+            'course_class__course', 'course_class__teacher'
+        )),
+        found,
+    )
+
+
+def _available_candidates(keys, found):
+    """全体学生共用的候选班次：id 列表与各班次的展示数据分别缓存"""
+    class_ids = _cached_fragment(
+        'available', keys['available'],
+        lambda: list(_available_query().values_list('pk', flat=True)[:AVAILABLE_CANDIDATES]),
+        found,
+    )
+    cached = cache.get_many([_class_key(pk) for pk in class_ids])
+    missing = [pk for pk in class_ids if _class_key(pk) not in cached]
+    if missing:
+        loaded = {
+            _class_key(course_class.pk): course_class
+            for course_class in CourseClass.objects.filter(pk__in=missing).select_related('course', 'teacher')
+        }
+        cache.set_many(loaded, DASHBOARD_CACHE_TIMEOUT)
+        cached.update(loaded)
+    return [cached[_class_key(pk)] for pk in class_ids if _class_key(pk) in cached], len(class_ids)
+
+
+def _student_available(student, request, keys, found):
+    snapshot = get_enrollment_snapshot(student, request)
+    recommended = recommend_classes(student, snapshot.class_ids, snapshot.course_ids, AVAILABLE_SHOWN)
+    if recommended is not None:
+        return recommended
+
+    candidates, candidate_count = _available_candidates(keys, found)
+    available = [
+        course_class for course_class in candidates if course_class.pk not in snapshot.class_ids
+    ][:AVAILABLE_SHOWN]
+    if len(available) < AVAILABLE_SHOWN and candidate_count == AVAILABLE_CANDIDATES:
+        # 候选列表被该学生已选的班次占满，回退到按学生查询
+        available = list(_available_query().exclude(enrollments__student=student)[:AVAILABLE_SHOWN])
+    return available
+
+
+def _student_fragments(student):
+    """学生仪表板片段的缓存键，以及一次 get_many 取回的片段"""
+    keys = _student_keys(student)
+    return keys, cache.get_many(keys.values())
+
+
+def student_dashboard(student, request=None):
+    """学生仪表板的数据：my_enrollments、available_courses"""
+    keys, found = _student_fragments(student)
+    return {
+        'my_enrollments': _student_enrollments(student, keys, found),
+        'available_courses': _student_available(student, request, keys, found),
+    }
+
+
+def _listing_changed(has_seats):
+    """has_seats 为 {班次 id: 是否还有名额}；这些班次是否因此进出了候选列表"""
+    class_ids = cache.get(_available_key())
+    if class_ids is None:
+        return False
+    members = set(class_ids)
+    # 候选列表已满时，只有 id 小于末位的班次才可能挤进列表
+    bound = class_ids[-1] if len(class_ids) == AVAILABLE_CANDIDATES else None
+    return any(
+        pk in members if not open_ else pk not in members and (bound is None or pk < bound)
+        for pk, open_ in has_seats.items()
+    )
+
+
+def _invalidate_classes(class_ids, deleted_ids=()):
+    """删除这些班次缓存的展示数据；返回 (所属教师 id, 需要换版本号的片段)
+
+    班次的展示数据按班次 id 直接删除，候选列表只在有班次进出时才换版本号。
+    """
+    rows = []
+    if class_ids:
+        rows = list(CourseClass.objects.filter(pk__in=class_ids).values_list(
+            'pk', 'teacher_id', 'current_students', 'max_students', 'is_active'
+        ))
+    has_seats = {pk: active and current < limit for pk, _, current, limit, active in rows}
+    has_seats.update(dict.fromkeys(deleted_ids, False))
+    cache.delete_many([_class_key(pk) for pk in has_seats])
+    scopes = ['available'] if _listing_changed(has_seats) else []
+    return {row[1] for row in rows}, scopes
+
+
+def invalidate_enrollment_dashboards(student_ids, class_ids):
+    """选课记录变化后调用：相关学生、班次及其教师失效，候选列表按需失效"""
+    teacher_ids, scopes = _invalidate_classes(class_ids)
+    bump_dashboard_versions(
+        [f'student:{pk}' for pk in student_ids] + [f'teacher:{pk}' for pk in teacher_ids] + scopes
+    )
+
+
+def invalidate_class_dashboards(class_ids, teacher_ids, with_students=True, deleted_ids=()):
+    """班次或课程信息变化后调用；with_students 时选了这些班次的学生一并失效"""
+    _, scopes = _invalidate_classes(class_ids, deleted_ids)
+    scopes += [f'teacher:{pk}' for pk in teacher_ids]
+    if with_students:
+        student_ids = set(Enrollment.objects.filter(
+            course_class_id__in=class_ids, status='approved'
+        ).values_list('student_id', flat=True))
+        scopes += [f'student:{pk}' for pk in student_ids]
+    bump_dashboard_versions(scopes)
+
+
+# 异步仪表板：相互独立的查询放到有界线程池中并发执行。池中线程各自持有数据库
+# 连接，并发数即额外占用的连接数上限。池中线程长期存在，连接在线程内一直复用，
+# 不按 CONN_MAX_AGE 在每次查询后关闭（CONN_MAX_AGE 为 0 时那样每条查询都要
+# 重新建立连接）；只关闭出错后已不可用的连接，下次查询时自动重连。
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _db_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'COURSES_DASHBOARD_DB_THREADS', 4),
+                    thread_name_prefix='dashboard-db',
+                )
+    return _executor
+
+
+def _release_connections():
+    for conn in connections.all(initialized_only=True):
+        if conn.connection is None or not conn.errors_occurred:
+            continue
+        if conn.is_usable():
+            conn.errors_occurred = False
+        else:
+            conn.close()
+
+
+def _run_query(query):
+    try:
+        return query()
+    finally:
+        _release_connections()
+
+
+async def _gather(queries):
+    run = sync_to_async(_run_query, thread_sensitive=False, executor=_db_executor())
+    return await asyncio.gather(*(run(query) for query in queries))
+
+
+async def admin_dashboard_stats_async():
+    """admin_dashboard_stats 的异步版本，三条统计查询并发执行"""
+    if materialized_stats_enabled():
+        return await sync_to_async(admin_dashboard_stats)()
+    stats = {}
+    for part in await _gather(_admin_queries()):
+        stats.update(part)
+    return stats
+
+
+async def teacher_dashboard_async(teacher):
+    """teacher_dashboard 的异步版本，缓存未命中时三条查询并发执行"""
+    key = await sync_to_async(_teacher_key)(teacher)
+    value = await sync_to_async(_fragment_lookup)('teacher', key)
+    if value is None:
+        queries = _teacher_queries(teacher)
+        value = dict(zip(queries, await _gather(queries.values())))
+        await sync_to_async(cache.set)(key, value, DASHBOARD_CACHE_TIMEOUT)
+    return value
+
+
+async def student_dashboard_async(student, request=None):
+    """student_dashboard 的异步版本，已选课程与推荐班次并发获取"""
+    keys, found = await sync_to_async(_student_fragments)(student)
+    my_enrollments, available = await _gather([
+        lambda: _student_enrollments(student, keys, found),
+        lambda: _student_available(student, request, keys, found),
+    ])
+    return {'my_enrollments': my_enrollments, 'available_courses': available}
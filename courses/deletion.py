@@ -0,0 +1,212 @@
+"""后台分批删除课程与用户
+
+删除一门有上千条选课记录的课程、或一位带很多班次的教师时，级联删除要在一个
+请求、一个事务里读出并删除全部关联行，足以让 worker 超时。这里请求只写入一条
+删除任务（DeletionJob），并关闭要删除的课程与班次（is_active=False：不再出现在
+列表中，也不能再选课）就返回；后台 worker（manage.py process_deletion_jobs）
+按步骤逐批删除：每批最多 batch_size 行，各自一个事务，批间更新任务的进度。
+
+每个步骤是一个 queryset，反复取出其中主键最小的一批删除，直到为空，因此中断后
+重新执行任务会从剩下的数据继续。关联数据先于其父记录删除（排队票据、候补、
+志愿、公告、选课记录 → 班次 → 课程 / 用户），最后删除对象本身时级联的行数已
+很少。学生的选课记录占用名额时，删除后释放名额并递补候补名单。
+
+worker 每删完一批刷新任务的 heartbeat_at；worker 崩溃或被杀后，删除中的任务
+超过 COURSES_DELETION_STALE_SECONDS 秒没有进展，即由下一个 worker 重新领取。
+任一步骤出错时任务标为失败并记录原因，不会停留在删除中。
+
+设置 COURSES_DELETION_MODE = 'sync' 时在请求内直接分批执行（未启动 worker 的
+开发环境使用）。
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .counts import bump_count_version
+from .dashboard import invalidate_class_dashboards
+from .models import (
+    Announcement, Course, CourseClass, DeletionJob, Enrollment, EnrollmentPreference, EnrollmentTicket,
+    WaitlistEntry,
+)
+from .waitlist import release_seats_and_promote
+
+User = get_user_model()
+
+DELETION_BATCH_SIZE = 1000
+
+
+def background_deletion_enabled():
+    """删除请求是否交给后台 worker 执行"""
+    return getattr(settings, 'COURSES_DELETION_MODE', 'background') == 'background'
+
+
+def pending_deletion(target_type, target_id):
+    """对象尚未完成的删除任务，没有时返回 None"""
+    return DeletionJob.objects.filter(
+        target_type=target_type, target_id=target_id, status__in=('queued', 'running')
+    ).first()
+
+
+def _close_classes(classes):
+    """关闭班次：不再出现在列表中、不能再选课，事务提交后使仪表板与列表总数失效"""
+    rows = list(classes.values_list('pk', 'teacher_id'))
+    classes.update(is_active=False)
+    class_ids, teacher_ids = {pk for pk, _ in rows}, {teacher_id for _, teacher_id in rows}
+
+    def invalidate():
+        invalidate_class_dashboards(class_ids, teacher_ids, with_students=False)
+        bump_count_version(CourseClass)
+    transaction.on_commit(invalidate)
+
+
+def enqueue_course_deletion(course, requested_by=None):
+    """提交删除课程的任务，并立即关闭课程及其班次；已有未完成的任务时直接返回它"""
+    with transaction.atomic():
+        Course.objects.filter(pk=course.pk).update(is_active=False)
+        _close_classes(CourseClass.objects.filter(course_id=course.pk))
+        transaction.on_commit(lambda: bump_count_version(Course))
+        return pending_deletion('course', course.pk) or DeletionJob.objects.create(
+            target_type='course', target_id=course.pk, target_label=f'{course.course_code} - {course.course_name}',
+            requested_by=requested_by,
+        )
+
+
+def enqueue_user_deletion(user, requested_by=None):
+    """提交删除用户的任务，并立即停用该账户使其不能再登录；教师授课的班次一并关闭"""
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        _close_classes(CourseClass.objects.filter(teacher_id=user.pk))
+        return pending_deletion('user', user.pk) or DeletionJob.objects.create(
+            target_type='user', target_id=user.pk, target_label=user.username, requested_by=requested_by,
+        )
+
+
+def _class_steps(classes):
+    """删除班次及其关联数据的步骤，班次本身最后删除"""
+    return [
+        (EnrollmentTicket.objects.filter(course_class__in=classes), False),
+        (WaitlistEntry.objects.filter(course_class__in=classes), False),
+        (EnrollmentPreference.objects.filter(course_class__in=classes), False),
+        (Announcement.objects.filter(course_class__in=classes), False),
+        # 班次随后一并删除，不必释放名额
+        (Enrollment.objects.filter(course_class__in=classes), False),
+        (classes, False),
+    ]
+
+
+def deletion_steps(job):
+    """任务的删除步骤 [(queryset, 是否释放名额)]，按顺序执行"""
+    if job.target_type == 'course':
+        classes = CourseClass.objects.filter(course_id=job.target_id)
+        return _class_steps(classes) + [(Course.objects.filter(pk=job.target_id), False)]
+
+    user_id = job.target_id
+    return [
+        (EnrollmentTicket.objects.filter(student_id=user_id), False),
+        (WaitlistEntry.objects.filter(student_id=user_id), False),
+        (EnrollmentPreference.objects.filter(student_id=user_id), False),
+        (Enrollment.objects.filter(student_id=user_id), True),
+        # 教师授课的班次（授课教师不能为空）
+        *_class_steps(CourseClass.objects.filter(teacher_id=user_id)),
+        (Announcement.objects.filter(author_id=user_id), False),
+        (User.objects.filter(pk=user_id), False),
+    ]
+
+
+def delete_batch(queryset, batch_size=DELETION_BATCH_SIZE, release_seats=False):
+    """在一个事务内删除 queryset 中主键最小的至多 batch_size 行，返回删除的行数
+
+    逐行的 post_delete 信号照常触发（缓存失效、仪表板统计），开销随批大小有界。
+    release_seats 为真时 queryset 须为选课记录，占用名额的记录删除后释放名额。
+    """
+    with transaction.atomic():
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return 0
+        batch = queryset.model.objects.filter(pk__in=pks)
+        freed = Counter()
+        if release_seats:
+            freed = Counter(
+                batch.filter(status__in=Enrollment.SEAT_STATUSES).values_list('course_class_id', flat=True)
+            )
+        batch.delete()
+        for course_class in CourseClass.objects.filter(pk__in=freed).order_by('pk'):
+            release_seats_and_promote(course_class, freed[course_class.pk])
+    return len(pks)
+
+
+def run_deletion_job(job, batch_size=DELETION_BATCH_SIZE):
+    """执行删除任务直到完成，返回任务；出错时标为失败并记录原因"""
+    try:
+        steps = deletion_steps(job)
+        job.status = 'running'
+        job.started_at = job.started_at or timezone.now()
+        job.heartbeat_at = timezone.now()
+        # 重新执行时从剩余的数据算起
+        job.total = job.deleted + sum(queryset.count() for queryset, _ in steps)
+        job.save(update_fields=['status', 'started_at', 'heartbeat_at', 'total'])
+        for queryset, release_seats in steps:
+            while True:
+                deleted = delete_batch(queryset, batch_size, release_seats)
+                if not deleted:
+                    break
+                job.deleted += deleted
+                job.heartbeat_at = timezone.now()
+                DeletionJob.objects.filter(pk=job.pk).update(deleted=job.deleted, heartbeat_at=job.heartbeat_at)
+    except Exception as e:
+        job.status = 'failed'
+        job.message = str(e)[:200]
+    else:
+        job.status = 'done'
+        job.message = f'已删除{job.get_target_type_display()} {job.target_label}'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'message', 'finished_at'])
+    return job
+
+
+def _stale_before():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'COURSES_DELETION_STALE_SECONDS', 300))
+
+
+def claim_next_job():
+    """领取最早提交的排队任务或已无进展的删除中任务，没有时返回 None；并发的 worker 不会领到同一任务"""
+    stale = Q(status='running') & (Q(heartbeat_at__lt=_stale_before()) | Q(heartbeat_at__isnull=True))
+    for job in DeletionJob.objects.filter(Q(status='queued') | stale).order_by('id')[:10]:
+        now = timezone.now()
+        # 条件更新只有一个 worker 能成功：排队的任务看状态，无进展的任务看领取时读到的心跳
+        claimed = DeletionJob.objects.filter(pk=job.pk, status=job.status, heartbeat_at=job.heartbeat_at)
+        if claimed.update(status='running', heartbeat_at=now):
+            job.status, job.heartbeat_at = 'running', now
+            return job
+    return None
+
+
+def drain_deletion_jobs(batch_size=DELETION_BATCH_SIZE):
+    """依次执行排队的删除任务，返回执行的任务数"""
+    processed = 0
+    while True:
+        job = claim_next_job()
+        if job is None:
+            return processed
+        run_deletion_job(job, batch_size)
+        processed += 1
+
+
+def run_worker(poll_interval=1.0, batch_size=DELETION_BATCH_SIZE, once=False):
+    """worker 主循环：不断执行排队的任务，队列为空时休眠 poll_interval 秒"""
+    while True:
+        try:
+            processed = drain_deletion_jobs(batch_size)
+        except OperationalError:
+            # 数据库暂时繁忙，稍后重试
+            processed = 0
+        if once:
+            return
+        if not processed:
+            time.sleep(poll_interval)
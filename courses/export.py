@@ -0,0 +1,205 @@
+"""选课名单导出（CSV / XLSX）
+
+导出的行数可能上百万，这里从不把整个 queryset 读进内存：values_list 一次连接
+取出学生、档案、课程、班次、教师的字段，.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+分批从游标读取，每批编码后立即交给 StreamingHttpResponse 发出，进程内存与行数
+无关。
+
+学生可以自行填写姓名等字段，CSV 中以 = + - @ 或制表符、回车开头的文本会被
+Excel 当作公式执行，写入 CSV 时在前面加一个单引号。XLSX 的单元格是内联字符串，
+本身就不会被当作公式，原样写出。
+
+XLSX 不依赖 openpyxl：它是一个 zip 包，工作表用内联字符串逐行写出；zipfile
+写入不可 seek 的输出时改用数据描述符，压缩后的字节随写随取，同样边生成边发送。
+"""
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+
+from .models import Enrollment
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (表头, values_list 字段)
+COLUMNS = [
+    ('学号', 'student__studentprofile__student_id'),
+    ('姓名', 'student__studentprofile__name'),
+    ('用户名', 'student__username'),
+    ('课程代码', 'course_class__course__course_code'),
+    ('课程名称', 'course_class__course__course_name'),
+    ('班次', 'course_class__class_code'),
+    ('授课教师', 'course_class__teacher__username'),
+    ('选课状态', 'status'),
+    ('选课时间', 'enroll_time'),
+    ('成绩', 'grade'),
+]
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+STATUS_LABELS = dict(Enrollment.STATUS_CHOICES)
+
+# XML 1.0 不允许的控制字符
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# 电子表格打开 CSV 时会当作公式解析的开头字符
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def escape_formula(value):
+    """以公式字符开头的文本前加单引号，防止打开导出的 CSV 时执行公式"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_rows(queryset):
+    """逐行产生导出的值（已转换为展示用的字符串或数字）"""
+    fields = [field for _, field in COLUMNS]
+    status_index = fields.index('status')
+    time_index = fields.index('enroll_time')
+    rows = queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for row in rows:
+        row = list(row)
+        row[status_index] = STATUS_LABELS.get(row[status_index], row[status_index])
+        if row[time_index] is not None:
+            row[time_index] = timezone.localtime(row[time_index]).strftime('%Y-%m-%d %H:%M')
+        yield row
+
+
+def _batches(rows, size=500):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_csv(rows):
+    # 带 BOM，Excel 才能按 UTF-8 打开中文
+    yield '\ufeff'.encode()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in COLUMNS])
+    for batch in _batches(rows):
+        writer.writerows(['' if value is None else escape_formula(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Pipe:
+    """只追加、不可 seek 的输出，供 zipfile 写入后按块取走"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="选课名单" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) or hasattr(value, 'as_tuple'):
+        # 数字（含成绩的 Decimal）
+        return f'<c><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_rows(rows):
+    return ''.join('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>' for row in rows)
+
+
+def stream_xlsx(rows):
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield pipe.drain()
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_rows([[header for header, _ in COLUMNS]])
+            ).encode())
+            for batch in _batches(rows):
+                sheet.write(_xlsx_rows(batch).encode())
+                data = pipe.drain()
+                if data:
+                    yield data
+            sheet.write(b'</sheetData></worksheet>')
+    yield pipe.drain()
+
+
+def export_response(queryset, filename, export_format='csv'):
+    """以 export_format（csv / xlsx）流式导出 queryset 中的选课记录"""
+    if export_format not in FORMATS:
+        export_format = 'csv'
+    stream = stream_xlsx if export_format == 'xlsx' else stream_csv
+    response = StreamingHttpResponse(stream(export_rows(queryset)), content_type=FORMATS[export_format])
+    response['Content-Disposition'] = content_disposition_header(True, f'{filename}.{export_format}')
+    return response
@@ -1,6 +1,11 @@
 from django import forms
 from django.db import models
 from .models import Course, CourseClass, Enrollment, Announcement
+from .schedule import (
+    ScheduleParseError, check_schedule_conflict, find_schedule_clash, parse_schedule, teacher_timetable,
+)
+from .seats import EnrollmentError, check_eligibility
+from .snapshot import get_enrollment_snapshot
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -30,6 +35,27 @@ class CourseClassForm(forms.ModelForm):
         # 只显示教师用户
         self.fields['teacher'].queryset = User.objects.filter(user_type='teacher')
 
+    def clean_schedule(self):
+        schedule = self.cleaned_data['schedule']
+        # 无法解析的上课时间（如“待定”）照常保存，只是不生成时段、不参与冲突检测
+        self.schedule_error = None
+        try:
+            self.time_slots = parse_schedule(schedule)
+        except ScheduleParseError as e:
+            self.time_slots = []
+            self.schedule_error = str(e)
+        return schedule
+
+    def clean(self):
+        cleaned_data = super().clean()
+        teacher = cleaned_data.get('teacher')
+        # schedule 字段本身无效时没有 time_slots
+        if teacher is not None and getattr(self, 'time_slots', None):
+            clash = find_schedule_clash(teacher_timetable(teacher.pk), self.time_slots, exclude=self.instance.pk)
+            if clash is not None:
+                self.add_error('schedule', f'授课教师在该时间已有班次“{clash}”。')
+        return cleaned_data
+
 
 class EnrollmentForm(forms.ModelForm):
     class Meta:
@@ -63,6 +89,7 @@ class StudentEnrollmentForm(forms.ModelForm):
             self.student = kwargs.pop('student')
         else:
             self.student = None
+        self.snapshot = kwargs.pop('snapshot', None)
 
         # 调用父类初始化，不传递student参数给ModelForm
         super().__init__(*args, **kwargs)
@@ -70,7 +97,39 @@ class StudentEnrollmentForm(forms.ModelForm):
         # 只显示有可用名额的班次
         self.fields['course_class'].queryset = CourseClass.objects.filter(
             current_students__lt=models.F('max_students')
-        )
+        ).select_related('course')
+
+    def clean_course_class(self):
+        course_class = self.cleaned_data['course_class']
+        if self.student is not None:
+            snapshot = self.snapshot or get_enrollment_snapshot(self.student)
+            try:
+                check_eligibility(self.student, course_class, snapshot)
+                check_schedule_conflict(self.student, course_class)
+            except EnrollmentError as e:
+                raise forms.ValidationError(e.message)
+        return course_class
+
+
+class AllocationPreferenceForm(forms.Form):
+    """抽签轮次的志愿表，第 1 志愿最优先"""
+
+    def __init__(self, *args, allocation_round, **kwargs):
+        super().__init__(*args, **kwargs)
+        classes = allocation_round.classes.select_related('course', 'teacher').order_by('course__course_code', 'class_code')
+        for rank in range(1, allocation_round.max_choices + 1):
+            self.fields[f'choice_{rank}'] = forms.ModelChoiceField(
+                queryset=classes, required=rank == 1, label=f'第 {rank} 志愿',
+                widget=forms.Select(attrs={'class': 'form-control'}),
+            )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        chosen = [cleaned_data.get(name) for name in self.fields if cleaned_data.get(name)]
+        if len(set(chosen)) != len(chosen):
+            raise forms.ValidationError('同一班次不能重复填报。')
+        self.ranked_classes = chosen
+        return cleaned_data
 
 
 class GradeForm(forms.ModelForm):
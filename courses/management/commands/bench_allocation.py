@@ -0,0 +1,101 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from courses.allocation import _numpy, allocate_preferences, run_allocation
+from courses.models import AllocationRound, Course, CourseClass, EnrollmentPreference
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = '抽签分配基准测试：默认只计时内存中的分配算法，加 --db 时写入数据库完整执行一轮'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preferences', type=int, default=200000, help='志愿总数')
+        parser.add_argument('--classes', type=int, default=5000, help='班次数')
+        parser.add_argument('--classes-per-course', type=int, default=2, help='每门课程的班次数')
+        parser.add_argument('--choices', type=int, default=5, help='每名学生的志愿数')
+        parser.add_argument('--capacity', type=int, default=30, help='每个班次的名额')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--db', action='store_true', help='写入数据库并执行 run_allocation')
+
+    def handle(self, *args, **options):
+        np = _numpy()
+        rng = np.random.default_rng(options['seed'])
+        class_count, choices = options['classes'], options['choices']
+        student_count = options['preferences'] // choices
+        # 热门程度服从长尾分布，制造热门班次的超额申请
+        popularity = 1 / np.arange(1, class_count + 1) ** 0.8
+        popularity /= popularity.sum()
+        picks = np.stack([
+            rng.choice(class_count, size=choices, replace=False, p=popularity) for _ in range(student_count)
+        ])
+        students = np.repeat(np.arange(student_count), choices)
+        row_classes = picks.ravel()
+        class_courses = np.arange(class_count) // options['classes_per_course']
+        capacity = np.full(class_count, options['capacity'])
+        self.stdout.write(f'{student_count} 名学生，{len(row_classes)} 条志愿，{class_count} 个班次')
+
+        if options['db']:
+            self.run_db(options, picks, class_courses)
+            return
+
+        started = time.perf_counter()
+        won = allocate_preferences(
+            students, row_classes, class_courses[row_classes], capacity, options['seed']
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'分配 {int(won.sum())} 个名额，用时 {elapsed * 1000:.1f} ms')
+
+    def run_db(self, options, picks, class_courses):
+        tag = uuid.uuid4().hex[:8]
+        student_count = picks.shape[0]
+        try:
+            started = time.perf_counter()
+            teacher = User.objects.create_user(username=f'al_{tag}_teacher', user_type='teacher')
+            Course.objects.bulk_create([
+                Course(course_code=f'AL{tag}{i}', course_name=f'抽签压测{i}', semester='压测', academic_year='0000')
+                for i in range(int(class_courses.max()) + 1)
+            ], batch_size=1000)
+            courses = list(Course.objects.filter(course_code__startswith=f'AL{tag}').order_by('pk'))
+            CourseClass.objects.bulk_create([
+                CourseClass(course=courses[course], teacher=teacher, class_code=f'A{i}', classroom='-',
+                            schedule='-', max_students=options['capacity'])
+                for i, course in enumerate(class_courses.tolist())
+            ], batch_size=1000)
+            classes = list(CourseClass.objects.filter(course__in=courses).order_by('pk').values_list('pk', flat=True))
+            User.objects.bulk_create([
+                User(username=f'al_{tag}_s{i}', user_type='student') for i in range(student_count)
+            ], batch_size=1000)
+            students = list(User.objects.filter(username__startswith=f'al_{tag}_s').order_by('pk').values_list('pk', flat=True))
+
+            now = timezone.now()
+            allocation_round = AllocationRound.objects.create(
+                name=f'压测 {tag}', opens_at=now - timedelta(days=1), closes_at=now, max_choices=options['choices']
+            )
+            allocation_round.classes.set(classes)
+            EnrollmentPreference.objects.bulk_create([
+                EnrollmentPreference(
+                    allocation_round=allocation_round, student_id=students[s],
+                    course_class_id=classes[c], rank=rank,
+                )
+                for s, row in enumerate(picks.tolist())
+                for rank, c in enumerate(row, start=1)
+            ], batch_size=2000)
+            self.stdout.write(f'数据准备用时 {time.perf_counter() - started:.1f}s（{connection.vendor}）')
+
+            started = time.perf_counter()
+            result = run_allocation(allocation_round, seed=options['seed'])
+            self.stdout.write(
+                f'run_allocation: 分配 {result.enrolled} 个名额，用时 {time.perf_counter() - started:.2f}s'
+            )
+        finally:
+            AllocationRound.objects.filter(name=f'压测 {tag}').delete()
+            Course.objects.filter(course_code__startswith=f'AL{tag}').delete()
+            User.objects.filter(username__startswith=f'al_{tag}_').delete()
@@ -0,0 +1,160 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from courses.models import Course, CourseClass
+from courses.search import (
+    CLASS_INDEX, COURSE_INDEX, index_classes, index_courses, search_class_ids, search_course_ids, search_limit,
+)
+
+User = get_user_model()
+
+# 由这些词组合出课程名称和描述
+SUBJECTS = [
+    '数据', '计算机', '软件', '网络', '人工智能', '机器学习', '操作系统', '编译原理', '数据库', '算法',
+    '离散数学', '线性代数', '概率论', '统计', '经济学', '管理学', '会计', '金融', '市场营销', '心理学',
+    '社会学', '哲学', '历史', '文学', '英语', '日语', '物理', '化学', '生物', '电子', '通信', '信号',
+    '控制', '机械', '材料', '建筑', '设计', '艺术', '音乐', '体育',
+]
+KINDS = ['导论', '基础', '原理', '实验', '设计', '分析', '方法', '专题', '前沿', '实践']
+LEVELS = ['', '（一）', '（二）', '高级', '应用']
+
+
+class Command(BaseCommand):
+    help = ('课程、班次搜索基准测试：生成若干课程和班次并建立全文检索索引，比较 icontains'
+            '（班次为三表连接）与全文检索取首页结果的延迟')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=100000, help='生成的课程数')
+        parser.add_argument('--classes', type=int, default=50000, help='生成的班次数，为 0 时只测课程搜索')
+        parser.add_argument('--teachers', type=int, default=500, help='班次的授课教师数')
+        parser.add_argument('--queries', type=int, default=50, help='每种查询方式的查询次数')
+        parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+
+    def handle(self, *args, **options):
+        if not (COURSE_INDEX.available() and CLASS_INDEX.available()):
+            raise CommandError('当前数据库没有检索索引表，请先执行 migrate')
+        if options['courses'] <= 0 or options['queries'] <= 0 or options['teachers'] <= 0:
+            raise CommandError('课程数、教师数和查询次数必须为正数')
+        rng = random.Random(options['seed'])
+        tag = uuid.uuid4().hex[:8]
+        prefix = f'SB{tag}'
+        courses = Course.objects.filter(course_code__startswith=prefix)
+        try:
+            started = time.perf_counter()
+            self.seed(rng, prefix, options['courses'])
+            seeded = time.perf_counter()
+            index_courses(courses)
+            self.stdout.write(
+                f'生成 {options["courses"]} 门课程 {seeded - started:.1f}s，'
+                f'建立索引 {time.perf_counter() - seeded:.1f}s'
+            )
+            queries = [rng.choice(SUBJECTS) for _ in range(options['queries'])]
+            queries += [rng.choice(SUBJECTS) + rng.choice(KINDS) for _ in range(options['queries'])]
+            self.write_header('课程')
+            self.report('icontains', self.measure(queries, self.course_icontains_page))
+            self.report('全文检索', self.measure(queries, self.course_search_page))
+
+            if options['classes'] > 0:
+                started = time.perf_counter()
+                self.seed_classes(rng, tag, courses, options['classes'], options['teachers'])
+                seeded = time.perf_counter()
+                index_classes(CourseClass.objects.filter(course__in=courses))
+                self.stdout.write(
+                    f'生成 {options["classes"]} 个班次 {seeded - started:.1f}s，'
+                    f'建立索引 {time.perf_counter() - seeded:.1f}s'
+                )
+                queries = [rng.choice(SUBJECTS) + rng.choice(KINDS) for _ in range(options['queries'])]
+                queries += [f'sb{tag}t{rng.randrange(options["teachers"])}' for _ in range(options['queries'])]
+                self.write_header('班次')
+                self.report('icontains', self.measure(queries, self.class_icontains_page))
+                self.report('全文检索', self.measure(queries, self.class_search_page))
+            self.stdout.write(f'全文检索按相关度最多取前 {search_limit()} 条，命中数以此为上限')
+        finally:
+            with transaction.atomic():
+                # 班次随课程级联删除，信号同步删除索引
+                courses.delete()
+                User.objects.filter(username__startswith=f'sb{tag}t').delete()
+
+    def seed(self, rng, prefix, count):
+        batch = []
+        for i in range(count):
+            subject, kind = rng.choice(SUBJECTS), rng.choice(KINDS)
+            batch.append(Course(
+                course_code=f'{prefix}{i}', course_name=f'{subject}{kind}{rng.choice(LEVELS)}',
+                description=f'本课程介绍{subject}的{kind}，并结合{rng.choice(SUBJECTS)}讲授{rng.choice(KINDS)}。',
+                semester='压测', academic_year='0000',
+            ))
+            if len(batch) >= 5000:
+                Course.objects.bulk_create(batch)
+                batch = []
+        Course.objects.bulk_create(batch)
+
+    def seed_classes(self, rng, tag, courses, count, teachers):
+        User.objects.bulk_create([
+            User(username=f'sb{tag}t{i}', user_type='teacher') for i in range(teachers)
+        ])
+        teacher_ids = list(User.objects.filter(username__startswith=f'sb{tag}t').values_list('pk', flat=True))
+        course_ids = list(courses.values_list('pk', flat=True))
+        batch = []
+        for i in range(count):
+            batch.append(CourseClass(
+                course_id=rng.choice(course_ids), teacher_id=rng.choice(teacher_ids), class_code=f'K{i:05d}',
+                classroom=f'{rng.choice("ABCDE")}{rng.randrange(100, 600)}', schedule='-', max_students=50,
+            ))
+            if len(batch) >= 5000:
+                CourseClass.objects.bulk_create(batch)
+                batch = []
+        CourseClass.objects.bulk_create(batch)
+
+    def first_page(self, queryset):
+        return list(queryset.order_by('-created_at', '-id')[:10]), queryset.count()
+
+    def ranked_page(self, queryset, ids):
+        rows = queryset.in_bulk(ids[:10])
+        return [rows[pk] for pk in ids[:10] if pk in rows], len(ids)
+
+    def course_icontains_page(self, text):
+        return self.first_page(Course.objects.filter(
+            models.Q(course_name__icontains=text) | models.Q(course_code__icontains=text)
+            | models.Q(description__icontains=text)
+        ))
+
+    def course_search_page(self, text):
+        return self.ranked_page(Course.objects.all(), search_course_ids(text))
+
+    def class_icontains_page(self, text):
+        # 与班次列表原先的查询相同
+        return self.first_page(CourseClass.objects.select_related('course', 'teacher').filter(
+            models.Q(class_code__icontains=text) | models.Q(course__course_name__icontains=text)
+            | models.Q(teacher__username__icontains=text)
+        ))
+
+    def class_search_page(self, text):
+        return self.ranked_page(CourseClass.objects.select_related('course', 'teacher'), search_class_ids(text))
+
+    def measure(self, queries, run):
+        times, hits = [], []
+        for text in queries:
+            started = time.perf_counter()
+            _, total = run(text)
+            times.append(time.perf_counter() - started)
+            hits.append(total)
+        return times, hits
+
+    def write_header(self, label):
+        self.stdout.write(f'{label + "搜索":<12}{"p50(ms)":>10}{"p95(ms)":>10}{"均值(ms)":>10}{"平均命中":>10}')
+
+    def report(self, label, result):
+        times, hits = result
+        times = sorted(times)
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        self.stdout.write(
+            f'{label:<12}{statistics.median(times) * 1000:>10.1f}{p95 * 1000:>10.1f}'
+            f'{statistics.mean(times) * 1000:>10.1f}{statistics.mean(hits):>10.0f}'
+        )
@@ -0,0 +1,123 @@
+import asyncio
+import statistics
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+
+from courses.dashboard import bump_dashboard_versions
+from courses.models import Course, CourseClass, Enrollment
+from courses.views import dashboard_async_view, dashboard_view
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('仪表板延迟基准测试：给每条 SQL 加上模拟的数据库往返延迟，分别以同步视图和异步视图'
+            '请求管理员、教师、学生仪表板（每次均绕过片段缓存），比较墙钟延迟')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency-ms', type=float, default=5, help='每条 SQL 的模拟延迟（毫秒）')
+        parser.add_argument('--connect-ms', type=float, default=20,
+                            help='每次新建数据库连接的模拟延迟（毫秒），对应 PostgreSQL 的连接与后端启动开销')
+        parser.add_argument('--requests', type=int, default=20, help='每种角色、每个视图的请求数')
+        parser.add_argument('--classes', type=int, default=20, help='教师的班次数')
+        parser.add_argument('--students', type=int, default=200, help='学生数，每名学生选一个班次')
+
+    def handle(self, *args, **options):
+        if options['requests'] <= 0:
+            raise CommandError('请求数必须为正数')
+        self.latency = options['latency_ms'] / 1000
+        self.connect_latency = options['connect_ms'] / 1000
+        self.connects = 0
+        tag = uuid.uuid4().hex[:8]
+        try:
+            users = self.seed(tag, options)
+            connection_created.connect(self.install_delay)
+            connection.execute_wrappers.append(self.delay)
+            self.stdout.write(
+                f'{"角色":<10}{"同步 p50(ms)":>14}{"异步 p50(ms)":>14}{"同步均值":>10}{"异步均值":>10}{"加速":>8}'
+                f'{"异步新建连接/请求":>18}'
+            )
+            for role, user in users.items():
+                sync_times = self.measure_sync(user, options['requests'])
+                self.connects = 0
+                async_times = asyncio.run(self.measure_async(user, options['requests']))
+                self.stdout.write(
+                    f'{role:<10}{statistics.median(sync_times) * 1000:>14.1f}'
+                    f'{statistics.median(async_times) * 1000:>14.1f}'
+                    f'{statistics.mean(sync_times) * 1000:>10.1f}{statistics.mean(async_times) * 1000:>10.1f}'
+                    f'{statistics.mean(sync_times) / statistics.mean(async_times):>7.2f}x'
+                    f'{self.connects / options["requests"]:>18.2f}'
+                )
+        finally:
+            connection_created.disconnect(self.install_delay)
+            if self.delay in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self.delay)
+            Course.objects.filter(course_code__startswith=f'DB{tag}').delete()
+            User.objects.filter(username__startswith=f'db_{tag}_').delete()
+
+    def delay(self, execute, sql, params, many, context):
+        time.sleep(self.latency)
+        return execute(sql, params, many, context)
+
+    def install_delay(self, sender=None, connection=None, **kwargs):
+        # 每个线程的连接各装一次；线程池中的连接重连时会再次触发，并计入新建连接的开销
+        self.connects += 1
+        time.sleep(self.connect_latency)
+        if self.delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.delay)
+
+    def seed(self, tag, options):
+        admin = User.objects.create_user(username=f'db_{tag}_admin', user_type='admin')
+        teacher = User.objects.create_user(username=f'db_{tag}_teacher', user_type='teacher')
+        Course.objects.bulk_create([
+            Course(course_code=f'DB{tag}{i}', course_name=f'仪表板压测{i}', semester='压测', academic_year='0000')
+            for i in range(options['classes'])
+        ])
+        courses = Course.objects.filter(course_code__startswith=f'DB{tag}').order_by('pk')
+        CourseClass.objects.bulk_create([
+            CourseClass(course=course, teacher=teacher, class_code='D01', classroom='-', schedule='-',
+                        max_students=options['students'])
+            for course in courses
+        ])
+        classes = list(CourseClass.objects.filter(course__in=courses).order_by('pk'))
+        User.objects.bulk_create([
+            User(username=f'db_{tag}_s{i}', user_type='student') for i in range(options['students'])
+        ])
+        students = list(User.objects.filter(username__startswith=f'db_{tag}_s').order_by('pk'))
+        Enrollment.objects.bulk_create([
+            Enrollment(student=student, course_class=classes[i % len(classes)], status='approved')
+            for i, student in enumerate(students)
+        ])
+        return {'admin': admin, 'teacher': teacher, 'student': students[0]}
+
+    def make_request(self, user):
+        bump_dashboard_versions([f'teacher:{user.pk}', f'student:{user.pk}', 'available'])
+        request = RequestFactory().get('/courses/dashboard/')
+        request.user = user
+        return request
+
+    def measure_sync(self, user, count):
+        times = []
+        for _ in range(count):
+            request = self.make_request(user)
+            started = time.perf_counter()
+            dashboard_view(request)
+            times.append(time.perf_counter() - started)
+        return times
+
+    async def measure_async(self, user, count):
+        times = []
+        for _ in range(count):
+            # 使片段缓存失效要读写缓存（数据库缓存时即数据库），须在同步线程中执行
+            request = await sync_to_async(self.make_request)(user)
+            started = time.perf_counter()
+            await dashboard_async_view(request)
+            times.append(time.perf_counter() - started)
+        return times
@@ -0,0 +1,132 @@
+import gc
+import os
+import resource
+import time
+import tracemalloc
+import uuid
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from courses.export import FORMATS, export_response
+from courses.models import Course, CourseClass, Enrollment
+from courses.signals import enrollments_bulk_changed
+from users.models import StudentProfile
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+
+
+def current_rss():
+    """进程当前的常驻内存（字节），/proc 不可用时退回历史峰值"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Command(BaseCommand):
+    help = ('名单导出基准测试：生成 学生数 × 班次数 条选课记录，以 CSV、XLSX 流式导出整门课程，'
+            '报告耗时、输出大小和导出期间进程内存的增长')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=20000, help='生成的学生数')
+        parser.add_argument('--classes', type=int, default=50, help='生成的班次数，每个学生选全部班次')
+        parser.add_argument('--tracemalloc', action='store_true',
+                            help='另外用 tracemalloc 统计 Python 对象的分配峰值（导出会明显变慢）')
+
+    def handle(self, *args, **options):
+        if options['students'] <= 0 or options['classes'] <= 0:
+            raise CommandError('学生数和班次数必须为正数')
+        tag = uuid.uuid4().hex[:8]
+        course = None
+        try:
+            started = time.perf_counter()
+            course = self.seed(tag, options['students'], options['classes'])
+            rows = options['students'] * options['classes']
+            self.stdout.write(f'生成 {rows} 条选课记录 {time.perf_counter() - started:.1f}s')
+
+            queryset = Enrollment.objects.filter(course_class__course=course).order_by(
+                'course_class__class_code', 'enroll_time', 'id'
+            )
+            self.stdout.write(f'{"格式":<8}{"耗时(s)":>10}{"行/秒":>12}{"大小(MB)":>10}{"RSS 增长(MB)":>14}')
+            for export_format in FORMATS:
+                self.report(export_format, rows, *self.measure(queryset, export_format))
+            if options['tracemalloc']:
+                for export_format in FORMATS:
+                    tracemalloc.start()
+                    self.consume(queryset, export_format)
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    self.stdout.write(f'{export_format}: tracemalloc 峰值 {peak / 2 ** 20:.1f} MB')
+        finally:
+            self.cleanup(tag, course)
+
+    def seed(self, tag, students, classes):
+        User.objects.bulk_create(
+            [User(username=f'be{tag}s{i}', user_type='student') for i in range(students)], batch_size=BATCH_SIZE,
+        )
+        student_ids = list(
+            User.objects.filter(username__startswith=f'be{tag}s').order_by('pk').values_list('pk', flat=True)
+        )
+        StudentProfile.objects.bulk_create([
+            StudentProfile(
+                user_id=pk, student_id=f'{tag}{i:07d}', name=f'学生{i}', gender='M', grade='2024',
+                major='压测', class_name='压测', enrollment_date=date(2024, 9, 1),
+            )
+            for i, pk in enumerate(student_ids)
+        ], batch_size=BATCH_SIZE)
+        teacher = User.objects.create_user(username=f'be{tag}t', user_type='teacher')
+        course = Course.objects.create(
+            course_code=f'BE{tag}', course_name='导出压测', semester='压测', academic_year='0000',
+        )
+        CourseClass.objects.bulk_create([
+            CourseClass(
+                course=course, teacher=teacher, class_code=f'E{i:03d}', classroom='-', schedule='-',
+                max_students=students,
+            )
+            for i in range(classes)
+        ])
+        for class_id in CourseClass.objects.filter(course=course).values_list('pk', flat=True):
+            for start in range(0, students, BATCH_SIZE):
+                Enrollment.objects.bulk_create([
+                    Enrollment(student_id=pk, course_class_id=class_id, status='approved')
+                    for pk in student_ids[start:start + BATCH_SIZE]
+                ])
+        return course
+
+    def consume(self, queryset, export_format):
+        size = 0
+        for chunk in export_response(queryset, 'bench', export_format).streaming_content:
+            size += len(chunk)
+        return size
+
+    def measure(self, queryset, export_format):
+        gc.collect()
+        baseline = peak = current_rss()
+        size = 0
+        started = time.perf_counter()
+        for chunk in export_response(queryset, 'bench', export_format).streaming_content:
+            size += len(chunk)
+            peak = max(peak, current_rss())
+        return time.perf_counter() - started, size, peak - baseline
+
+    def report(self, export_format, rows, elapsed, size, growth):
+        self.stdout.write(
+            f'{export_format:<8}{elapsed:>10.1f}{rows / elapsed:>12.0f}{size / 2 ** 20:>10.1f}{growth / 2 ** 20:>14.1f}'
+        )
+
+    def cleanup(self, tag, course):
+        with transaction.atomic():
+            if course is not None:
+                # 逐条删除会为上百万条记录各发一次信号，这里直接删除后统一通知
+                class_ids = list(CourseClass.objects.filter(course=course).values_list('pk', flat=True))
+                enrollments = Enrollment.objects.filter(course_class_id__in=class_ids)
+                enrollments._raw_delete(enrollments.db)
+                enrollments_bulk_changed.send(sender=Enrollment, class_ids=class_ids)
+                course.delete()
+            User.objects.filter(username__startswith=f'be{tag}').delete()
@@ -0,0 +1,73 @@
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from courses.models import Course, CourseClass
+from courses.seats import claim_seat, set_counter_shards
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = '对比单行计数与分片计数在不同并发写入数下的吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', nargs='+', type=int, default=[1, 8, 64],
+                            help='并发写入线程数，可指定多个')
+        parser.add_argument('--shards', type=int, default=16, help='分片模式下的分片数')
+        parser.add_argument('--duration', type=float, default=3.0, help='每轮压测的时长（秒）')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        teacher = User.objects.create_user(username=f'bench_{tag}', user_type='teacher')
+        course = Course.objects.create(
+            course_code=f'BENCH{tag}', course_name='计数压测', semester='压测', academic_year='0000'
+        )
+        course_class = CourseClass.objects.create(
+            course=course, teacher=teacher, class_code='B01', classroom='-', schedule='-',
+            max_students=10 ** 9,
+        )
+
+        try:
+            self.stdout.write(f'{"模式":<8}{"线程数":>8}{"操作数":>10}{"冲突重试":>10}{"吞吐(ops/s)":>14}')
+            for mode, shards in (('single', 0), ('sharded', options['shards'])):
+                course_class = set_counter_shards(course_class, shards)
+                for writers in options['writers']:
+                    ops, retries, elapsed = self.run_round(course_class, writers, options['duration'])
+                    self.stdout.write(
+                        f'{mode:<8}{writers:>8}{ops:>10}{retries:>10}{ops / elapsed:>14.1f}'
+                    )
+        finally:
+            course.delete()
+            teacher.delete()
+
+    def run_round(self, course_class, writers, duration):
+        counts = [0] * writers
+        retries = [0] * writers
+        barrier = threading.Barrier(writers + 1)
+
+        def writer(index):
+            try:
+                barrier.wait()
+                deadline = time.perf_counter() + duration
+                while time.perf_counter() < deadline:
+                    try:
+                        claim_seat(course_class)
+                        counts[index] += 1
+                    except OperationalError:
+                        retries[index] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return sum(counts), sum(retries), time.perf_counter() - started
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.checks import process_local_cache
+from courses.recommend import RECOMMEND_NEIGHBORS, build_recommendations
+
+
+class Command(BaseCommand):
+    help = '离线构建学生仪表板的课程推荐（专业热度与共选矩阵），写入缓存；需要 numpy 和 scipy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbors', type=int, default=RECOMMEND_NEIGHBORS, help='每门课程保留的相近课程数')
+
+    def handle(self, *args, **options):
+        if options['neighbors'] <= 0:
+            raise CommandError('相近课程数必须为正数')
+        if process_local_cache():
+            # 结果写入本命令进程的内存，命令退出即丢失，web 进程读不到
+            raise CommandError(
+                '默认缓存只在本进程内有效，构建结果无法被 web 进程读取；请先配置共享缓存（见 settings.CACHES）'
+            )
+        started = time.perf_counter()
+        recommendations = build_recommendations(neighbors=options['neighbors'])
+        elapsed = time.perf_counter() - started
+        classes = sum(len(class_ids) for class_ids, _ in recommendations.semesters.values())
+        self.stdout.write(
+            f'{len(recommendations.course_ids)} 门课程、{len(recommendations.majors)} 个专业、'
+            f'{len(recommendations.semesters)} 个学期共 {classes} 个有名额的班次，'
+            f'共选矩阵 {recommendations.neighbors.nnz} 个非零元素，用时 {elapsed:.2f}s'
+        )
+        if recommendations.current is None:
+            self.stdout.write(self.style.WARNING('没有找到当前学期，推荐结果将为空'))
+        else:
+            self.stdout.write(self.style.SUCCESS('当前学期：{} {}'.format(*recommendations.current)))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from courses.checks import process_local_cache
+from courses.dashboard import dashboard_cache_stats, reset_dashboard_cache_stats
+
+
+class Command(BaseCommand):
+    help = '查看仪表板各缓存片段的命中与未命中次数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='输出后清零计数')
+
+    def handle(self, *args, **options):
+        if process_local_cache():
+            self.stderr.write(self.style.WARNING('默认缓存只在本进程内有效，这里看不到 web 进程的计数'))
+        self.stdout.write(f'{"片段":<12}{"命中":>10}{"未命中":>10}{"命中率":>10}')
+        for fragment, counts in dashboard_cache_stats().items():
+            total = counts['hits'] + counts['misses']
+            rate = f'{counts["hits"] / total:.1%}' if total else '-'
+            self.stdout.write(f'{fragment:<12}{counts["hits"]:>10}{counts["misses"]:>10}{rate:>10}')
+        if options['reset']:
+            reset_dashboard_cache_stats()
+            self.stdout.write(self.style.SUCCESS('计数已清零'))
@@ -0,0 +1,237 @@
+import math
+import queue
+import random
+import threading
+import time
+import uuid
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from courses.models import Course, CourseClass, Enrollment
+from courses.reconcile import reconcile_class_counters
+
+User = get_user_model()
+
+ENDPOINTS = ('enroll', 'approve', 'cancel', 'drop')
+
+
+def percentile(values, p):
+    """最近秩法求百分位数，values 需已排序"""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('选课日压测：创建 N 名学生和 M 个班次，多线程经 Django 测试客户端并发执行'
+            '选课、审核、取消和退课，按接口报告延迟分位数、吞吐量、错误率与业务拒绝率，并核对选课人数')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=500, help='学生数')
+        parser.add_argument('--classes', type=int, default=10, help='班次数（每个班次一门课程、一名教师）')
+        parser.add_argument('--capacity', type=int, default=30, help='每个班次的名额')
+        parser.add_argument('--per-student', type=int, default=2, help='每名学生尝试选择的班次数')
+        parser.add_argument('--clients', type=int, default=16, help='并发线程数')
+        parser.add_argument('--cancel-rate', type=float, default=0.1, help='学生取消待审核申请的比例')
+        parser.add_argument('--reject-rate', type=float, default=0.1, help='教师拒绝申请的比例')
+        parser.add_argument('--drop-rate', type=float, default=0.1, help='审核通过后学生退课的比例')
+        parser.add_argument('--seed', type=int, default=None, help='随机数种子')
+        parser.add_argument('--keep-data', action='store_true', help='结束后保留压测数据')
+
+    def handle(self, *args, **options):
+        if options['per_student'] > options['classes']:
+            raise CommandError('每名学生选择的班次数不能超过班次数')
+        if options['clients'] <= 0:
+            raise CommandError('并发线程数必须为正数')
+        self.random = random.Random(options['seed'])
+        self.options = options
+        self.sessions = {}
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+                mode = cursor.fetchone()[0]
+            self.stdout.write(f'数据库: sqlite（journal_mode = {mode}）')
+        else:
+            self.stdout.write(f'数据库: {connection.vendor}')
+
+        tag = uuid.uuid4().hex[:8]
+        self.session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            try:
+                classes, students = self.seed(tag)
+                self.stdout.write(f'已创建 {len(students)} 名学生、{len(classes)} 个班次，开始压测')
+                stats, elapsed = self.run(classes, students)
+                self.report(stats, elapsed)
+                self.check_consistency(classes)
+            finally:
+                if not options['keep_data']:
+                    self.cleanup(tag)
+
+    def seed(self, tag):
+        options = self.options
+        User.objects.bulk_create(
+            [User(username=f'lt_{tag}_t{i}', user_type='teacher') for i in range(options['classes'])]
+            + [User(username=f'lt_{tag}_s{i}', user_type='student') for i in range(options['students'])]
+        )
+        teachers = list(User.objects.filter(username__startswith=f'lt_{tag}_t').order_by('pk'))
+        students = list(User.objects.filter(username__startswith=f'lt_{tag}_s').order_by('pk'))
+
+        Course.objects.bulk_create([
+            Course(course_code=f'LT{tag}{i}', course_name=f'压测课程{i}', semester='压测', academic_year='0000')
+            for i in range(options['classes'])
+        ])
+        courses = Course.objects.filter(course_code__startswith=f'LT{tag}').order_by('pk')
+        CourseClass.objects.bulk_create([
+            CourseClass(course=course, teacher=teacher, class_code='L01', classroom='-', schedule='-',
+                        max_students=options['capacity'])
+            for course, teacher in zip(courses, teachers)
+        ])
+        classes = list(CourseClass.objects.filter(course__in=courses).select_related('teacher').order_by('pk'))
+
+        # 预先为每个用户建立会话，压测线程只需带上 session cookie
+        for user in teachers + students:
+            client = Client()
+            client.force_login(user)
+            self.sessions[user.pk] = client.cookies[settings.SESSION_COOKIE_NAME].value
+        return classes, students
+
+    def client_for(self, user_id):
+        client = Client()
+        client.cookies[settings.SESSION_COOKIE_NAME] = self.sessions[user_id]
+        return client
+
+    def run(self, classes, students):
+        options = self.options
+        enrolls = [
+            ('enroll', student.pk, course_class)
+            for student in students
+            for course_class in self.random.sample(classes, options['per_student'])
+        ]
+        # 打乱提交顺序，模拟学生同时涌入
+        self.random.shuffle(enrolls)
+        tasks = queue.Queue()
+        for task in enrolls:
+            tasks.put(task)
+
+        lock = threading.Lock()
+        stats = {name: {'latencies': [], 'errors': 0, 'rejected': 0} for name in ENDPOINTS}
+
+        def request(name, user_id, url, data):
+            """发出请求并记录结果，返回 'ok'、'rejected'（业务拒绝）或 'error'（请求出错）"""
+            started = time.perf_counter()
+            try:
+                outcome = self.outcome(self.client_for(user_id).post(url, data))
+            except Exception:
+                outcome = 'error'
+            latency = time.perf_counter() - started
+            with lock:
+                stats[name]['latencies'].append(latency)
+                stats[name]['errors'] += outcome == 'error'
+                stats[name]['rejected'] += outcome == 'rejected'
+            return outcome == 'ok'
+
+        def handle_task(task):
+            name, student_id, course_class = task[:3]
+            if name == 'enroll':
+                if not request(name, student_id, reverse('courses:enroll_course', args=[course_class.pk]),
+                               {'course_class': course_class.pk}):
+                    return
+                enrollment_id = Enrollment.objects.filter(
+                    student_id=student_id, course_class=course_class, status='pending'
+                ).values_list('pk', flat=True).first()
+                if enrollment_id is None:
+                    return
+                follow_up = 'cancel' if self.random.random() < options['cancel_rate'] else 'approve'
+                tasks.put((follow_up, student_id, course_class, enrollment_id))
+            elif name == 'cancel':
+                request(name, student_id, reverse('courses:enrollment_cancel', args=[task[3]]), {})
+            elif name == 'approve':
+                action = 'reject' if self.random.random() < options['reject_rate'] else 'approve'
+                if request(name, course_class.teacher_id,
+                           reverse('courses:approve_enrollment', args=[task[3]]), {'action': action}) \
+                        and action == 'approve' and self.random.random() < options['drop_rate']:
+                    tasks.put(('drop', student_id, course_class))
+            elif name == 'drop':
+                request(name, student_id, reverse('courses:class_unenroll', args=[course_class.pk]), {})
+
+        def worker():
+            try:
+                while True:
+                    task = tasks.get()
+                    if task is None:
+                        return
+                    try:
+                        handle_task(task)
+                    except Exception as e:
+                        # 请求之外的查询出错时只丢弃该流程，线程继续处理后续任务
+                        self.stderr.write(f'{task[0]} 流程出错: {e!r}')
+                    finally:
+                        tasks.task_done()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['clients'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        # 后续请求在 task_done 之前入队，join 返回时全部流程均已结束
+        tasks.join()
+        elapsed = time.perf_counter() - started
+        for _ in threads:
+            tasks.put(None)
+        for thread in threads:
+            thread.join()
+        return stats, elapsed
+
+    @staticmethod
+    def outcome(response):
+        """视图对已满、冲突、重复等业务拒绝也返回 302，须看本次请求写入的提示消息"""
+        if response.status_code >= 400:
+            return 'error'
+        levels = {message.level for message in messages.get_messages(response.wsgi_request)}
+        return 'rejected' if levels & {messages.ERROR, messages.WARNING} else 'ok'
+
+    def report(self, stats, elapsed):
+        self.stdout.write(
+            f'{"接口":<10}{"请求数":>8}{"错误率":>9}{"拒绝率":>9}{"吞吐(req/s)":>14}'
+            f'{"p50(ms)":>10}{"p95(ms)":>10}{"p99(ms)":>10}'
+        )
+        for name in ENDPOINTS:
+            latencies = sorted(stats[name]['latencies'])
+            if not latencies:
+                continue
+            total = len(latencies)
+            self.stdout.write(
+                f'{name:<10}{total:>8}{stats[name]["errors"] / total:>9.1%}{stats[name]["rejected"] / total:>9.1%}'
+                f'{total / elapsed:>14.1f}'
+                f'{percentile(latencies, 50) * 1000:>10.2f}'
+                f'{percentile(latencies, 95) * 1000:>10.2f}'
+                f'{percentile(latencies, 99) * 1000:>10.2f}'
+            )
+        self.stdout.write(f'总耗时 {elapsed:.2f}s')
+
+    def check_consistency(self, classes):
+        class_ids = [course_class.pk for course_class in classes]
+        drifts = []
+        result = reconcile_class_counters(course_class_ids=class_ids, on_drift=drifts.append)
+        oversold = CourseClass.objects.filter(
+            pk__in=class_ids, current_students__gt=self.options['capacity']
+        ).count()
+        for drift in drifts:
+            self.stdout.write(f'班次 {drift.pk}: 记录 {drift.recorded}，实际 {drift.actual}')
+        style = self.style.SUCCESS if not drifts and not oversold else self.style.ERROR
+        self.stdout.write(style(
+            f'计数核对：{result.classes_checked} 个班次，{result.classes_drifted} 个存在偏差，{oversold} 个超卖'
+        ))
+
+    def cleanup(self, tag):
+        for session_key in self.sessions.values():
+            self.session_store(session_key=session_key).delete()
+        Course.objects.filter(course_code__startswith=f'LT{tag}').delete()
+        User.objects.filter(username__startswith=f'lt_{tag}_').delete()
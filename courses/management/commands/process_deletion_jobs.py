@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.deletion import DELETION_BATCH_SIZE, run_worker
+
+
+class Command(BaseCommand):
+    help = '启动后台删除任务的 worker，按提交顺序分批删除课程、用户及其关联数据'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='没有任务时的轮询间隔（秒）')
+        parser.add_argument('--batch-size', type=int, default=DELETION_BATCH_SIZE, help='每个事务删除的行数')
+        parser.add_argument('--once', action='store_true', help='执行完当前排队的任务后退出')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('每批删除的行数必须大于 0')
+        run_worker(poll_interval=options['poll_interval'], batch_size=options['batch_size'], once=options['once'])
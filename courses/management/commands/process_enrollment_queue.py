@@ -0,0 +1,55 @@
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.queueing import run_worker
+
+
+class Command(BaseCommand):
+    help = '启动排队选课的 worker 进程，按班次先进先出处理选课票据'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='worker 进程数')
+        parser.add_argument('--partition', type=int, default=None,
+                            help='只运行指定分区的 worker（由主进程传入）')
+        parser.add_argument('--poll-interval', type=float, default=0.5, help='队列为空时的轮询间隔（秒）')
+        parser.add_argument('--batch-size', type=int, default=100, help='每次从队列取出的票据数')
+        parser.add_argument('--once', action='store_true', help='处理完当前队列后退出')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('worker 数必须大于 0')
+
+        partition = options['partition']
+        if partition is not None or workers == 1:
+            run_worker(
+                partition=partition or 0,
+                partitions=workers,
+                poll_interval=options['poll_interval'],
+                batch_size=options['batch_size'],
+                once=options['once'],
+            )
+            return
+
+        # 每个分区一个子进程，同一班次始终由同一个进程处理
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'process_enrollment_queue',
+            '--workers', str(workers),
+            '--poll-interval', str(options['poll_interval']),
+            '--batch-size', str(options['batch_size']),
+        ]
+        if options['once']:
+            command.append('--once')
+        processes = [
+            subprocess.Popen(command + ['--partition', str(i)]) for i in range(workers)
+        ]
+        self.stdout.write(f'已启动 {workers} 个 worker 进程')
+        try:
+            for process in processes:
+                process.wait()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
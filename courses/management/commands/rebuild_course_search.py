@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import Course, CourseClass
+from courses.search import CLASS_INDEX, COURSE_INDEX, index_classes, index_courses
+
+
+class Command(BaseCommand):
+    help = '清空并重建课程、班次的全文检索索引（批量导入等不触发信号的写入之后执行）'
+
+    def handle(self, *args, **options):
+        if not (COURSE_INDEX.available() and CLASS_INDEX.available()):
+            raise CommandError('当前数据库没有检索索引表（仅支持带 FTS5 的 SQLite 和 PostgreSQL），请先执行 migrate')
+        COURSE_INDEX.clear()
+        courses = index_courses(Course.objects.all())
+        CLASS_INDEX.clear()
+        classes = index_classes(CourseClass.objects.all())
+        self.stdout.write(self.style.SUCCESS(f'已索引 {courses} 门课程、{classes} 个班次'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from courses.dashboard import STAT_FIELDS, STATS_PK, rebuild_dashboard_stats
+from courses.models import DashboardStats
+
+
+class Command(BaseCommand):
+    help = '按业务表重新统计管理员仪表板数据并写入 DashboardStats，报告与原记录的偏差'
+
+    def handle(self, *args, **options):
+        previous = DashboardStats.objects.filter(pk=STATS_PK).values(*STAT_FIELDS).first()
+        stats = rebuild_dashboard_stats()
+        for field in STAT_FIELDS:
+            label = DashboardStats._meta.get_field(field).verbose_name
+            line = f'{label}: {stats[field]}'
+            if previous is not None and previous[field] != stats[field]:
+                line += f'（原记录 {previous[field]}，偏差 {previous[field] - stats[field]:+d}）'
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS('仪表板统计已重建'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import CourseClass
+from courses.reconcile import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = '按选课记录核对班次和课程的选课人数，报告偏差，加 --fix 时批量修正'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='把偏差写回数据库')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每块处理的班次/课程数')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError('块大小必须为正数')
+
+        def report(drift):
+            label = '班次' if drift.model is CourseClass else '课程'
+            self.stdout.write(
+                f'{label} {drift.pk}: 记录 {drift.recorded}，实际 {drift.actual}，'
+                f'偏差 {drift.recorded - drift.actual:+d}'
+            )
+
+        result = reconcile_counters(fix=options['fix'], chunk_size=options['chunk_size'], on_drift=report)
+        self.stdout.write(
+            f'共检查 {result.classes_checked} 个班次、{result.courses_checked} 门课程，'
+            f'{result.classes_drifted} 个班次、{result.courses_drifted} 门课程存在偏差'
+        )
+        if options['fix'] and result.drifted:
+            self.stdout.write(self.style.SUCCESS('已修正全部偏差'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from courses.allocation import run_allocation
+from courses.models import AllocationRound
+from courses.seats import EnrollmentError
+
+
+class Command(BaseCommand):
+    help = '对截止的抽签选课轮次执行分配，批量写入选课记录和班次人数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('round_ids', nargs='*', type=int,
+                            help='要分配的轮次；不指定时分配所有已截止但未分配的轮次')
+        parser.add_argument('--seed', type=int, default=None, help='随机种子（用于复现分配结果）')
+        parser.add_argument('--force', action='store_true', help='允许在截止时间之前分配')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        rounds = AllocationRound.objects.filter(status='open')
+        if options['round_ids']:
+            rounds = rounds.filter(pk__in=options['round_ids'])
+        elif not options['force']:
+            rounds = rounds.filter(closes_at__lte=now)
+
+        for allocation_round in rounds:
+            if allocation_round.closes_at > now and not options['force']:
+                raise CommandError(f'{allocation_round} 尚未截止，如需提前分配请加 --force')
+            try:
+                result = run_allocation(allocation_round, seed=options['seed'])
+            except EnrollmentError as e:
+                raise CommandError(f'{allocation_round}: {e.message}')
+            self.stdout.write(self.style.SUCCESS(
+                f'{allocation_round}: {result.students} 名学生的 {result.preferences} 条志愿，'
+                f'分配 {result.enrolled} 个名额（seed={result.seed}）'
+            ))
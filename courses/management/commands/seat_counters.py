@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import CourseClass
+from courses.seats import fold_seat_counters, set_counter_shards
+
+
+class Command(BaseCommand):
+    help = '管理班次的分片选课计数：开启/关闭分片，或把分片合计写回 current_students'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        fold = subparsers.add_parser('fold', help='把分片合计写回 current_students')
+        fold.add_argument('--interval', type=float, default=0,
+                          help='大于 0 时按该间隔（秒）循环执行')
+
+        enable = subparsers.add_parser('enable', help='为指定班次开启分片计数')
+        enable.add_argument('class_ids', nargs='+', type=int)
+        enable.add_argument('--shards', type=int, default=8)
+
+        disable = subparsers.add_parser('disable', help='关闭指定班次的分片计数')
+        disable.add_argument('class_ids', nargs='+', type=int)
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'fold':
+            self.fold(options['interval'])
+        else:
+            shards = options['shards'] if action == 'enable' else 0
+            if shards < 0:
+                raise CommandError('分片数不能为负数')
+            for course_class in CourseClass.objects.filter(pk__in=options['class_ids']):
+                set_counter_shards(course_class, shards)
+                self.stdout.write(f'{course_class}: 分片数 = {shards}')
+
+    def fold(self, interval):
+        while True:
+            updated = fold_seat_counters()
+            self.stdout.write(f'已回写 {updated} 个班次的选课人数')
+            if interval <= 0:
+                break
+            time.sleep(interval)
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0003_alter_announcement_course_class'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseclass',
+            name='counter_shards',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='计数分片数'),
+        ),
+        migrations.CreateModel(
+            name='SeatCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='分片编号')),
+                ('count', models.IntegerField(default=0, verbose_name='计数')),
+                ('course_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_shards', to='courses.courseclass', verbose_name='课程班次')),
+            ],
+            options={
+                'verbose_name': '选课计数分片',
+                'verbose_name_plural': '选课计数分片',
+                'unique_together': {('course_class', 'shard')},
+            },
+        ),
+    ]
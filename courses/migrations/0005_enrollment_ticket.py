@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0004_seat_counter_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollmentTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('remarks', models.TextField(blank=True, null=True, verbose_name='备注')),
+                ('status', models.CharField(choices=[('queued', '排队中'), ('admitted', '已受理'), ('rejected', '未受理')], default='queued', max_length=10, verbose_name='状态')),
+                ('message', models.CharField(blank=True, max_length=200, verbose_name='处理结果')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='提交时间')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='处理时间')),
+                ('course_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='courses.courseclass', verbose_name='课程班次')),
+                ('enrollment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.enrollment', verbose_name='选课记录')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollment_tickets', to=settings.AUTH_USER_MODEL, verbose_name='学生')),
+            ],
+            options={
+                'verbose_name': '选课排队票据',
+                'verbose_name_plural': '选课排队票据',
+                'indexes': [models.Index(fields=['status', 'course_class', 'id'], name='ticket_queue_idx')],
+            },
+        ),
+    ]
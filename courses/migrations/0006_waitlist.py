@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0005_enrollment_ticket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('waiting', '候补中'), ('promoted', '已递补'), ('cancelled', '已取消')], default='waiting', max_length=10, verbose_name='状态')),
+                ('remarks', models.TextField(blank=True, null=True, verbose_name='备注')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='加入时间')),
+                ('promoted_at', models.DateTimeField(blank=True, null=True, verbose_name='递补时间')),
+                ('course_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='courses.courseclass', verbose_name='课程班次')),
+                ('enrollment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.enrollment', verbose_name='选课记录')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL, verbose_name='学生')),
+            ],
+            options={
+                'verbose_name': '候补名单',
+                'verbose_name_plural': '候补名单',
+                'indexes': [models.Index(fields=['course_class', 'status', 'id'], name='waitlist_queue_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='waitlistentry',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'waiting')), fields=('student', 'course_class'), name='waitlist_unique_waiting'),
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:09
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# 以下为迁移编写时 courses.schedule 中解析器的冻结副本：迁移不能引用之后还会
+# 修改的应用代码。无法解析时返回 None。
+PERIOD_TIMES = (
+    (8 * 60, 8 * 60 + 45),
+    (8 * 60 + 55, 9 * 60 + 40),
+    (10 * 60, 10 * 60 + 45),
+    (10 * 60 + 55, 11 * 60 + 40),
+    (14 * 60, 14 * 60 + 45),
+    (14 * 60 + 55, 15 * 60 + 40),
+    (16 * 60, 16 * 60 + 45),
+    (16 * 60 + 55, 17 * 60 + 40),
+    (19 * 60, 19 * 60 + 45),
+    (19 * 60 + 55, 20 * 60 + 40),
+    (20 * 60 + 50, 21 * 60 + 35),
+    (21 * 60 + 45, 22 * 60 + 30),
+)
+DEFAULT_WEEKS = (1, 16)
+MAX_WEEK = 30
+WEEKDAYS = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '日': 7, '天': 7}
+RANGE = r'\s*[-~～－至到]\s*'
+WEEKDAY_RE = re.compile(r'(?:周|星期|礼拜)([一二三四五六日天])')
+WEEKS_RE = re.compile(r'第?(\d+)(?:' + RANGE + r'(\d+))?\s*周(?![一二三四五六日天])')
+PERIODS_RE = re.compile(r'第?(\d+)(?:' + RANGE + r'(\d+))?\s*节')
+TIMES_RE = re.compile(r'(\d{1,2})[:：](\d{2})' + RANGE + r'(\d{1,2})[:：](\d{2})')
+SEGMENT_SEP = re.compile(r'[,，;；\n]')
+
+
+def parse_weeks(match):
+    start = int(match.group(1))
+    end = int(match.group(2) or start)
+    return (start, end) if 1 <= start <= end <= MAX_WEEK else None
+
+
+def parse_schedule(text):
+    """[(星期, 开始节次, 结束节次, 开始周, 结束周)]，无法解析时返回 None"""
+    segments = [segment.strip() for segment in SEGMENT_SEP.split(text or '') if segment.strip()]
+    if not segments:
+        return None
+    week_matches = [WEEKS_RE.search(segment) for segment in segments]
+    given = {parse_weeks(match) for match in week_matches if match}
+    if None in given:
+        return None
+    default_weeks = given.pop() if len(given) == 1 else DEFAULT_WEEKS
+
+    slots = []
+    for segment, week_match in zip(segments, week_matches):
+        weeks = parse_weeks(week_match) if week_match else default_weeks
+        rest = WEEKS_RE.sub(' ', segment)
+        weekdays = [WEEKDAYS[day] for day in WEEKDAY_RE.findall(rest)]
+        if not weekdays:
+            return None
+        times = TIMES_RE.search(rest)
+        periods = PERIODS_RE.search(rest)
+        if times:
+            start_hour, start_minute, end_hour, end_minute = map(int, times.groups())
+            start, end = start_hour * 60 + start_minute, end_hour * 60 + end_minute
+            overlapping = [
+                i + 1 for i, (period_start, period_end) in enumerate(PERIOD_TIMES)
+                if period_start < end and period_end > start
+            ]
+            if not overlapping:
+                return None
+            start_period, end_period = overlapping[0], overlapping[-1]
+        elif periods:
+            start_period = int(periods.group(1))
+            end_period = int(periods.group(2) or start_period)
+        else:
+            return None
+        if not 1 <= start_period <= end_period <= len(PERIOD_TIMES):
+            return None
+        slots.extend((weekday, start_period, end_period) + weeks for weekday in weekdays)
+    return slots
+
+
+def parse_existing_schedules(apps, schema_editor):
+    CourseClass = apps.get_model('courses', 'CourseClass')
+    ClassTimeSlot = apps.get_model('courses', 'ClassTimeSlot')
+    fields = ('weekday', 'start_period', 'end_period', 'start_week', 'end_week')
+    slots = []
+    for class_id, schedule in CourseClass.objects.values_list('id', 'schedule').iterator():
+        # 无法解析的旧数据不生成时段，不参与冲突检测
+        for slot in parse_schedule(schedule) or ():
+            slots.append(ClassTimeSlot(course_class_id=class_id, **dict(zip(fields, slot))))
+        if len(slots) >= 1000:
+            ClassTimeSlot.objects.bulk_create(slots)
+            slots = []
+    ClassTimeSlot.objects.bulk_create(slots)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_waitlist'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassTimeSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(1, '周一'), (2, '周二'), (3, '周三'), (4, '周四'), (5, '周五'), (6, '周六'), (7, '周日')], verbose_name='星期')),
+                ('start_period', models.PositiveSmallIntegerField(verbose_name='开始节次')),
+                ('end_period', models.PositiveSmallIntegerField(verbose_name='结束节次')),
+                ('start_week', models.PositiveSmallIntegerField(default=1, verbose_name='开始周')),
+                ('end_week', models.PositiveSmallIntegerField(default=16, verbose_name='结束周')),
+                ('course_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_slots', to='courses.courseclass', verbose_name='课程班次')),
+            ],
+            options={
+                'verbose_name': '上课时段',
+                'verbose_name_plural': '上课时段',
+                'ordering': ['weekday', 'start_period'],
+            },
+        ),
+        migrations.RunPython(parse_existing_schedules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0007_class_time_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationRound',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='轮次名称')),
+                ('opens_at', models.DateTimeField(verbose_name='开始时间')),
+                ('closes_at', models.DateTimeField(verbose_name='截止时间')),
+                ('max_choices', models.PositiveSmallIntegerField(default=5, verbose_name='最多志愿数')),
+                ('status', models.CharField(choices=[('open', '收集志愿'), ('allocated', '已分配')], default='open', max_length=10, verbose_name='状态')),
+                ('seed', models.BigIntegerField(blank=True, null=True, verbose_name='随机种子')),
+                ('allocated_at', models.DateTimeField(blank=True, null=True, verbose_name='分配时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('classes', models.ManyToManyField(related_name='allocation_rounds', to='courses.courseclass', verbose_name='参与班次')),
+            ],
+            options={
+                'verbose_name': '抽签选课轮次',
+                'verbose_name_plural': '抽签选课轮次',
+                'ordering': ['-opens_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EnrollmentPreference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='志愿顺序')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='提交时间')),
+                ('allocation_round', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='preferences', to='courses.allocationround', verbose_name='轮次')),
+                ('course_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='courses.courseclass', verbose_name='课程班次')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollment_preferences', to=settings.AUTH_USER_MODEL, verbose_name='学生')),
+            ],
+            options={
+                'verbose_name': '选课志愿',
+                'verbose_name_plural': '选课志愿',
+                'unique_together': {('allocation_round', 'student', 'course_class'), ('allocation_round', 'student', 'rank')},
+            },
+        ),
+    ]
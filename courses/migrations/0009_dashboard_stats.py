@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_allocation_rounds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_users', models.IntegerField(default=0, verbose_name='总用户数')),
+                ('total_students', models.IntegerField(default=0, verbose_name='学生数量')),
+                ('total_teachers', models.IntegerField(default=0, verbose_name='教师数量')),
+                ('total_courses', models.IntegerField(default=0, verbose_name='课程数量')),
+                ('total_enrollments', models.IntegerField(default=0, verbose_name='已通过选课数')),
+                ('pending_enrollments', models.IntegerField(default=0, verbose_name='待审核选课数')),
+                ('rebuilt_at', models.DateTimeField(verbose_name='重建时间')),
+            ],
+            options={
+                'verbose_name': '仪表板统计',
+                'verbose_name_plural': '仪表板统计',
+            },
+        ),
+    ]
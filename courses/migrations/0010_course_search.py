@@ -0,0 +1,81 @@
+import re
+
+from django.db import DatabaseError, migrations
+
+# 以下为迁移编写时 courses.search 中建表和索引逻辑的冻结副本：迁移不能引用之后
+# 还会修改的应用代码。
+TABLE = 'courses_course_search'
+BATCH_SIZE = 2000
+RUN_RE = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    """每段连续字母数字的相邻二元组加末字，以空格连接"""
+    tokens = []
+    for run in RUN_RE.findall((text or '').lower()):
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+    return ' '.join(tokens)
+
+
+def write_documents(cursor, vendor, documents):
+    if vendor == 'sqlite':
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(pk,) for pk, _, _ in documents])
+        cursor.executemany(f'INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)', documents)
+    else:
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (course_id, document) VALUES '
+            "(%s, setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B')) "
+            'ON CONFLICT (course_id) DO UPDATE SET document = EXCLUDED.document',
+            documents,
+        )
+
+
+def create_index(apps, schema_editor):
+    # 索引表不是模型，按数据库类型建立；不支持的数据库上跳过，搜索退回 icontains
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(title, body, tokenize='unicode61')"
+                )
+            except DatabaseError:
+                # 未编译 FTS5 扩展
+                return
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+                'course_id bigint PRIMARY KEY REFERENCES courses_course (id) ON DELETE CASCADE, '
+                'document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {TABLE}_document ON {TABLE} USING gin (document)')
+        else:
+            return
+
+    with connection.cursor() as source, connection.cursor() as cursor:
+        source.execute('SELECT id, course_name, course_code, description FROM courses_course ORDER BY id')
+        while True:
+            rows = source.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            write_documents(cursor, connection.vendor, [
+                (pk, tokenize(f'{name or ""} {code or ""}'), tokenize(description))
+                for pk, name, code, description in rows
+            ])
+
+
+def drop_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_dashboard_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,94 @@
+import re
+
+from django.db import DatabaseError, migrations
+
+# 以下为迁移编写时 courses.search 中建表和索引逻辑的冻结副本：迁移不能引用之后
+# 还会修改的应用代码，也不能经由当前模型的关联取数。
+TABLE = 'courses_class_search'
+BATCH_SIZE = 2000
+RUN_RE = re.compile(r'[^\W_]+')
+SOURCE_SQL = (
+    'SELECT cc.id, cc.class_code, c.course_code, c.course_name, u.username, tp.name, cc.classroom '
+    'FROM courses_courseclass cc '
+    'INNER JOIN courses_course c ON c.id = cc.course_id '
+    'INNER JOIN users_user u ON u.id = cc.teacher_id '
+    'LEFT OUTER JOIN users_teacherprofile tp ON tp.user_id = u.id '
+    'ORDER BY cc.id'
+)
+
+
+def joined(*parts):
+    """每段连续字母数字的相邻二元组加末字，以空格连接"""
+    tokens = []
+    for run in RUN_RE.findall(' '.join(part or '' for part in parts).lower()):
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+    return ' '.join(tokens)
+
+
+def write_documents(cursor, vendor, documents):
+    if vendor == 'sqlite':
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(row[0],) for row in documents])
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, title, people, body) VALUES (%s, %s, %s, %s)', documents
+        )
+    else:
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (class_id, document) VALUES (%s, '
+            "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+            "setweight(to_tsvector('simple', %s), 'C')) "
+            'ON CONFLICT (class_id) DO UPDATE SET document = EXCLUDED.document',
+            documents,
+        )
+
+
+def create_index(apps, schema_editor):
+    # 与课程检索索引相同，不支持的数据库上跳过，搜索退回 icontains
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} '
+                    "USING fts5(title, people, body, tokenize='unicode61')"
+                )
+            except DatabaseError:
+                # 未编译 FTS5 扩展
+                return
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+                'class_id bigint PRIMARY KEY REFERENCES courses_courseclass (id) ON DELETE CASCADE, '
+                'document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {TABLE}_document ON {TABLE} USING gin (document)')
+        else:
+            return
+
+    with connection.cursor() as source, connection.cursor() as cursor:
+        source.execute(SOURCE_SQL)
+        while True:
+            rows = source.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            write_documents(cursor, connection.vendor, [
+                (pk, joined(class_code, course_code, course_name), joined(username, teacher_name), joined(classroom))
+                for pk, class_code, course_code, course_name, username, teacher_name, classroom in rows
+            ])
+
+
+def drop_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_course_search'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
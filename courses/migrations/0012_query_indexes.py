@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_class_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='allocationround',
+            index=models.Index(fields=['status', 'opens_at'], name='allocation_round_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['created_at', 'id'], name='course_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseclass',
+            index=models.Index(fields=['created_at', 'id'], name='class_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseclass',
+            index=models.Index(fields=['teacher', 'created_at', 'id'], name='class_teacher_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseclass',
+            index=models.Index(condition=models.Q(('current_students__lt', models.F('max_students'))), fields=['id'], name='class_open_seats_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['student', 'status'], name='enrollment_student_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['course_class', 'status'], name='enrollment_class_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['status', 'enroll_time', 'id'], name='enrollment_status_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['enroll_time', 'id'], name='enrollment_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['course_class', 'enroll_time'], name='enrollment_pending_idx'),
+        ),
+    ]
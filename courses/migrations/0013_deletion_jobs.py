@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0012_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_type', models.CharField(choices=[('course', '课程'), ('user', '用户')], max_length=10, verbose_name='删除对象')),
+                ('target_id', models.BigIntegerField(verbose_name='对象 ID')),
+                ('target_label', models.CharField(max_length=200, verbose_name='对象名称')),
+                ('status', models.CharField(choices=[('queued', '排队中'), ('running', '删除中'), ('done', '已完成'), ('failed', '失败')], default='queued', max_length=10, verbose_name='状态')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='待删除行数')),
+                ('deleted', models.PositiveIntegerField(default=0, verbose_name='已删除行数')),
+                ('message', models.CharField(blank=True, max_length=200, verbose_name='处理结果')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='提交时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='发起人')),
+            ],
+            options={
+                'verbose_name': '后台删除任务',
+                'verbose_name_plural': '后台删除任务',
+                'indexes': [models.Index(fields=['status', 'id'], name='deletion_job_queue_idx'), models.Index(fields=['target_type', 'target_id'], name='deletion_job_target_idx')],
+            },
+        ),
+    ]
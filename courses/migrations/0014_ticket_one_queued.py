@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:12
+
+from django.db import migrations, models
+
+
+def reject_duplicate_tickets(apps, schema_editor):
+    # 约束建立前，同一学生在同一班次的多张排队票据只保留最早的一张
+    EnrollmentTicket = apps.get_model('courses', 'EnrollmentTicket')
+    seen = set()
+    duplicates = []
+    queued = EnrollmentTicket.objects.using(schema_editor.connection.alias).filter(status='queued')
+    for pk, student_id, course_class_id in queued.order_by('id').values_list('pk', 'student_id', 'course_class_id'):
+        if (student_id, course_class_id) in seen:
+            duplicates.append(pk)
+        seen.add((student_id, course_class_id))
+    queued.filter(pk__in=duplicates).update(status='rejected', message='重复提交的选课申请。')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_deletion_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='enrollmentticket',
+            name='status',
+            field=models.CharField(choices=[('queued', '排队中'), ('admitted', '已受理'), ('rejected', '未受理'), ('failed', '处理失败')], default='queued', max_length=10, verbose_name='状态'),
+        ),
+        migrations.RunPython(reject_duplicate_tickets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='enrollmentticket',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'queued')), fields=('student', 'course_class'), name='ticket_one_queued'),
+        ),
+    ]
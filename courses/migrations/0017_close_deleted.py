@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0016_deletion_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='course',
+            name='course_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='courseclass',
+            name='class_created_idx',
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='is_active',
+            field=models.BooleanField(default=True, verbose_name='有效'),
+        ),
+        migrations.AddField(
+            model_name='courseclass',
+            name='is_active',
+            field=models.BooleanField(default=True, verbose_name='开放选课'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='course_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseclass',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='class_active_created_idx'),
+        ),
+    ]
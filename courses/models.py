@@ -1,9 +1,31 @@
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
+class CourseQuerySet(models.QuerySet):
+    def with_capacity_stats(self):
+        """附加各班次的汇总：class_count、total_capacity、total_enrolled、remaining_spots
+
+        每项是按课程的相关子查询（走班次的 course_id 索引），而不是 JOIN 后 GROUP BY：
+        分页列表只对取出的那一页求值，外层仍能按索引排序，整页只需一条查询。
+        """
+        classes = CourseClass.objects.filter(course=models.OuterRef('pk')).order_by().values('course')
+
+        def per_course(aggregate):
+            return Coalesce(models.Subquery(classes.annotate(value=aggregate).values('value')), 0)
+
+        return self.annotate(
+            class_count=per_course(models.Count('pk')),
+            total_capacity=per_course(models.Sum('max_students')),
+            total_enrolled=per_course(models.Sum('current_students')),
+        ).annotate(
+            remaining_spots=Greatest(models.F('total_capacity') - models.F('total_enrolled'), 0),
+        )
+
+
 class Course(models.Model):
     """课程模型"""
     course_code = models.CharField(max_length=20, unique=True, verbose_name='课程代码')
@@ -15,12 +37,22 @@ class Course(models.Model):
     current_students = models.IntegerField(default=0, verbose_name='当前选课人数')
     semester = models.CharField(max_length=20, verbose_name='学期')
     academic_year = models.CharField(max_length=10, verbose_name='学年')
+    # 提交删除任务后即关闭，不再出现在列表中，也不能再选课
+    is_active = models.BooleanField(default=True, verbose_name='有效')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
+    objects = CourseQuerySet.as_manager()
+
     class Meta:
         verbose_name = '课程'
         verbose_name_plural = '课程'
+        indexes = [
+            # 课程列表只列出有效课程，按 (-created_at, -id) 键集分页；总数也走该部分索引
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(is_active=True), name='course_active_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.course_name} ({self.course_code})"
@@ -43,6 +75,8 @@ class CourseClass(models.Model):
     schedule = models.CharField(max_length=100, verbose_name='上课时间')
     max_students = models.IntegerField(default=50, verbose_name='最大选课人数')
     current_students = models.IntegerField(default=0, verbose_name='当前选课人数')
+    counter_shards = models.PositiveSmallIntegerField(default=0, verbose_name='计数分片数')
+    is_active = models.BooleanField(default=True, verbose_name='开放选课')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
@@ -50,6 +84,18 @@ class CourseClass(models.Model):
         verbose_name = '课程班次'
         verbose_name_plural = '课程班次'
         unique_together = ['course', 'class_code']
+        indexes = [
+            # 班次列表（只列出开放的班次）的键集分页与总数，以及教师仪表板、用户详情中某位教师的班次
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(is_active=True), name='class_active_created_idx'
+            ),
+            models.Index(fields=['teacher', 'created_at', 'id'], name='class_teacher_created_idx'),
+            # 仍有名额的班次（可选班次、推荐），满员的班次不进索引
+            models.Index(
+                fields=['id'], condition=models.Q(current_students__lt=models.F('max_students')),
+                name='class_open_seats_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.course.course_name} - {self.class_code}"
@@ -63,6 +109,49 @@ class CourseClass(models.Model):
         return max(0, self.max_students - self.current_students)
 
 
+class ClassTimeSlot(models.Model):
+    """班次的一个上课时段，由 CourseClass.schedule 解析得到"""
+    WEEKDAY_CHOICES = (
+        (1, '周一'),
+        (2, '周二'),
+        (3, '周三'),
+        (4, '周四'),
+        (5, '周五'),
+        (6, '周六'),
+        (7, '周日'),
+    )
+
+    course_class = models.ForeignKey(CourseClass, on_delete=models.CASCADE, related_name='time_slots', verbose_name='课程班次')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, verbose_name='星期')
+    start_period = models.PositiveSmallIntegerField(verbose_name='开始节次')
+    end_period = models.PositiveSmallIntegerField(verbose_name='结束节次')
+    start_week = models.PositiveSmallIntegerField(default=1, verbose_name='开始周')
+    end_week = models.PositiveSmallIntegerField(default=16, verbose_name='结束周')
+
+    class Meta:
+        verbose_name = '上课时段'
+        verbose_name_plural = '上课时段'
+        ordering = ['weekday', 'start_period']
+
+    def __str__(self):
+        return f"{self.get_weekday_display()} {self.start_period}-{self.end_period}节 {self.start_week}-{self.end_week}周"
+
+
+class SeatCounterShard(models.Model):
+    """班次选课人数的分片计数"""
+    course_class = models.ForeignKey(CourseClass, on_delete=models.CASCADE, related_name='seat_shards', verbose_name='课程班次')
+    shard = models.PositiveSmallIntegerField(verbose_name='分片编号')
+    count = models.IntegerField(default=0, verbose_name='计数')
+
+    class Meta:
+        verbose_name = '选课计数分片'
+        verbose_name_plural = '选课计数分片'
+        unique_together = ['course_class', 'shard']
+
+    def __str__(self):
+        return f"{self.course_class} #{self.shard}: {self.count}"
+
+
 class Enrollment(models.Model):
     """选课记录模型"""
     STATUS_CHOICES = (
@@ -71,6 +160,8 @@ class Enrollment(models.Model):
         ('rejected', '已拒绝'),
         ('dropped', '已退课'),
     )
+    # 占用班次名额的状态，current_students 即这些状态的选课记录数
+    SEAT_STATUSES = ('pending', 'approved')
 
     student = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'user_type': 'student'}, verbose_name='学生')
     course_class = models.ForeignKey(CourseClass, on_delete=models.CASCADE, related_name='enrollments', verbose_name='课程班次')
@@ -84,11 +175,161 @@ class Enrollment(models.Model):
         verbose_name = '选课记录'
         verbose_name_plural = '选课记录'
         unique_together = ['student', 'course_class']
+        indexes = [
+            # 学生的选课记录与快照、班次的名额统计与名单，都按状态筛选
+            models.Index(fields=['student', 'status'], name='enrollment_student_status_idx'),
+            models.Index(fields=['course_class', 'status'], name='enrollment_class_status_idx'),
+            # 选课记录列表按状态筛选、按 (-enroll_time, -id) 分页；也覆盖仪表板的按状态计数
+            models.Index(fields=['status', 'enroll_time', 'id'], name='enrollment_status_time_idx'),
+            models.Index(fields=['enroll_time', 'id'], name='enrollment_time_idx'),
+            # 待审核队列只占全部记录的一小部分
+            models.Index(
+                fields=['course_class', 'enroll_time'], condition=models.Q(status='pending'),
+                name='enrollment_pending_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.student.username} - {self.course_class}"
 
 
+class WaitlistEntry(models.Model):
+    """班次候补名单"""
+    STATUS_CHOICES = (
+        ('waiting', '候补中'),
+        ('promoted', '已递补'),
+        ('cancelled', '已取消'),
+    )
+
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries', verbose_name='学生')
+    course_class = models.ForeignKey(CourseClass, on_delete=models.CASCADE, related_name='waitlist', verbose_name='课程班次')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting', verbose_name='状态')
+    remarks = models.TextField(blank=True, null=True, verbose_name='备注')
+    enrollment = models.ForeignKey(Enrollment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='选课记录')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='加入时间')
+    promoted_at = models.DateTimeField(null=True, blank=True, verbose_name='递补时间')
+
+    class Meta:
+        verbose_name = '候补名单'
+        verbose_name_plural = '候补名单'
+        indexes = [
+            # 队首查找与名次计算都是该索引上的范围扫描
+            models.Index(fields=['course_class', 'status', 'id'], name='waitlist_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['student', 'course_class'],
+                condition=models.Q(status='waiting'),
+                name='waitlist_unique_waiting',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.student.username} - {self.course_class} ({self.get_status_display()})"
+
+
+class EnrollmentTicket(models.Model):
+    """排队选课的票据，由后台 worker 按班次先进先出处理"""
+    STATUS_CHOICES = (
+        ('queued', '排队中'),
+        ('admitted', '已受理'),
+        ('rejected', '未受理'),
+        ('failed', '处理失败'),
+    )
+
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enrollment_tickets', verbose_name='学生')
+    course_class = models.ForeignKey(CourseClass, on_delete=models.CASCADE, related_name='tickets', verbose_name='课程班次')
+    remarks = models.TextField(blank=True, null=True, verbose_name='备注')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name='状态')
+    message = models.CharField(max_length=200, blank=True, verbose_name='处理结果')
+    enrollment = models.ForeignKey(Enrollment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='选课记录')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='提交时间')
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='处理时间')
+
+    class Meta:
+        verbose_name = '选课排队票据'
+        verbose_name_plural = '选课排队票据'
+        indexes = [
+            models.Index(fields=['status', 'course_class', 'id'], name='ticket_queue_idx'),
+        ]
+        constraints = [
+            # 同一学生在同一班次最多一张排队中的票据
+            models.UniqueConstraint(
+                fields=['student', 'course_class'], condition=models.Q(status='queued'), name='ticket_one_queued',
+            ),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.student.username} - {self.course_class}"
+
+
+class AllocationRound(models.Model):
+    """抽签选课轮次：窗口期内收集志愿，截止后统一分配"""
+    STATUS_CHOICES = (
+        ('open', '收集志愿'),
+        ('allocated', '已分配'),
+    )
+
+    name = models.CharField(max_length=100, verbose_name='轮次名称')
+    classes = models.ManyToManyField(CourseClass, related_name='allocation_rounds', verbose_name='参与班次')
+    opens_at = models.DateTimeField(verbose_name='开始时间')
+    closes_at = models.DateTimeField(verbose_name='截止时间')
+    max_choices = models.PositiveSmallIntegerField(default=5, verbose_name='最多志愿数')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open', verbose_name='状态')
+    seed = models.BigIntegerField(null=True, blank=True, verbose_name='随机种子')
+    allocated_at = models.DateTimeField(null=True, blank=True, verbose_name='分配时间')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        verbose_name = '抽签选课轮次'
+        verbose_name_plural = '抽签选课轮次'
+        ordering = ['-opens_at']
+        indexes = [
+            models.Index(fields=['status', 'opens_at'], name='allocation_round_open_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def is_accepting(self, now):
+        return self.status == 'open' and self.opens_at <= now < self.closes_at
+
+
+class EnrollmentPreference(models.Model):
+    """学生在抽签轮次中填报的志愿，rank 越小越优先"""
+    allocation_round = models.ForeignKey(AllocationRound, on_delete=models.CASCADE, related_name='preferences', verbose_name='轮次')
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enrollment_preferences', verbose_name='学生')
+    course_class = models.ForeignKey(CourseClass, on_delete=models.CASCADE, related_name='+', verbose_name='课程班次')
+    rank = models.PositiveSmallIntegerField(verbose_name='志愿顺序')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='提交时间')
+
+    class Meta:
+        verbose_name = '选课志愿'
+        verbose_name_plural = '选课志愿'
+        unique_together = [['allocation_round', 'student', 'rank'], ['allocation_round', 'student', 'course_class']]
+
+    def __str__(self):
+        return f"{self.student.username} - {self.rank}. {self.course_class}"
+
+
+class DashboardStats(models.Model):
+    """管理员仪表板统计的物化单行表（主键固定为 1），见 courses.dashboard"""
+    total_users = models.IntegerField(default=0, verbose_name='总用户数')
+    total_students = models.IntegerField(default=0, verbose_name='学生数量')
+    total_teachers = models.IntegerField(default=0, verbose_name='教师数量')
+    total_courses = models.IntegerField(default=0, verbose_name='课程数量')
+    total_enrollments = models.IntegerField(default=0, verbose_name='已通过选课数')
+    pending_enrollments = models.IntegerField(default=0, verbose_name='待审核选课数')
+    rebuilt_at = models.DateTimeField(verbose_name='重建时间')
+
+    class Meta:
+        verbose_name = '仪表板统计'
+        verbose_name_plural = '仪表板统计'
+
+    def __str__(self):
+        return f"仪表板统计（{self.rebuilt_at:%Y-%m-%d %H:%M} 重建）"
+
+
 class Announcement(models.Model):
     """公告模型"""
     title = models.CharField(max_length=200, verbose_name='公告标题')
@@ -104,4 +345,51 @@ class Announcement(models.Model):
         verbose_name_plural = '公告'
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+
+class DeletionJob(models.Model):
+    """后台删除任务：由 worker 分批删除课程或用户及其关联数据，见 courses.deletion"""
+    TARGET_CHOICES = (
+        ('course', '课程'),
+        ('user', '用户'),
+    )
+    STATUS_CHOICES = (
+        ('queued', '排队中'),
+        ('running', '删除中'),
+        ('done', '已完成'),
+        ('failed', '失败'),
+    )
+
+    target_type = models.CharField(max_length=10, choices=TARGET_CHOICES, verbose_name='删除对象')
+    target_id = models.BigIntegerField(verbose_name='对象 ID')
+    target_label = models.CharField(max_length=200, verbose_name='对象名称')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='发起人')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name='状态')
+    total = models.PositiveIntegerField(default=0, verbose_name='待删除行数')
+    deleted = models.PositiveIntegerField(default=0, verbose_name='已删除行数')
+    message = models.CharField(max_length=200, blank=True, verbose_name='处理结果')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='提交时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='完成时间')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name='最近进展时间')
+
+    class Meta:
+        verbose_name = '后台删除任务'
+        verbose_name_plural = '后台删除任务'
+        indexes = [
+            models.Index(fields=['status', 'id'], name='deletion_job_queue_idx'),
+            models.Index(fields=['target_type', 'target_id'], name='deletion_job_target_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} 删除{self.get_target_type_display()} {self.target_label}"
+
+    @property
+    def progress(self):
+        """完成百分比（0-100）"""
+        if self.status == 'done':
+            return 100
+        if not self.total:
+            return 0
+        return min(100, self.deleted * 100 // self.total)
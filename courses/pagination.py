@@ -0,0 +1,224 @@
+"""键集（游标）分页
+
+OFFSET 分页翻到第 n 页时数据库要先扫过前面的全部行，还要额外 COUNT(*) 算总页
+数。键集分页按一组唯一的排序键（如 (-enroll_time, -id)）取“上一页最后一行之后”
+的若干行，每页的开销与页码无关，也不需要总数。
+
+游标用 django.core.signing 签名，内容是方向和边界行的排序键值，对客户端不透明
+且不能伪造；首页不带游标，末页用不带边界值的反向游标。翻页本身不统计总数，
+paginator.total 按需给出缓存或估算的总数（见 courses.counts）。
+"""
+from django.core import signing
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+from .counts import Total, cached_count
+
+CURSOR_SALT = 'courses.pagination'
+
+
+class KeysetPage:
+    """一页结果，接口与 Django 的 Page 相近（has_next / has_previous 等）"""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    """按 ordering（如 ('-enroll_time', '-id')）做键集分页，最后一个字段须唯一"""
+
+    def __init__(self, queryset, ordering, per_page, count_scope=''):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.count_scope = count_scope
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    @cached_property
+    def total(self):
+        """总数（courses.counts.Total），只在模板用到时才统计"""
+        return cached_count(self.queryset, self.count_scope)
+
+    @property
+    def count(self):
+        return self.total.value
+
+    def encode_cursor(self, direction, obj=None):
+        values = None
+        if obj is not None:
+            values = [self._field(name).value_to_string(obj) for name, _ in self.fields]
+        return signing.dumps([direction, values], salt=CURSOR_SALT, compress=True)
+
+    def last_cursor(self):
+        return self.encode_cursor('prev')
+
+    def decode_cursor(self, cursor):
+        try:
+            direction, values = signing.loads(cursor, salt=CURSOR_SALT)
+            if direction not in ('next', 'prev'):
+                raise ValueError(direction)
+            if values is not None:
+                values = [self._field(name).to_python(value) for (name, _), value in zip(self.fields, values)]
+        except (signing.BadSignature, ValueError, TypeError):
+            raise Http404('无效的分页游标')
+        return direction, values
+
+    def _field(self, name):
+        return self.queryset.model._meta.get_field(name)
+
+    def _boundary(self, values, after):
+        """排序键严格位于 values 之后（after）或之前的行：逐字段展开的字典序比较"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending == after else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def page(self, cursor=None):
+        direction, values = self.decode_cursor(cursor) if cursor else ('next', None)
+        forward = direction == 'next'
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._boundary(values, after=forward))
+        ordering = self.ordering if forward else tuple(
+            name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering
+        )
+        # 多取一行判断是否还有下一页
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        if forward:
+            has_next, has_previous = more, values is not None
+        else:
+            has_next, has_previous = True, more
+        if values is None and not forward:
+            # 末页之后没有数据
+            has_next = False
+        return KeysetPage(
+            rows, has_next, has_previous,
+            next_cursor=self.encode_cursor('next', rows[-1]) if has_next and rows else None,
+            previous_cursor=self.encode_cursor('prev', rows[0]) if has_previous and rows else None,
+        )
+
+
+class RankedPaginator:
+    """按给定的主键顺序（如检索的相关度）分页，接口与 KeysetPaginator 相同
+
+    排序已经在 ranked_ids 中确定，游标只记录偏移量；每页按主键取回本页的行。
+    ranked_ids 达到 limit 时总数标为估计值（实际结果可能更多）。
+    """
+
+    def __init__(self, queryset, ranked_ids, per_page, limit=None):
+        self.queryset = queryset
+        self.ranked_ids = list(ranked_ids)
+        self.per_page = per_page
+        self.limit = limit
+
+    @cached_property
+    def total(self):
+        count = len(self.ranked_ids)
+        return Total(count, self.limit is not None and count >= self.limit)
+
+    @property
+    def count(self):
+        return self.total.value
+
+    def _cursor(self, offset):
+        return signing.dumps(['offset', offset], salt=CURSOR_SALT)
+
+    def last_cursor(self):
+        last = max(len(self.ranked_ids) - 1, 0) // self.per_page * self.per_page
+        return self._cursor(last) if last else None
+
+    def page(self, cursor=None):
+        offset = 0
+        if cursor:
+            try:
+                kind, offset = signing.loads(cursor, salt=CURSOR_SALT)
+                if kind != 'offset' or not isinstance(offset, int) or offset < 0:
+                    raise ValueError(offset)
+            except (signing.BadSignature, ValueError, TypeError):
+                raise Http404('无效的分页游标')
+        ids = self.ranked_ids[offset:offset + self.per_page]
+        rows = self.queryset.in_bulk(ids)
+        has_next = offset + self.per_page < len(self.ranked_ids)
+        has_previous = offset > 0
+        return KeysetPage(
+            [rows[pk] for pk in ids if pk in rows], has_next, has_previous,
+            next_cursor=self._cursor(offset + self.per_page) if has_next else None,
+            previous_cursor=self._cursor(max(offset - self.per_page, 0)) if has_previous else None,
+        )
+
+
+class KeysetPaginationMixin:
+    """ListView 的键集分页：设置 keyset_ordering，并保留 paginate_by
+
+    查询字符串中的 cursor 参数指定页，其他参数（搜索、筛选条件）原样带到翻页
+    链接中。模板使用 page_obj.has_next / has_previous 以及 first_page_url、
+    previous_page_url、next_page_url、last_page_url；列表范围因用户而异时需
+    覆盖 get_count_scope，不按键集排序（如检索结果）时覆盖 get_keyset_paginator。
+    """
+    keyset_ordering = ('-id',)
+    cursor_kwarg = 'cursor'
+
+    def get_count_scope(self):
+        """总数缓存的区分键：视图加上除游标外的查询参数"""
+        params = sorted(
+            (key, value) for key, values in self.request.GET.lists() if key not in (self.cursor_kwarg, 'page')
+            for value in values
+        )
+        return f'{type(self).__name__}:{params}'
+
+    def get_keyset_paginator(self, queryset, page_size):
+        return KeysetPaginator(queryset, self.keyset_ordering, page_size, self.get_count_scope())
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = self.get_keyset_paginator(queryset, page_size)
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def _page_url(self, cursor):
+        params = self.request.GET.copy()
+        params.pop(self.cursor_kwarg, None)
+        params.pop('page', None)
+        if cursor:
+            params[self.cursor_kwarg] = cursor
+        query = params.urlencode()
+        return f'?{query}' if query else self.request.path
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page, paginator = context.get('page_obj'), context.get('paginator')
+        if page is not None:
+            context.update({
+                'first_page_url': self._page_url(None),
+                'last_page_url': self._page_url(paginator.last_cursor()),
+                'next_page_url': self._page_url(page.next_cursor) if page.next_cursor else None,
+                'previous_page_url': self._page_url(page.previous_cursor) if page.previous_cursor else None,
+            })
+        return context
@@ -0,0 +1,118 @@
+"""排队选课
+
+选课高峰时请求只做校验并写入一张排队票据（EnrollmentTicket），立即返回票号；
+后台 worker（manage.py process_enrollment_queue）按班次先进先出地处理票据，
+复用 reserve_seat 的资格检查与名额占用逻辑。
+
+每个班次只会被一个 worker 处理（按 course_class_id 取模分区），因此同一班次
+内的处理顺序与提交顺序一致。队列完全基于数据库表，不需要外部消息中间件。
+"""
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from .models import EnrollmentTicket
+from .schedule import check_schedule_conflict
+from .seats import EnrollmentError, reserve_seat
+
+
+def queued_mode_enabled():
+    """是否启用排队选课模式"""
+    return getattr(settings, 'COURSES_ENROLLMENT_MODE', 'sync') == 'queued'
+
+
+def enqueue_enrollment(student, course_class, remarks=None):
+    """把选课请求放入班次队列，返回票据"""
+    try:
+        # 同一学生在同一班次只能有一张排队中的票据（条件唯一约束），并发提交时只有一个成功
+        with transaction.atomic():
+            return EnrollmentTicket.objects.create(
+                student=student, course_class=course_class, remarks=remarks
+            )
+    except IntegrityError:
+        raise EnrollmentError('您的选课申请已在排队中，请勿重复提交。', code='queued')
+
+
+def queue_position(ticket):
+    """票据在班次队列中的位置（从 1 开始），已处理的票据返回 None"""
+    if ticket.status != 'queued':
+        return None
+    return EnrollmentTicket.objects.filter(
+        course_class_id=ticket.course_class_id, status='queued', pk__lte=ticket.pk
+    ).count()
+
+
+def process_ticket(ticket):
+    """处理一张票据：占用名额并创建选课记录，或记录拒绝原因
+
+    与同步选课相同：先检查上课时间冲突，资格（check_eligibility）由 reserve_seat
+    在事务内复查。
+    """
+    try:
+        check_schedule_conflict(ticket.student, ticket.course_class)
+        ticket.enrollment = reserve_seat(ticket.student, ticket.course_class, remarks=ticket.remarks)
+        ticket.status = 'admitted'
+        ticket.message = '选课申请已提交，请等待审核。'
+    except EnrollmentError as e:
+        ticket.status = 'rejected'
+        ticket.message = e.message
+    ticket.processed_at = timezone.now()
+    ticket.save(update_fields=['enrollment', 'status', 'message', 'processed_at'])
+    return ticket
+
+
+def fail_ticket(ticket, error):
+    """处理票据时出现意外错误：标为处理失败，不再留在队列中"""
+    ticket.enrollment = None
+    ticket.status = 'failed'
+    ticket.message = f'处理失败：{error}'[:200]
+    ticket.processed_at = timezone.now()
+    EnrollmentTicket.objects.filter(pk=ticket.pk).update(
+        enrollment=None, status=ticket.status, message=ticket.message, processed_at=ticket.processed_at,
+    )
+
+
+def drain_queue(partition=0, partitions=1, batch_size=100):
+    """处理本分区内排队的票据，返回处理的数量
+
+    票据按 id 升序处理，同一班次总是落在同一分区，保证班次内先进先出。
+    """
+    processed = 0
+    while True:
+        tickets = EnrollmentTicket.objects.filter(status='queued')
+        if partitions > 1:
+            tickets = tickets.alias(
+                partition=Mod('course_class_id', partitions)
+            ).filter(partition=partition)
+        batch = list(
+            tickets.select_related('student', 'course_class__course').order_by('id')[:batch_size]
+        )
+        if not batch:
+            return processed
+        for ticket in batch:
+            try:
+                process_ticket(ticket)
+            except OperationalError:
+                # 数据库暂时繁忙，由 run_worker 稍后重试，票据仍在队列中
+                raise
+            except Exception as e:
+                # 一张票据的意外错误不能让 worker 退出、卡住整个分区
+                fail_ticket(ticket, e)
+            processed += 1
+
+
+def run_worker(partition=0, partitions=1, poll_interval=0.5, batch_size=100, once=False):
+    """worker 主循环：不断处理队列，队列为空时休眠 poll_interval 秒"""
+    while True:
+        try:
+            processed = drain_queue(partition, partitions, batch_size)
+        except OperationalError:
+            # 数据库暂时繁忙，稍后重试；未处理的票据仍在队列中
+            processed = 0
+        if once:
+            return
+        if not processed:
+            time.sleep(poll_interval)
@@ -0,0 +1,204 @@
+"""学生仪表板的课程推荐
+
+manage.py build_recommendations 离线读取全部选课记录（被拒绝的除外），用
+SciPy 稀疏矩阵计算：
+
+- S：学生 × 课程的 0/1 矩阵；
+- 专业热度：专业 one-hot 矩阵 × S，除以该专业的学生数，即“本专业学生中选过
+  这门课的比例”；最后追加一行全体学生的比例，供没有档案或新专业的学生使用；
+- 共选矩阵：Sᵀ × S 去掉对角线后按行除以课程选课人数，即“选了 A 的学生中也选了
+  B 的比例”，每行只保留最相近的 RECOMMEND_NEIGHBORS 门课程。
+
+再按学期记录构建时仍有名额的班次及其课程。结果整体放进默认缓存，由各进程
+共享（需配置数据库缓存、Redis 等共享后端，build_recommendations 命令在进程内
+缓存下拒绝执行），各进程在构建号变化时才反序列化一次。查询时取学生所在专业的热度行，加上其已选课程的共选
+相似度，映射到当前学期的班次上排序，剔除已选的班次和课程，最后只按主键取
+回排名靠前的班次并核对实时名额，不再做按学生的反连接查询。
+
+numpy / scipy 为可选依赖；未安装或尚未构建时 recommend_classes 返回 None，
+由调用方退回到不做推荐的可选班次列表。
+"""
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.utils import timezone
+
+from users.models import StudentProfile
+
+from .models import Course, CourseClass, Enrollment
+
+RECOMMEND_NEIGHBORS = 20
+# 共选相似度相对专业热度的权重
+AFFINITY_WEIGHT = 0.5
+# 取回时多取几倍候选，抵消构建后已满的班次
+OVERFETCH = 3
+
+CACHE_KEY = 'courses:recommendations'
+BUILD_KEY = 'courses:recommendations:build'
+
+Recommendations = namedtuple('Recommendations', [
+    'build_id', 'built_at', 'course_ids', 'student_ids', 'student_majors', 'majors',
+    'popularity', 'neighbors', 'semesters', 'current',
+])
+
+# 本进程已反序列化的推荐数据，构建号不变时复用
+_loaded = None
+
+
+def _scipy():
+    try:
+        import numpy
+        from scipy import sparse
+    except ImportError:
+        raise ImproperlyConfigured('构建课程推荐需要安装 numpy 和 scipy：pip install numpy scipy')
+    return numpy, sparse
+
+
+def _top_k_per_row(np, sparse, matrix, k):
+    """每行只保留最大的 k 个元素"""
+    matrix = matrix.tocsr()
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((-matrix.data, rows))
+    rank = np.arange(order.size) - matrix.indptr[rows[order]]
+    keep = order[rank < k]
+    return sparse.csr_matrix(
+        (matrix.data[keep], (rows[keep], matrix.indices[keep])), shape=matrix.shape, dtype=np.float32
+    )
+
+
+def _current_semester(semesters):
+    configured = getattr(settings, 'COURSES_CURRENT_SEMESTER', None)
+    if configured:
+        return tuple(configured)
+    latest = Course.objects.filter(
+        classes__current_students__lt=F('classes__max_students')
+    ).order_by('-academic_year', '-created_at').values_list('academic_year', 'semester').first()
+    return latest if latest in semesters else None
+
+
+def build_recommendations(neighbors=RECOMMEND_NEIGHBORS):
+    """重新计算推荐数据并写入缓存，返回 Recommendations"""
+    np, sparse = _scipy()
+    course_ids = np.array(list(Course.objects.order_by('pk').values_list('pk', flat=True)), dtype=np.int64)
+    pairs = np.array(list(
+        Enrollment.objects.exclude(status='rejected').values_list('student_id', 'course_class__course_id')
+    ), dtype=np.int64).reshape(-1, 2)
+
+    profiles = np.array(list(
+        StudentProfile.objects.order_by('user_id').values_list('user_id', 'major')
+    ), dtype=object).reshape(-1, 2)
+    student_ids = profiles[:, 0].astype(np.int64)
+    majors, student_majors = np.unique(profiles[:, 1].astype(str), return_inverse=True)
+    student_majors = student_majors.astype(np.int32)
+
+    # S：选课学生 × 课程；同一课程选了多个班次只算一次
+    enrolled, student_index = np.unique(pairs[:, 0], return_inverse=True)
+    enrollments = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (student_index, np.searchsorted(course_ids, pairs[:, 1]))),
+        shape=(len(enrolled), len(course_ids)),
+    )
+    enrollments.data[:] = 1
+
+    # 专业 one-hot：专业 × 选课学生，没有档案的学生只计入全体
+    position = np.searchsorted(student_ids, enrolled)
+    has_profile = position < len(student_ids)
+    has_profile[has_profile] = student_ids[position[has_profile]] == enrolled[has_profile]
+    membership = sparse.csr_matrix(
+        (np.ones(int(has_profile.sum()), dtype=np.float32),
+         (student_majors[position[has_profile]], np.flatnonzero(has_profile))),
+        shape=(len(majors), len(enrolled)),
+    )
+    major_sizes = np.maximum(np.bincount(student_majors, minlength=len(majors)), 1).astype(np.float32)
+    by_major = sparse.diags(1 / major_sizes) @ (membership @ enrollments)
+    course_counts = np.asarray(enrollments.sum(axis=0), dtype=np.float32).ravel()
+    overall = sparse.csr_matrix(course_counts / max(len(enrolled), 1))
+    popularity = sparse.vstack([by_major, overall]).tocsr().astype(np.float32)
+
+    co_enrollment = (enrollments.T @ enrollments).tocsr()
+    co_enrollment.setdiag(0)
+    co_enrollment.eliminate_zeros()
+    co_enrollment = sparse.diags(1 / np.maximum(course_counts, 1)) @ co_enrollment
+    neighbors = _top_k_per_row(np, sparse, co_enrollment, neighbors)
+
+    semesters = {}
+    open_classes = CourseClass.objects.filter(
+        current_students__lt=F('max_students'), is_active=True
+    ).order_by('pk').values_list('pk', 'course_id', 'course__academic_year', 'course__semester')
+    for class_id, course_id, academic_year, semester in open_classes:
+        semesters.setdefault((academic_year, semester), []).append((class_id, course_id))
+    for key, rows in semesters.items():
+        rows = np.array(rows, dtype=np.int64)
+        semesters[key] = (rows[:, 0], np.searchsorted(course_ids, rows[:, 1]).astype(np.int32))
+
+    recommendations = Recommendations(
+        build_id=uuid.uuid4().hex, built_at=timezone.now(), course_ids=course_ids,
+        student_ids=student_ids, student_majors=student_majors, majors=[str(major) for major in majors],
+        popularity=popularity, neighbors=neighbors, semesters=semesters,
+        current=_current_semester(semesters),
+    )
+    cache.set(CACHE_KEY, recommendations, None)
+    cache.set(BUILD_KEY, recommendations.build_id, None)
+    return recommendations
+
+
+def get_recommendations():
+    """当前缓存中的推荐数据，尚未构建时返回 None"""
+    global _loaded
+    build_id = cache.get(BUILD_KEY)
+    if build_id is None:
+        return None
+    if _loaded is None or _loaded.build_id != build_id:
+        recommendations = cache.get(CACHE_KEY)
+        if recommendations is None or recommendations.build_id != build_id:
+            return None
+        _loaded = recommendations
+    return _loaded
+
+
+def recommend_classes(student, exclude_class_ids=(), exclude_course_ids=(), limit=10, semester=None):
+    """为学生推荐当前学期仍有名额的班次，推荐数据不可用时返回 None"""
+    recommendations = get_recommendations()
+    if recommendations is None:
+        return None
+    import numpy as np
+
+    semester = tuple(semester) if semester else recommendations.current
+    if semester not in recommendations.semesters:
+        return []
+    class_ids, class_courses = recommendations.semesters[semester]
+
+    student_ids = recommendations.student_ids
+    position = np.searchsorted(student_ids, student.pk)
+    if position < len(student_ids) and student_ids[position] == student.pk:
+        row = recommendations.student_majors[position]
+    else:
+        row = len(recommendations.majors)
+    scores = recommendations.popularity[row].toarray().ravel()
+
+    course_ids = recommendations.course_ids
+    exclude_course_ids = np.fromiter(exclude_course_ids, dtype=np.int64)
+    taken = np.searchsorted(course_ids, exclude_course_ids)
+    # 构建之后新建的课程不在矩阵中
+    known = taken < len(course_ids)
+    known[known] = course_ids[taken[known]] == exclude_course_ids[known]
+    taken = taken[known]
+    if taken.size:
+        scores = scores + AFFINITY_WEIGHT * np.asarray(
+            recommendations.neighbors[taken].sum(axis=0)
+        ).ravel()
+
+    class_scores = scores[class_courses]
+    excluded = np.isin(class_ids, np.fromiter(exclude_class_ids, dtype=np.int64)) | np.isin(class_courses, taken)
+    class_scores[excluded] = -1
+    # 稳定排序，同分时按班次主键
+    ranked = np.argsort(-class_scores, kind='stable')[:limit * OVERFETCH]
+    ranked = class_ids[ranked[class_scores[ranked] >= 0]].tolist()
+
+    classes = CourseClass.objects.filter(
+        pk__in=ranked, current_students__lt=F('max_students'), is_active=True
+    ).select_related('course', 'teacher').in_bulk()
+    return [classes[pk] for pk in ranked if pk in classes][:limit]
@@ -0,0 +1,130 @@
+"""选课人数对账
+
+按 Enrollment 重新统计班次与课程的选课人数（占用名额的状态见
+Enrollment.SEAT_STATUSES），报告与记录值之间的偏差，并可批量修正。
+
+班次和课程都按主键分块处理：每块一条分组聚合查询统计实际人数，修正时用一次
+bulk_update 写回，内存占用只与块大小有关，与选课记录的总量无关。修正班次时
+在同一事务内锁住该块的班次行，与选课、退课对计数的并发修改互斥。
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Course, CourseClass, Enrollment, SeatCounterShard
+from .seats import fill_seat_shards
+
+CounterDrift = namedtuple('CounterDrift', ['model', 'pk', 'recorded', 'actual'])
+
+
+class ReconcileResult:
+    """对账结果汇总"""
+
+    def __init__(self):
+        self.classes_checked = 0
+        self.classes_drifted = 0
+        self.courses_checked = 0
+        self.courses_drifted = 0
+
+    @property
+    def drifted(self):
+        return self.classes_drifted + self.courses_drifted
+
+
+def _chunks(queryset, chunk_size, fix):
+    """按主键顺序分块遍历，fix 为真时每块在独立事务内加行锁"""
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            chunk = queryset.filter(pk__gt=last_pk).order_by('pk')
+            if fix:
+                chunk = chunk.select_for_update()
+            chunk = list(chunk[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+        last_pk = chunk[-1].pk
+
+
+def reconcile_class_counters(fix=False, chunk_size=1000, on_drift=None, result=None, course_class_ids=None):
+    """核对班次的 current_students（分片模式下为各分片之和）
+
+    course_class_ids 为空时核对全部班次。
+    """
+    result = result or ReconcileResult()
+    classes = CourseClass.objects.only('pk', 'max_students', 'current_students', 'counter_shards')
+    if course_class_ids is not None:
+        classes = classes.filter(pk__in=course_class_ids)
+    for chunk in _chunks(classes, chunk_size, fix):
+        ids = [course_class.pk for course_class in chunk]
+        actual = dict(
+            Enrollment.objects.filter(course_class_id__in=ids, status__in=Enrollment.SEAT_STATUSES)
+            .values_list('course_class_id').annotate(n=Count('id')).order_by()
+        )
+        sharded = [course_class.pk for course_class in chunk if course_class.counter_shards]
+        shard_totals = dict(
+            SeatCounterShard.objects.filter(course_class_id__in=sharded)
+            .values_list('course_class_id').annotate(total=Sum('count')).order_by()
+        ) if sharded else {}
+
+        drifted = []
+        for course_class in chunk:
+            if course_class.counter_shards:
+                recorded = shard_totals.get(course_class.pk, 0)
+            else:
+                recorded = course_class.current_students
+            count = actual.get(course_class.pk, 0)
+            if recorded == count and course_class.current_students == count:
+                continue
+            if recorded != count:
+                result.classes_drifted += 1
+                if on_drift:
+                    on_drift(CounterDrift(CourseClass, course_class.pk, recorded, count))
+            course_class.current_students = count
+            drifted.append(course_class)
+        result.classes_checked += len(chunk)
+
+        if fix and drifted:
+            CourseClass.objects.bulk_update(drifted, ['current_students'])
+            for course_class in drifted:
+                if course_class.counter_shards:
+                    fill_seat_shards(course_class, course_class.counter_shards)
+    return result
+
+
+def reconcile_course_counters(fix=False, chunk_size=1000, on_drift=None, result=None):
+    """核对课程的 current_students（各班次选课人数之和）"""
+    result = result or ReconcileResult()
+    courses = Course.objects.only('pk', 'current_students')
+    for chunk in _chunks(courses, chunk_size, fix=False):
+        actual = dict(
+            Enrollment.objects.filter(
+                course_class__course_id__in=[course.pk for course in chunk],
+                status__in=Enrollment.SEAT_STATUSES,
+            ).values_list('course_class__course_id').annotate(n=Count('id')).order_by()
+        )
+        drifted = []
+        for course in chunk:
+            count = actual.get(course.pk, 0)
+            if course.current_students != count:
+                if on_drift:
+                    on_drift(CounterDrift(Course, course.pk, course.current_students, count))
+                course.current_students = count
+                drifted.append(course)
+        result.courses_checked += len(chunk)
+        result.courses_drifted += len(drifted)
+        if fix and drifted:
+            Course.objects.bulk_update(drifted, ['current_students'])
+    return result
+
+
+def reconcile_counters(fix=False, chunk_size=1000, on_drift=None):
+    """核对（fix 为真时修正）全部班次与课程的选课人数，返回 ReconcileResult
+
+    每发现一处偏差调用一次 on_drift(CounterDrift)。
+    """
+    result = ReconcileResult()
+    reconcile_class_counters(fix, chunk_size, on_drift, result)
+    reconcile_course_counters(fix, chunk_size, on_drift, result)
+    return result
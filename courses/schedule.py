@@ -0,0 +1,250 @@
+"""上课时间的结构化表示与冲突检测
+
+CourseClass.schedule 仍是自由文本，保存时解析为若干 ClassTimeSlot（星期、
+起止节次、起止周）。支持的写法如：
+
+    周一 1-2节
+    周一/周三 8:00-10:00
+    周二、周四 第3-4节 1-8周; 周五 5-6节
+
+冲突检测使用 TimetableIndex：按（星期, 周次）分组，每组保存按开始节次排序、
+互不重叠的区间，插入时合并重叠区间，查询时二分查找，单次检查为 O(log n)。
+学生与教师的索引缓存在 Django 缓存中：选课记录变化时使对应学生的索引失效，
+班次上课时间变化时整体换代。
+"""
+import re
+import uuid
+from bisect import bisect_right
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .models import ClassTimeSlot, CourseClass, Enrollment
+from .seats import EnrollmentError
+
+TIMETABLE_CACHE_TIMEOUT = 300
+
+# 每节课的起止时间（分钟），第 1 节对应下标 0
+PERIOD_TIMES = (
+    (8 * 60, 8 * 60 + 45),
+    (8 * 60 + 55, 9 * 60 + 40),
+    (10 * 60, 10 * 60 + 45),
+    (10 * 60 + 55, 11 * 60 + 40),
+    (14 * 60, 14 * 60 + 45),
+    (14 * 60 + 55, 15 * 60 + 40),
+    (16 * 60, 16 * 60 + 45),
+    (16 * 60 + 55, 17 * 60 + 40),
+    (19 * 60, 19 * 60 + 45),
+    (19 * 60 + 55, 20 * 60 + 40),
+    (20 * 60 + 50, 21 * 60 + 35),
+    (21 * 60 + 45, 22 * 60 + 30),
+)
+DEFAULT_WEEKS = (1, 16)
+MAX_WEEK = 30
+
+TimeSlot = namedtuple('TimeSlot', ['weekday', 'start_period', 'end_period', 'start_week', 'end_week'])
+
+
+class ScheduleParseError(ValueError):
+    """上课时间无法解析"""
+
+
+_WEEKDAYS = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '日': 7, '天': 7}
+_RANGE = r'\s*[-~～－至到]\s*'
+_WEEKDAY_RE = re.compile(r'(?:周|星期|礼拜)([一二三四五六日天])')
+_WEEKS_RE = re.compile(r'第?(\d+)(?:' + _RANGE + r'(\d+))?\s*周(?![一二三四五六日天])')
+_PERIODS_RE = re.compile(r'第?(\d+)(?:' + _RANGE + r'(\d+))?\s*节')
+_TIMES_RE = re.compile(r'(\d{1,2})[:：](\d{2})' + _RANGE + r'(\d{1,2})[:：](\d{2})')
+_SEGMENT_SEP = re.compile(r'[,，;；\n]')
+
+
+def _periods_for_times(start, end):
+    """与 [start, end) 时间段有重叠的节次范围"""
+    periods = [
+        i + 1 for i, (period_start, period_end) in enumerate(PERIOD_TIMES)
+        if period_start < end and period_end > start
+    ]
+    if not periods:
+        raise ScheduleParseError('上课时间不在任何节次内')
+    return periods[0], periods[-1]
+
+
+def _parse_weeks(match):
+    start = int(match.group(1))
+    end = int(match.group(2) or start)
+    if not 1 <= start <= end <= MAX_WEEK:
+        raise ScheduleParseError(f'周次范围应在 1-{MAX_WEEK} 之间')
+    return start, end
+
+
+def parse_schedule(text):
+    """把上课时间文本解析为 TimeSlot 列表，无法解析时抛出 ScheduleParseError
+
+    没有写明周次的时段沿用文本中唯一的周次范围，否则默认为 1-16 周。
+    """
+    segments = [segment.strip() for segment in _SEGMENT_SEP.split(text or '') if segment.strip()]
+    if not segments:
+        raise ScheduleParseError('上课时间不能为空')
+
+    week_matches = [_WEEKS_RE.search(segment) for segment in segments]
+    given = {_parse_weeks(match) for match in week_matches if match}
+    default_weeks = given.pop() if len(given) == 1 else DEFAULT_WEEKS
+
+    slots = []
+    for segment, week_match in zip(segments, week_matches):
+        weeks = _parse_weeks(week_match) if week_match else default_weeks
+        rest = _WEEKS_RE.sub(' ', segment)
+        weekdays = [_WEEKDAYS[day] for day in _WEEKDAY_RE.findall(rest)]
+        if not weekdays:
+            raise ScheduleParseError(f'“{segment}”中缺少星期')
+
+        times = _TIMES_RE.search(rest)
+        periods = _PERIODS_RE.search(rest)
+        if times:
+            start_hour, start_minute, end_hour, end_minute = map(int, times.groups())
+            start_period, end_period = _periods_for_times(
+                start_hour * 60 + start_minute, end_hour * 60 + end_minute
+            )
+        elif periods:
+            start_period = int(periods.group(1))
+            end_period = int(periods.group(2) or start_period)
+        else:
+            raise ScheduleParseError(f'“{segment}”中缺少节次或时间')
+        if not 1 <= start_period <= end_period <= len(PERIOD_TIMES):
+            raise ScheduleParseError(f'节次应在 1-{len(PERIOD_TIMES)} 之间')
+
+        for weekday in weekdays:
+            slots.append(TimeSlot(weekday, start_period, end_period, *weeks))
+    return slots
+
+
+def sync_time_slots(course_class):
+    """按 schedule 重建班次的 ClassTimeSlot，无法解析时清空并返回 False"""
+    try:
+        slots = parse_schedule(course_class.schedule)
+    except ScheduleParseError:
+        slots = []
+    ClassTimeSlot.objects.filter(course_class_id=course_class.pk).delete()
+    ClassTimeSlot.objects.bulk_create([
+        ClassTimeSlot(course_class_id=course_class.pk, **slot._asdict()) for slot in slots
+    ])
+    return bool(slots)
+
+
+class TimetableIndex:
+    """一个人的课表区间索引"""
+
+    def __init__(self, entries=()):
+        # (星期, 周次) -> [开始节次列表, 结束节次列表, 各区间包含的（班次 id, 开始, 结束）]，
+        # 区间互不重叠
+        self._days = {}
+        for course_class_id, slot in entries:
+            self.add(course_class_id, slot)
+
+    def add(self, course_class_id, slot):
+        for week in range(slot.start_week, slot.end_week + 1):
+            starts, ends, owners = self._days.setdefault((slot.weekday, week), ([], [], []))
+            start, end = slot.start_period, slot.end_period
+            ids = ((course_class_id, start, end),)
+            # 与新区间重叠的区间是紧挨在插入位置之前的一段，逐个合并
+            i = bisect_right(starts, end)
+            while i > 0 and ends[i - 1] >= start:
+                i -= 1
+                start = min(start, starts.pop(i))
+                end = max(end, ends.pop(i))
+                ids = owners.pop(i) + ids
+            starts.insert(i, start)
+            ends.insert(i, end)
+            owners.insert(i, ids)
+
+    def find_clash(self, slot, exclude=None):
+        """返回与 slot 冲突的一个班次 id，没有冲突返回 None"""
+        for week in range(slot.start_week, slot.end_week + 1):
+            day = self._days.get((slot.weekday, week))
+            if not day:
+                continue
+            starts, ends, owners = day
+            i = bisect_right(starts, slot.end_period)
+            if i and ends[i - 1] >= slot.start_period:
+                # 合并区间内逐个核对原始区间，找出真正重叠的班次
+                for course_class_id, start, end in owners[i - 1]:
+                    if course_class_id != exclude and start <= slot.end_period and slot.start_period <= end:
+                        return course_class_id
+        return None
+
+
+def _slot_entries(queryset):
+    return [
+        (row[0], TimeSlot(*row[1:]))
+        for row in queryset.values_list('course_class_id', *TimeSlot._fields)
+    ]
+
+
+GENERATION_KEY = 'courses:timetable-generation'
+
+
+def _generation():
+    """课表索引的代号：随机值且永不过期，键被淘汰后重建也不会与旧代号重号"""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_timetable_generation():
+    """班次上课时间变化后调用，使全部缓存的课表索引失效"""
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def _cached_index(key, loader):
+    index = cache.get(key)
+    if index is None:
+        index = TimetableIndex(loader())
+        cache.set(key, index, TIMETABLE_CACHE_TIMEOUT)
+    return index
+
+
+def _student_key(student_id, generation=None):
+    if generation is None:
+        generation = _generation()
+    return f'courses:timetable:{generation}:student:{student_id}'
+
+
+def student_timetable(student_id):
+    """学生当前占用名额的选课（待审核、已通过）组成的课表索引"""
+    return _cached_index(_student_key(student_id), lambda: _slot_entries(ClassTimeSlot.objects.filter(
+        course_class__enrollments__student_id=student_id,
+        course_class__enrollments__status__in=Enrollment.SEAT_STATUSES,
+    )))
+
+
+def teacher_timetable(teacher_id):
+    """教师全部授课班次组成的课表索引"""
+    return _cached_index(
+        f'courses:timetable:{_generation()}:teacher:{teacher_id}',
+        lambda: _slot_entries(ClassTimeSlot.objects.filter(course_class__teacher_id=teacher_id)),
+    )
+
+
+def invalidate_student_timetable(*student_ids):
+    """使指定学生的课表索引失效"""
+    generation = _generation()
+    cache.delete_many([_student_key(student_id, generation) for student_id in student_ids])
+
+
+def find_schedule_clash(index, slots, exclude=None):
+    """slots 中任一时段与索引冲突时返回冲突的班次，否则返回 None"""
+    for slot in slots:
+        course_class_id = index.find_clash(slot, exclude=exclude)
+        if course_class_id is not None:
+            return CourseClass.objects.select_related('course').get(pk=course_class_id)
+    return None
+
+
+def check_schedule_conflict(student, course_class):
+    """学生的已选班次与 course_class 上课时间冲突时抛出 EnrollmentError"""
+    slots = [TimeSlot(*row) for row in course_class.time_slots.values_list(*TimeSlot._fields)]
+    clash = find_schedule_clash(student_timetable(student.pk), slots, exclude=course_class.pk)
+    if clash is not None:
+        raise EnrollmentError(f'该班次与已选的“{clash}”上课时间冲突。', code='clash')
@@ -0,0 +1,269 @@
+"""课程与班次的全文检索
+
+课程列表、班次列表原先用 icontains 搜索，即 LIKE '%x%'：课程每次都全表扫描，也
+搜不到课程描述；班次还要先连接课程表和用户表再扫描。这里为二者各维护一份
+倒排索引，每行是一篇反规范化的检索文档：
+
+- 课程（courses_course_search）：课程名称和代码、课程描述；
+- 班次（courses_class_search）：班次代码和所属课程的代码、名称，授课教师的用户名
+  和档案中的姓名，教室。
+
+SQLite 上是 FTS5 虚拟表（rowid 即主键），用 bm25 排序；PostgreSQL 上是 tsvector
+列加 GIN 索引，各列按权重 A、B、C 合并，用 ts_rank 排序。
+
+中文没有空格分词，统一切成二元组（bigram）：每段连续的字母数字切成相邻两字的
+词元，再补上末字的单字词元，“数据库”索引为“数据 据库 库”。查询词同样切成
+二元组并要求全部命中，单字查询按前缀匹配，因此任意子串都能搜到（二元组全部
+命中但顺序不同时也会命中，由排序靠后）。英文和课程代码按同样规则处理，大小写
+不敏感。
+
+索引由 signals 在相关记录保存、删除时同步，与业务写入在同一事务中；bulk_create
+等批量写入后需调用 index_courses / index_classes，或执行 manage.py
+rebuild_course_search。其他数据库或 SQLite 未编译 FTS5 时 search_course_ids /
+search_class_ids 返回 None，由调用方退回 icontains。
+"""
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+# 一次写入索引的行数
+INDEX_BATCH_SIZE = 2000
+
+_RUN_RE = re.compile(r'[^\W_]+')
+
+
+def search_limit():
+    return getattr(settings, 'COURSES_SEARCH_LIMIT', 1000)
+
+
+def _runs(text):
+    return _RUN_RE.findall((text or '').lower())
+
+
+def tokenize(text):
+    """索引用的词元：每段的相邻二元组加末字"""
+    tokens = []
+    for run in _runs(text):
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+    return tokens
+
+
+def query_terms(text):
+    """查询词元 [(词元, 是否前缀匹配)]，去重并保持顺序"""
+    terms = []
+    for run in _runs(text):
+        if len(run) == 1:
+            terms.append((run, True))
+        else:
+            terms.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+    return list(dict.fromkeys(terms))
+
+
+class SearchIndex:
+    """一张检索索引表：columns 为 [(列名, bm25 权重, tsvector 权重)]，行主键即被索引记录的主键"""
+
+    def __init__(self, table, key, target, columns):
+        self.table = table
+        self.key = key
+        self.target = target
+        self.columns = columns
+        # (数据库别名, 数据库名) -> 索引表是否存在
+        self._available = {}
+
+    def _availability_key(self, connection):
+        return connection.alias, connection.settings_dict['NAME']
+
+    def create(self, connection):
+        """建立索引表，数据库不支持时返回 False"""
+        names = [name for name, _, _ in self.columns]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                try:
+                    cursor.execute(
+                        f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+                        f"USING fts5({', '.join(names)}, tokenize='unicode61')"
+                    )
+                except DatabaseError:
+                    # 未编译 FTS5 扩展
+                    return False
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                    f'{self.key} bigint PRIMARY KEY REFERENCES {self.target} (id) ON DELETE CASCADE, '
+                    'document tsvector NOT NULL)'
+                )
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {self.table}_document ON {self.table} USING gin (document)'
+                )
+            else:
+                return False
+        self._available.pop(self._availability_key(connection), None)
+        return True
+
+    def drop(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+        self._available.pop(self._availability_key(connection), None)
+
+    def available(self, using='default'):
+        """当前数据库上是否已建立索引表"""
+        connection = connections[using]
+        key = self._availability_key(connection)
+        if key not in self._available:
+            self._available[key] = (
+                connection.vendor in ('sqlite', 'postgresql')
+                and self.table in connection.introspection.table_names()
+            )
+        return self._available[key]
+
+    def write(self, documents, using='default'):
+        """写入或替换文档 [(主键, 各列文本...)]，文本为空格分隔的词元"""
+        if not documents or not self.available(using):
+            return
+        connection = connections[using]
+        # 自动提交模式下 executemany 的每一行都会单独提交
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                names = ', '.join(name for name, _, _ in self.columns)
+                placeholders = ', '.join(['%s'] * len(self.columns))
+                cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in documents])
+                cursor.executemany(
+                    f'INSERT INTO {self.table} (rowid, {names}) VALUES (%s, {placeholders})', documents
+                )
+            else:
+                vector = ' || '.join(
+                    f"setweight(to_tsvector('simple', %s), '{weight}')" for _, _, weight in self.columns
+                )
+                cursor.executemany(
+                    f'INSERT INTO {self.table} ({self.key}, document) VALUES (%s, {vector}) '
+                    f'ON CONFLICT ({self.key}) DO UPDATE SET document = EXCLUDED.document',
+                    documents,
+                )
+
+    def remove(self, ids, using='default'):
+        if not ids or not self.available(using):
+            return
+        connection = connections[using]
+        column = 'rowid' if connection.vendor == 'sqlite' else self.key
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE {column} = %s', [(pk,) for pk in ids])
+
+    def clear(self, using='default'):
+        if self.available(using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.table}')
+
+    def search(self, text, limit=None, using='default'):
+        """按相关度排序的主键列表，同分时主键大的（较新的）在前
+
+        没有可检索的词元时返回空列表；索引不可用时返回 None。
+        """
+        if not self.available(using):
+            return None
+        terms = query_terms(text)
+        if not terms:
+            return []
+        if limit is None:
+            limit = search_limit()
+        connection = connections[using]
+        if connection.vendor == 'sqlite':
+            # 词元只含字母数字，加引号即可作为 FTS5 的短语
+            match = ' '.join(f'"{term}"*' if prefix else f'"{term}"' for term, prefix in terms)
+            weights = ', '.join(str(weight) for _, weight, _ in self.columns)
+            sql = (
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY bm25({self.table}, {weights}), rowid DESC LIMIT %s'
+            )
+        else:
+            match = ' & '.join(f"'{term}':*" if prefix else f"'{term}'" for term, prefix in terms)
+            sql = (
+                f"SELECT {self.key} FROM {self.table}, to_tsquery('simple', %s) query "
+                f'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, {self.key} DESC LIMIT %s'
+            )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, limit])
+            return [pk for pk, in cursor.fetchall()]
+
+
+COURSE_INDEX = SearchIndex('courses_course_search', 'course_id', 'courses_course', [
+    ('title', 10.0, 'A'),
+    ('body', 1.0, 'B'),
+])
+
+CLASS_INDEX = SearchIndex('courses_class_search', 'class_id', 'courses_courseclass', [
+    ('title', 10.0, 'A'),
+    ('people', 5.0, 'B'),
+    ('body', 1.0, 'C'),
+])
+
+COURSE_FIELDS = ('pk', 'course_name', 'course_code', 'description')
+CLASS_FIELDS = (
+    'pk', 'class_code', 'course__course_code', 'course__course_name',
+    'teacher__username', 'teacher__teacherprofile__name', 'classroom',
+)
+
+
+def _joined(*parts):
+    return ' '.join(tokenize(' '.join(part or '' for part in parts)))
+
+
+def _course_document(pk, name, code, description):
+    return pk, _joined(name, code), _joined(description)
+
+
+def _class_document(pk, class_code, course_code, course_name, username, teacher_name, classroom):
+    return pk, _joined(class_code, course_code, course_name), _joined(username, teacher_name), _joined(classroom)
+
+
+def _index_rows(index, queryset, fields, document):
+    using = queryset.db
+    if not index.available(using):
+        return 0
+    rows = queryset.order_by('pk').values_list(*fields)
+    indexed = 0
+    batch = []
+    for row in rows.iterator(chunk_size=INDEX_BATCH_SIZE):
+        batch.append(document(*row))
+        if len(batch) >= INDEX_BATCH_SIZE:
+            index.write(batch, using)
+            indexed += len(batch)
+            batch = []
+    index.write(batch, using)
+    return indexed + len(batch)
+
+
+def index_courses(queryset):
+    """（重新）索引 queryset 中的课程，返回索引的课程数"""
+    return _index_rows(COURSE_INDEX, queryset, COURSE_FIELDS, _course_document)
+
+
+def index_course(course, using='default'):
+    """单门课程保存后更新索引"""
+    COURSE_INDEX.write([
+        _course_document(course.pk, course.course_name, course.course_code, course.description),
+    ], using)
+
+
+def remove_courses(course_ids, using='default'):
+    COURSE_INDEX.remove(course_ids, using)
+
+
+def search_course_ids(text, limit=None, using='default'):
+    """按相关度排序的课程主键，索引不可用时返回 None"""
+    return COURSE_INDEX.search(text, limit, using)
+
+
+def index_classes(queryset):
+    """（重新）索引 queryset 中的班次，返回索引的班次数"""
+    return _index_rows(CLASS_INDEX, queryset, CLASS_FIELDS, _class_document)
+
+
+def remove_classes(class_ids, using='default'):
+    CLASS_INDEX.remove(class_ids, using)
+
+
+def search_class_ids(text, limit=None, using='default'):
+    """按相关度排序的班次主键，索引不可用时返回 None"""
+    return CLASS_INDEX.search(text, limit, using)
@@ -0,0 +1,215 @@
+"""选课名额预留
+
+名额的占用通过一条带条件的 UPDATE 完成（仅在 current_students < max_students 时
+自增），资格复查与选课记录的写入放在同一事务内，避免并发选课时超卖。
+
+热门班次可以开启分片计数（CourseClass.counter_shards > 0）：名额按分片均分，
+写入时随机挑选一个仍有余量的分片行，读取时求和，再由 fold_seat_counters
+定期把合计写回 current_students，从而把单行锁热点分散到多行。
+"""
+import random
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import CourseClass, Enrollment, SeatCounterShard
+from .snapshot import load_enrollment_snapshot
+
+User = get_user_model()
+
+# 每个学生最多同时拥有的待审核申请数
+MAX_PENDING_ENROLLMENTS = 5
+
+
+class EnrollmentError(Exception):
+    """选课失败，message 可直接展示给用户，code 标识失败原因"""
+
+    def __init__(self, message, code='invalid'):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def shard_quota(max_students, shards, shard):
+    """分片 shard 分到的名额数，余数分给编号靠前的分片"""
+    base, extra = divmod(max_students, shards)
+    return base + (1 if shard < extra else 0)
+
+
+def claim_seat(course_class):
+    """尝试占用一个名额，成功返回 True，班次已满返回 False"""
+    if course_class.counter_shards:
+        return _claim_sharded(course_class)
+    updated = CourseClass.objects.filter(
+        pk=course_class.pk,
+        current_students__lt=F('max_students'),
+    ).update(current_students=F('current_students') + 1)
+    return updated == 1
+
+
+def release_seat(course_class):
+    """释放一个名额，计数不会减到 0 以下"""
+    if course_class.counter_shards:
+        return _release_sharded(course_class)
+    updated = CourseClass.objects.filter(
+        pk=course_class.pk,
+        current_students__gt=0,
+    ).update(current_students=F('current_students') - 1)
+    return updated == 1
+
+
+def release_seats(course_class, count):
+    """一次释放最多 count 个名额，返回实际释放的数量"""
+    if count == 1:
+        return int(release_seat(course_class))
+    if course_class.counter_shards:
+        released = 0
+        while released < count and _release_sharded(course_class):
+            released += 1
+        return released
+    with transaction.atomic():
+        current = CourseClass.objects.select_for_update().values_list(
+            'current_students', flat=True
+        ).get(pk=course_class.pk)
+        released = min(count, current)
+        if released:
+            CourseClass.objects.filter(pk=course_class.pk).update(
+                current_students=F('current_students') - released
+            )
+    return released
+
+
+def _shuffled_shards(course_class):
+    shards = list(range(course_class.counter_shards))
+    random.shuffle(shards)
+    return shards
+
+
+def _claim_sharded(course_class):
+    shards = SeatCounterShard.objects.filter(course_class_id=course_class.pk)
+    for shard in _shuffled_shards(course_class):
+        quota = shard_quota(course_class.max_students, course_class.counter_shards, shard)
+        if shards.filter(shard=shard, count__lt=quota).update(count=F('count') + 1):
+            return True
+    return False
+
+
+def _release_sharded(course_class):
+    shards = SeatCounterShard.objects.filter(course_class_id=course_class.pk)
+    for shard in _shuffled_shards(course_class):
+        if shards.filter(shard=shard, count__gt=0).update(count=F('count') - 1):
+            return True
+    return False
+
+
+def seat_count(course_class):
+    """当前已占用的名额数；分片模式下读取各分片之和"""
+    if not course_class.counter_shards:
+        return CourseClass.objects.values_list('current_students', flat=True).get(pk=course_class.pk)
+    return SeatCounterShard.objects.filter(
+        course_class_id=course_class.pk
+    ).aggregate(total=Coalesce(Sum('count'), 0))['total']
+
+
+def fold_seat_counters(course_class_ids=None):
+    """把分片计数的合计写回 current_students，返回更新的班次数"""
+    totals = SeatCounterShard.objects.filter(
+        course_class=OuterRef('pk')
+    ).values('course_class').annotate(total=Sum('count')).values('total')
+    queryset = CourseClass.objects.filter(counter_shards__gt=0)
+    if course_class_ids is not None:
+        queryset = queryset.filter(pk__in=course_class_ids)
+    return queryset.update(
+        current_students=Coalesce(Subquery(totals, output_field=IntegerField()), 0)
+    )
+
+
+def set_counter_shards(course_class, shards):
+    """开启（shards > 0）或关闭（shards = 0）班次的分片计数
+
+    开启时按各分片的名额把当前人数依次填入分片；关闭时先把分片合计写回
+    current_students 再删除分片。
+    """
+    with transaction.atomic():
+        course_class = CourseClass.objects.select_for_update().get(pk=course_class.pk)
+        if course_class.counter_shards:
+            course_class.current_students = seat_count(course_class)
+        fill_seat_shards(course_class, shards)
+        course_class.counter_shards = shards
+        course_class.save(update_fields=['counter_shards', 'current_students'])
+    return course_class
+
+
+def fill_seat_shards(course_class, shards):
+    """按各分片的名额把 current_students 依次填入 shards 个分片，替换原有分片
+
+    调用方需持有班次行锁。
+    """
+    course_class.seat_shards.all().delete()
+    remaining = course_class.current_students
+    new_shards = []
+    for shard in range(shards):
+        count = min(remaining, shard_quota(course_class.max_students, shards, shard))
+        remaining -= count
+        new_shards.append(SeatCounterShard(course_class=course_class, shard=shard, count=count))
+    # 超出名额的部分（历史超卖）记在第一个分片上，保证合计不变
+    if new_shards and remaining:
+        new_shards[0].count += remaining
+    SeatCounterShard.objects.bulk_create(new_shards)
+
+
+def check_eligibility(student, course_class, snapshot=None):
+    """检查学生是否可以选择该班次，不满足条件时抛出 EnrollmentError
+
+    snapshot 为空时从数据库读取最新的选课快照。
+    """
+    if not course_class.is_active:
+        raise EnrollmentError('该课程班次已关闭，无法选课。', code='closed')
+
+    if snapshot is None:
+        snapshot = load_enrollment_snapshot(student.pk)
+
+    # 检查是否已选过该课程
+    if course_class.pk in snapshot.class_ids:
+        raise EnrollmentError('您已经选过这门课程了。', code='duplicate')
+
+    # 检查是否选过同一课程的其他班次
+    if course_class.course_id in snapshot.course_ids:
+        course_name = course_class.course.course_name
+        raise EnrollmentError(f'您已经选过《{course_name}》的其他班次了，不能重复选择同一门课程。', code='same_course')
+
+    # 限制每个学生最多同时有5个待处理申请
+    if snapshot.pending_count >= MAX_PENDING_ENROLLMENTS:
+        raise EnrollmentError(
+            f'您已有 {snapshot.pending_count} 个待处理的选课申请，请等待审核完成后再选课。',
+            code='pending_limit',
+        )
+
+
+def reserve_seat(student, course_class, remarks=None):
+    """原子地占用名额并创建选课记录
+
+    先执行条件 UPDATE 占用名额（同时拿到班次行的写锁），再锁定学生行并在同一
+    事务内复查资格；任何一步失败都会回滚，已占用的名额随之释放。
+    """
+    with transaction.atomic():
+        if not claim_seat(course_class):
+            raise EnrollmentError('该课程班次已满，无法选课。', code='full')
+
+        # 同一学生的并发请求在此串行化，保证资格复查的结果有效
+        list(User.objects.select_for_update().filter(pk=student.pk).values_list('pk', flat=True))
+        check_eligibility(student, course_class)
+
+        try:
+            with transaction.atomic():
+                enrollment = Enrollment.objects.create(
+                    student=student,
+                    course_class=course_class,
+                    remarks=remarks,
+                )
+        except IntegrityError:
+            raise EnrollmentError('您已经选过这门课程了。', code='duplicate')
+
+    return enrollment
@@ -0,0 +1,245 @@
+"""courses 应用的信号处理
+
+Enrollment 的 post_save / post_delete 只覆盖逐条写入；bulk_create、
+QuerySet.update() 等批量写入不会触发模型信号，需要由调用方在事务提交后
+发送 enrollments_bulk_changed。
+
+CourseClass 保存时按 schedule 重建结构化的上课时段，并使缓存的课表索引换代。
+
+课程、班次以及授课教师的用户名、档案保存或删除时，在同一事务中同步全文检索
+索引（见 courses.search）。
+
+列表总数的缓存在对应模型的记录变化提交后失效；教师、学生仪表板的缓存片段在相关的选课记录、班次、课程变化提交后失效；
+启用物化的仪表板统计时，用户、课程、选课记录的增删改在提交后增量更新
+DashboardStats（见 courses.dashboard）。
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from users.models import TeacherProfile
+
+from .counts import bump_count_version
+from .dashboard import (
+    ENROLLMENT_STATUS_FIELDS, USER_TYPE_FIELDS, add_delta, apply_stats_delta, enrollment_status_deltas,
+    invalidate_class_dashboards, invalidate_enrollment_dashboards, materialized_stats_enabled,
+)
+from .models import Course, CourseClass, Enrollment
+from .schedule import bump_timetable_generation, invalidate_student_timetable, sync_time_slots
+from .search import index_classes, index_course, remove_classes, remove_courses
+from .snapshot import invalidate_enrollment_snapshot
+
+User = get_user_model()
+
+# 批量修改选课记录后发送，参数：student_ids、class_ids，以及可选的
+# status_counts（{选课状态: 增减数}，用于更新仪表板统计）
+enrollments_bulk_changed = Signal()
+
+
+@receiver([post_save, post_delete], sender=Enrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    # 事务提交后再失效，避免其他请求在提交前把旧数据重新写回缓存
+    student_id, class_id = instance.student_id, instance.course_class_id
+
+    def invalidate():
+        _invalidate_students(student_id)
+        invalidate_enrollment_dashboards({student_id}, {class_id})
+    transaction.on_commit(invalidate)
+
+
+@receiver(enrollments_bulk_changed)
+def enrollments_bulk_changed_handler(sender, student_ids=(), class_ids=(), status_counts=None, **kwargs):
+    if student_ids:
+        _invalidate_students(*student_ids)
+    if student_ids or class_ids:
+        invalidate_enrollment_dashboards(student_ids, class_ids)
+    bump_count_version(Enrollment)
+    if status_counts and materialized_stats_enabled():
+        apply_stats_delta(enrollment_status_deltas(status_counts))
+
+
+def _invalidate_students(*student_ids):
+    invalidate_enrollment_snapshot(*student_ids)
+    invalidate_student_timetable(*student_ids)
+
+
+@receiver(pre_save, sender=CourseClass)
+def course_class_pre_save(sender, instance, update_fields=None, **kwargs):
+    # 更换授课教师时，原教师的仪表板也要失效
+    instance._previous_teacher_id = None
+    if not instance._state.adding and (update_fields is None or 'teacher' in update_fields):
+        instance._previous_teacher_id = CourseClass.objects.filter(
+            pk=instance.pk
+        ).values_list('teacher_id', flat=True).first()
+
+
+@receiver(post_save, sender=CourseClass)
+def course_class_saved(sender, instance, update_fields=None, **kwargs):
+    class_id = instance.pk
+    teacher_ids = {instance.teacher_id, getattr(instance, '_previous_teacher_id', None)} - {None}
+    # 只改计数等字段时，学生仪表板上展示的班次信息不变
+    with_students = update_fields is None
+    transaction.on_commit(lambda: invalidate_class_dashboards({class_id}, teacher_ids, with_students))
+
+    # 计数等字段的局部更新不涉及上课时间
+    if update_fields is not None and 'schedule' not in update_fields:
+        return
+    sync_time_slots(instance)
+    transaction.on_commit(bump_timetable_generation)
+
+
+@receiver(post_delete, sender=CourseClass)
+def course_class_deleted(sender, instance, **kwargs):
+    # 该班次的选课记录已被级联删除，学生的仪表板由 Enrollment 的信号失效
+    class_id, teacher_ids = instance.pk, {instance.teacher_id}
+    transaction.on_commit(
+        lambda: invalidate_class_dashboards((), teacher_ids, with_students=False, deleted_ids={class_id})
+    )
+    transaction.on_commit(bump_timetable_generation)
+
+
+@receiver(post_save, sender=Course)
+def course_changed(sender, instance, created, **kwargs):
+    if created:
+        return
+    course_id = instance.pk
+
+    def invalidate():
+        rows = list(CourseClass.objects.filter(course_id=course_id).values_list('pk', 'teacher_id'))
+        invalidate_class_dashboards({pk for pk, _ in rows}, {teacher_id for _, teacher_id in rows})
+    transaction.on_commit(invalidate)
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(set(fields) & set(update_fields))
+
+
+@receiver(post_save, sender=Course)
+def course_search_saved(sender, instance, created, using, update_fields=None, **kwargs):
+    # 只改人数等字段时索引内容不变
+    if not _touches(update_fields, ('course_name', 'course_code', 'description')):
+        return
+    index_course(instance, using)
+    # 班次的检索文档里有课程的代码和名称
+    if not created and _touches(update_fields, ('course_name', 'course_code')):
+        index_classes(CourseClass.objects.using(using).filter(course_id=instance.pk))
+
+
+@receiver(post_delete, sender=Course)
+def course_search_deleted(sender, instance, using, **kwargs):
+    remove_courses([instance.pk], using)
+
+
+@receiver(post_save, sender=CourseClass)
+def class_search_saved(sender, instance, using, update_fields=None, **kwargs):
+    if _touches(update_fields, ('class_code', 'classroom', 'course', 'teacher')):
+        index_classes(CourseClass.objects.using(using).filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=CourseClass)
+def class_search_deleted(sender, instance, using, **kwargs):
+    remove_classes([instance.pk], using)
+
+
+@receiver(post_save, sender=User)
+def teacher_search_saved(sender, instance, created, using, update_fields=None, **kwargs):
+    # 登录只更新 last_login；新用户还没有班次
+    if created or instance.user_type != 'teacher' or not _touches(update_fields, ('username',)):
+        return
+    index_classes(CourseClass.objects.using(using).filter(teacher_id=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=TeacherProfile)
+def teacher_profile_search_changed(sender, instance, using, update_fields=None, **kwargs):
+    if _touches(update_fields, ('name',)):
+        index_classes(CourseClass.objects.using(using).filter(teacher_id=instance.user_id))
+
+
+def _remember_previous(model, instance, field, update_fields):
+    """记录保存前数据库中的字段值，只在统计启用且该字段可能变化时查询"""
+    instance._dashboard_previous = None
+    if not materialized_stats_enabled() or instance._state.adding:
+        return
+    if update_fields is not None and field not in update_fields:
+        return
+    instance._dashboard_previous = model.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+def _on_commit_delta(deltas):
+    if any(deltas.values()):
+        transaction.on_commit(lambda: apply_stats_delta(deltas))
+
+
+def _saved_deltas(fields, total_field, created, previous, current):
+    deltas = {}
+    if created:
+        add_delta(deltas, total_field, 1)
+        add_delta(deltas, fields.get(current), 1)
+    elif previous is not None and previous != current:
+        add_delta(deltas, fields.get(previous), -1)
+        add_delta(deltas, fields.get(current), 1)
+    return deltas
+
+
+@receiver(pre_save, sender=User)
+def user_pre_save(sender, instance, update_fields=None, **kwargs):
+    _remember_previous(User, instance, 'user_type', update_fields)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if materialized_stats_enabled():
+        _on_commit_delta(_saved_deltas(
+            USER_TYPE_FIELDS, 'total_users', created, getattr(instance, '_dashboard_previous', None),
+            instance.user_type,
+        ))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    if materialized_stats_enabled():
+        _on_commit_delta(add_delta({'total_users': -1}, USER_TYPE_FIELDS.get(instance.user_type), -1))
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, **kwargs):
+    if created and materialized_stats_enabled():
+        _on_commit_delta({'total_courses': 1})
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    if materialized_stats_enabled():
+        _on_commit_delta({'total_courses': -1})
+
+
+@receiver(pre_save, sender=Enrollment)
+def enrollment_pre_save(sender, instance, update_fields=None, **kwargs):
+    _remember_previous(Enrollment, instance, 'status', update_fields)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_stats_saved(sender, instance, created, **kwargs):
+    if materialized_stats_enabled():
+        _on_commit_delta(_saved_deltas(
+            ENROLLMENT_STATUS_FIELDS, None, created, getattr(instance, '_dashboard_previous', None),
+            instance.status,
+        ))
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_stats_deleted(sender, instance, **kwargs):
+    if materialized_stats_enabled():
+        _on_commit_delta(add_delta({}, ENROLLMENT_STATUS_FIELDS.get(instance.status), -1))
+
+
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=CourseClass)
+@receiver([post_save, post_delete], sender=Enrollment)
+@receiver([post_save, post_delete], sender=User)
+def list_rows_changed(sender, instance, update_fields=None, **kwargs):
+    # 登录时只更新 last_login，不影响任何列表的总数
+    if sender is User and update_fields is not None and 'user_type' not in update_fields:
+        return
+    transaction.on_commit(lambda: bump_count_version(sender))
@@ -0,0 +1,58 @@
+"""学生选课状态快照
+
+一次查询取出学生的全部选课记录，得到已选班次、已选课程（不含被拒绝的）和
+待审核申请数，供选课资格检查使用。快照在请求内复用，并缓存在 Django 缓存
+中；该学生的 Enrollment 有任何变化时由 signals 中的处理函数使缓存失效。
+选课记录也由排队 worker、管理命令等其他进程写入，缓存必须是各进程共享的
+后端（见 settings.CACHES），否则失效只对写入的进程可见。
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .models import Enrollment
+
+SNAPSHOT_CACHE_TIMEOUT = 300
+
+EnrollmentSnapshot = namedtuple('EnrollmentSnapshot', ['class_ids', 'course_ids', 'pending_count'])
+
+
+def _cache_key(student_id):
+    return f'courses:enrollment-snapshot:{student_id}'
+
+
+def load_enrollment_snapshot(student_id):
+    """直接从数据库读取快照（一条查询，不经过缓存）"""
+    class_ids = set()
+    course_ids = set()
+    pending_count = 0
+    for class_id, course_id, status in Enrollment.objects.filter(
+        student_id=student_id
+    ).values_list('course_class_id', 'course_class__course_id', 'status'):
+        class_ids.add(class_id)
+        if status != 'rejected':
+            course_ids.add(course_id)
+        if status == 'pending':
+            pending_count += 1
+    return EnrollmentSnapshot(frozenset(class_ids), frozenset(course_ids), pending_count)
+
+
+def get_enrollment_snapshot(student, request=None):
+    """获取学生的选课快照，优先使用请求内和缓存中的结果"""
+    if request is not None and getattr(request, '_enrollment_snapshot', None) is not None:
+        return request._enrollment_snapshot
+
+    key = _cache_key(student.pk)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = load_enrollment_snapshot(student.pk)
+        cache.set(key, snapshot, SNAPSHOT_CACHE_TIMEOUT)
+
+    if request is not None:
+        request._enrollment_snapshot = snapshot
+    return snapshot
+
+
+def invalidate_enrollment_snapshot(*student_ids):
+    """使指定学生的快照缓存失效"""
+    cache.delete_many([_cache_key(student_id) for student_id in student_ids])
@@ -1,3 +1,1606 @@
-from django.test import TestCase
+import csv
+import io
+import multiprocessing
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import StudentProfile, TeacherProfile
+
+from .allocation import allocate_seats, run_allocation
+from .batching import EnrollmentRequest, apply_enrollment_batch
+from .checks import production_cache_check
+from .counts import bump_count_version, estimated_row_count
+from .dashboard import (
+    admin_dashboard_stats, compute_admin_stats, dashboard_cache_stats, rebuild_dashboard_stats,
+    reset_dashboard_cache_stats,
+)
+from .deletion import drain_deletion_jobs
+from .export import FORMATS
+from .forms import CourseClassForm
+from .models import (
+    AllocationRound, Course, CourseClass, DashboardStats, DeletionJob, Enrollment, EnrollmentPreference,
+    EnrollmentTicket, SeatCounterShard, WaitlistEntry,
+)
+from .queueing import drain_queue, enqueue_enrollment
+from .recommend import build_recommendations, recommend_classes
+from .reconcile import reconcile_counters
+from .schedule import TimeSlot, TimetableIndex, bump_timetable_generation, parse_schedule, student_timetable
+from .search import query_terms, search_class_ids, search_course_ids, tokenize
+from .snapshot import get_enrollment_snapshot
+from .transitions import bulk_transition, cancel_enrollment, transition_enrollment
+from .waitlist import join_waitlist, release_seats_and_promote, waitlist_position
+from .seats import (
+    EnrollmentError, claim_seat, fold_seat_counters, release_seat, reserve_seat,
+    seat_count, set_counter_shards,
+)
+
+User = get_user_model()
+
+# 进程内缓存，只用于模拟缓存不在各进程间共享的情形
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def split_queries(queries):
+    """把捕获的查询分为 (业务查询数, 缓存查询数)
+
+    查询数测试跑在配置的缓存后端上；数据库缓存的读写（含其事务的保存点）单独计数，
+    使用 Redis 时缓存查询数为 0。
+    """
+    cache_table = settings.CACHES['default'].get('LOCATION')
+    cached = sum(
+        cache_table in query['sql'] or query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+        for query in queries
+    )
+    return len(queries) - cached, cached
+
+
+def run_concurrently(target, args_list):
+    """为每组参数启动一个线程并等待全部结束，返回每个线程的结果或异常"""
+    results = [None] * len(args_list)
+    barrier = threading.Barrier(len(args_list))
+
+    def worker(index, args):
+        try:
+            barrier.wait()
+            results[index] = target(*args)
+        except Exception as e:
+            results[index] = e
+        finally:
+            connection.close()
+
+    threads = [
+        threading.Thread(target=worker, args=(i, args))
+        for i, args in enumerate(args_list)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class CourseDataMixin:
+    def setUp(self):
+        super().setUp()
+        # 快照等缓存按主键索引，测试之间主键会被复用
+        cache.clear()
+
+    def make_teacher(self, username='teacher'):
+        return User.objects.create_user(username=username, password='x', user_type='teacher')
+
+    def make_students(self, count, prefix='student'):
+        User.objects.bulk_create([
+            User(username=f'{prefix}{i}', user_type='student') for i in range(count)
+        ])
+        return list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+    def make_class(self, teacher, max_students=50, code='C001', course=None):
+        if course is None:
+            course = Course.objects.create(
+                course_code=code, course_name=f'课程{code}', semester='秋季', academic_year='2024'
+            )
+        return CourseClass.objects.create(
+            course=course, teacher=teacher, class_code=f'{code}-01',
+            classroom='A101', schedule='周一 1-2节', max_students=max_students,
+        )
+
+
+class ReserveSeatTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = self.make_teacher()
+        self.course_class = self.make_class(self.teacher, max_students=1)
+        self.student, self.other = self.make_students(2)
+
+    def test_reserve_claims_seat(self):
+        reserve_seat(self.student, self.course_class)
+        self.course_class.refresh_from_db()
+        self.assertEqual(self.course_class.current_students, 1)
+
+    def test_full_class_rejected_without_side_effects(self):
+        reserve_seat(self.student, self.course_class)
+        with self.assertRaises(EnrollmentError):
+            reserve_seat(self.other, self.course_class)
+        self.course_class.refresh_from_db()
+        self.assertEqual(self.course_class.current_students, 1)
+        self.assertEqual(Enrollment.objects.count(), 1)
+
+    def test_ineligible_student_releases_seat(self):
+        self.course_class.max_students = 5
+        self.course_class.save()
+        reserve_seat(self.student, self.course_class)
+        with self.assertRaises(EnrollmentError):
+            reserve_seat(self.student, self.course_class)
+        self.course_class.refresh_from_db()
+        self.assertEqual(self.course_class.current_students, 1)
+
+
+class ShardedSeatCounterTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course_class = self.make_class(self.make_teacher(), max_students=10)
+        self.course_class.current_students = 3
+        self.course_class.save()
+
+    def test_enable_keeps_total(self):
+        course_class = set_counter_shards(self.course_class, 4)
+        self.assertEqual(course_class.seat_shards.count(), 4)
+        self.assertEqual(seat_count(course_class), 3)
+
+    def test_claims_stop_at_capacity(self):
+        course_class = set_counter_shards(self.course_class, 4)
+        claimed = sum(claim_seat(course_class) for _ in range(20))
+        self.assertEqual(claimed, 7)
+        self.assertEqual(seat_count(course_class), 10)
+
+    def test_fold_and_disable(self):
+        course_class = set_counter_shards(self.course_class, 3)
+        claim_seat(course_class)
+        release_seat(course_class)
+        release_seat(course_class)
+        fold_seat_counters()
+        course_class.refresh_from_db()
+        self.assertEqual(course_class.current_students, 2)
+
+        course_class = set_counter_shards(course_class, 0)
+        self.assertEqual(course_class.seat_shards.count(), 0)
+        self.assertEqual(course_class.current_students, 2)
+
+
+class SharedCacheTests(TestCase):
+    def test_versions_survive_many_entries(self):
+        cache.set('courses:timetable-generation', 'v1', None)
+        cache.set_many({f'courses:timetable:{i}': i for i in range(400)})
+        cache.set('courses:timetable:last', 0)
+        self.assertEqual(cache.get('courses:timetable-generation'), 'v1')
+
+    def test_deploy_check_requires_redis(self):
+        self.assertEqual([error.id for error in production_cache_check(None)], ['courses.E001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://x'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(production_cache_check(None), [])
+
+
+class EnrollmentSnapshotTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course_class = self.make_class(self.make_teacher())
+        self.student = self.make_students(1)[0]
+
+    def test_snapshot_is_one_query_and_cached(self):
+        with CaptureQueriesContext(connection) as queries:
+            get_enrollment_snapshot(self.student)
+        self.assertEqual(split_queries(queries)[0], 1)
+        with CaptureQueriesContext(connection) as queries:
+            snapshot = get_enrollment_snapshot(self.student)
+        business, cached = split_queries(queries)
+        self.assertEqual(business, 0)
+        self.assertLessEqual(cached, 1)
+        self.assertEqual(snapshot.pending_count, 0)
+
+    def test_enrollment_change_invalidates_snapshot(self):
+        get_enrollment_snapshot(self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_seat(self.student, self.course_class)
+
+        snapshot = get_enrollment_snapshot(self.student)
+        self.assertIn(self.course_class.pk, snapshot.class_ids)
+        self.assertIn(self.course_class.course_id, snapshot.course_ids)
+        self.assertEqual(snapshot.pending_count, 1)
+
+
+class ReconcileCountersTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        teacher = self.make_teacher()
+        self.first = self.make_class(teacher, max_students=10, code='C001')
+        self.second = self.make_class(teacher, max_students=10, code='C002', course=self.first.course)
+        students = self.make_students(4)
+        for student, course_class in zip(students, [self.first, self.first, self.second, self.second]):
+            reserve_seat(student, course_class)
+        Enrollment.objects.filter(student=students[3]).update(status='rejected')
+
+    def test_reports_drift_without_fixing(self):
+        drifts = []
+        result = reconcile_counters(chunk_size=1, on_drift=drifts.append)
+
+        self.assertEqual(result.classes_checked, 2)
+        self.assertEqual(
+            [(d.model, d.pk, d.recorded, d.actual) for d in drifts],
+            [(CourseClass, self.second.pk, 2, 1), (Course, self.first.course_id, 0, 3)],
+        )
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.current_students, 2)
+
+    def test_fix_writes_counts_back(self):
+        sharded = set_counter_shards(self.first, 4)
+        SeatCounterShard.objects.filter(course_class=sharded).update(count=3)
+
+        result = reconcile_counters(fix=True, chunk_size=1)
+
+        self.assertEqual(result.drifted, 3)
+        self.assertEqual(seat_count(sharded), 2)
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.current_students, 1)
+        self.assertEqual(Course.objects.get().current_students, 3)
+        self.assertEqual(reconcile_counters().drifted, 0)
+
+
+class ScheduleTests(CourseDataMixin, TestCase):
+    def test_parse_schedule(self):
+        self.assertEqual(parse_schedule('周一/周三 8:00-10:00, 周五 第5节 3-12周'), [
+            TimeSlot(1, 1, 2, 3, 12), TimeSlot(3, 1, 2, 3, 12), TimeSlot(5, 5, 5, 3, 12),
+        ])
+        with self.assertRaises(ValueError):
+            parse_schedule('待定')
+
+    def test_index_merges_overlapping_intervals(self):
+        index = TimetableIndex([
+            (1, TimeSlot(1, 1, 2, 1, 16)),
+            (2, TimeSlot(1, 2, 4, 9, 16)),
+            (3, TimeSlot(1, 7, 8, 1, 8)),
+        ])
+        self.assertIsNone(index.find_clash(TimeSlot(1, 3, 4, 1, 8)))
+        self.assertEqual(index.find_clash(TimeSlot(1, 4, 5, 1, 16)), 2)
+        self.assertEqual(index.find_clash(TimeSlot(1, 2, 2, 10, 10), exclude=1), 2)
+        self.assertIsNone(index.find_clash(TimeSlot(2, 1, 12, 1, 16)))
+
+    def test_enroll_rejects_clash(self):
+        teacher = self.make_teacher()
+        first = self.make_class(teacher, code='C001')
+        second = self.make_class(teacher, code='C002')
+        student = self.make_students(1)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_seat(student, first)
+
+        self.client.force_login(student)
+        response = self.client.post(
+            reverse('courses:enroll_course', args=[second.id]), {'course_class': second.id}
+        )
+        self.assertRedirects(response, reverse('courses:class_detail', args=[second.id]))
+        self.assertFalse(Enrollment.objects.filter(course_class=second).exists())
+
+    def test_class_form_rejects_teacher_clash(self):
+        teacher = self.make_teacher()
+        existing = self.make_class(teacher)
+        self.assertEqual(existing.time_slots.count(), 1)
+        form = CourseClassForm(data={
+            'course': existing.course_id, 'teacher': teacher.pk, 'class_code': 'C001-02',
+            'classroom': 'A102', 'schedule': '周一 2-3节', 'max_students': 30,
+        })
+        self.assertIn('schedule', form.errors)
+
+    def test_class_form_accepts_unparsed_schedule(self):
+        teacher = self.make_teacher()
+        existing = self.make_class(teacher)
+        CourseClass.objects.filter(pk=existing.pk).update(schedule='-')
+        existing.refresh_from_db()
+        form = CourseClassForm(instance=existing, data={
+            'course': existing.course_id, 'teacher': teacher.pk, 'class_code': existing.class_code,
+            'classroom': 'A102', 'schedule': '-', 'max_students': 30,
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertFalse(existing.time_slots.exists())
+
+
+    def test_generation_never_reverts(self):
+        course_class = self.make_class(self.make_teacher())
+        student = self.make_students(1)[0]
+        stale = student_timetable(student.pk)
+        bump_timetable_generation()
+        # 代号键被淘汰后重建的代号与此前任何一代都不同，旧索引不会重新生效
+        cache.delete('courses:timetable-generation')
+        reserve_seat(student, course_class)
+        self.assertIsNone(stale.find_clash(TimeSlot(1, 1, 2, 1, 16)))
+        self.assertIsNotNone(student_timetable(student.pk).find_clash(TimeSlot(1, 1, 2, 1, 16)))
+
+
+class AllocationTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        teacher = self.make_teacher()
+        self.popular = self.make_class(teacher, max_students=1, code='C001')
+        self.backup = self.make_class(teacher, max_students=5, code='C002', course=self.popular.course)
+        self.other = self.make_class(teacher, max_students=5, code='C003')
+        self.other.schedule = '周三 3-4节'
+        self.other.save()
+        now = timezone.now()
+        self.round = AllocationRound.objects.create(
+            name='第一轮', opens_at=now - timedelta(hours=1), closes_at=now + timedelta(hours=1)
+        )
+        self.round.classes.set([self.popular, self.backup, self.other])
+        self.students = self.make_students(3)
+
+    def prefer(self, student, *classes):
+        EnrollmentPreference.objects.bulk_create([
+            EnrollmentPreference(allocation_round=self.round, student=student, course_class=c, rank=rank)
+            for rank, c in enumerate(classes, start=1)
+        ])
+
+    def test_allocate_seats_follows_priority(self):
+        import numpy as np
+        # 三个申请者都把班次 0 放在第一位，班次 0 只有一个名额
+        won = allocate_seats(
+            np.array([0, 2, 4]), np.array([0, 1, 0, 1, 0, 1]), np.array([2, 0, 1]), np.array([1, 1]),
+        )
+        self.assertEqual(won.tolist(), [False, False, True, False, False, True])
+
+    def test_run_allocation_writes_enrollments_and_counters(self):
+        for student in self.students:
+            self.prefer(student, self.popular, self.backup, self.other)
+        reserve_seat(self.students[2], self.other)
+
+        result = run_allocation(self.round, seed=1)
+
+        self.assertEqual(result.enrolled, 5)
+        self.assertEqual(Enrollment.objects.filter(course_class=self.popular).count(), 1)
+        self.assertEqual(Enrollment.objects.filter(course_class=self.backup).count(), 2)
+        self.assertEqual(Enrollment.objects.filter(course_class=self.other).count(), 3)
+        # 每门课程最多一个班次
+        self.assertEqual(Enrollment.objects.filter(course_class__course=self.popular.course).values('student').distinct().count(), 3)
+        self.assertEqual(reconcile_counters().classes_drifted, 0)
+        self.round.refresh_from_db()
+        self.assertEqual(self.round.status, 'allocated')
+        with self.assertRaises(EnrollmentError):
+            run_allocation(self.round)
+
+    def test_run_allocation_skips_schedule_clashes(self):
+        # 与 popular、backup 同为周一 1-2 节
+        clashing = self.make_class(self.popular.teacher, max_students=5, code='C004')
+        self.round.classes.add(clashing)
+        first, second, third = self.students
+        self.prefer(first, clashing, self.popular)
+        self.prefer(second, self.popular, clashing)
+        # 已选的班次与志愿冲突
+        reserve_seat(third, self.backup)
+        self.prefer(third, clashing)
+
+        run_allocation(self.round, seed=1)
+
+        for student in self.students:
+            self.assertEqual(Enrollment.objects.filter(student=student).count(), 1)
+        self.assertTrue(Enrollment.objects.filter(student=first, course_class=clashing).exists())
+        self.assertTrue(Enrollment.objects.filter(student=second, course_class=self.popular).exists())
+        self.assertEqual(reconcile_counters().classes_drifted, 0)
+
+    def test_preferences_view_replaces_choices(self):
+        self.client.force_login(self.students[0])
+        url = reverse('courses:allocation_preferences', args=[self.round.id])
+        self.client.post(url, {'choice_1': self.popular.id, 'choice_2': self.backup.id})
+        self.client.post(url, {'choice_1': self.other.id})
+        self.assertEqual(
+            list(EnrollmentPreference.objects.values_list('course_class_id', 'rank')), [(self.other.id, 1)]
+        )
+        self.assertFalse(Enrollment.objects.exists())
+
+
+class GroupCommitBatchTests(CourseDataMixin, TestCase):
+    def test_batch_applies_rules_in_order(self):
+        teacher = self.make_teacher()
+        small = self.make_class(teacher, max_students=2, code='C001')
+        other_section = self.make_class(teacher, max_students=10, code='C002')
+        other_section.course = small.course
+        other_section.save()
+        a, b, c = self.make_students(3)
+
+        results = apply_enrollment_batch([
+            EnrollmentRequest(a, small),
+            EnrollmentRequest(a, other_section),
+            EnrollmentRequest(b, small),
+            EnrollmentRequest(c, small),
+        ])
+
+        self.assertIsInstance(results[0], Enrollment)
+        self.assertIsInstance(results[1], EnrollmentError)
+        self.assertIsInstance(results[2], Enrollment)
+        self.assertIsInstance(results[3], EnrollmentError)
+        small.refresh_from_db()
+        self.assertEqual(small.current_students, 2)
+        self.assertEqual(Enrollment.objects.count(), 2)
+
+
+class WaitlistTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course_class = self.make_class(self.make_teacher(), max_students=2)
+        self.students = self.make_students(5)
+        for student in self.students[:2]:
+            reserve_seat(student, self.course_class)
+        self.course_class.refresh_from_db()
+
+    def test_join_requires_full_class(self):
+        self.course_class.max_students = 3
+        self.course_class.save()
+        with self.assertRaises(EnrollmentError):
+            join_waitlist(self.students[2], self.course_class)
+
+    def test_positions_follow_join_order(self):
+        entries = [join_waitlist(s, self.course_class) for s in self.students[2:]]
+        self.assertEqual([waitlist_position(e) for e in entries], [1, 2, 3])
+        with self.assertRaises(EnrollmentError):
+            join_waitlist(self.students[2], self.course_class)
+
+    def test_cancel_promotes_head(self):
+        head = join_waitlist(self.students[2], self.course_class)
+        join_waitlist(self.students[3], self.course_class)
+        enrollment = Enrollment.objects.get(student=self.students[0])
+
+        self.client.force_login(self.students[0])
+        self.client.post(reverse('courses:enrollment_cancel', args=[enrollment.id]))
+
+        head.refresh_from_db()
+        self.assertEqual(head.status, 'promoted')
+        self.assertEqual(head.enrollment.student, self.students[2])
+        self.course_class.refresh_from_db()
+        self.assertEqual(self.course_class.current_students, 2)
+        self.assertEqual(WaitlistEntry.objects.filter(status='waiting').count(), 1)
+
+    def test_promotion_skips_schedule_clash(self):
+        head = join_waitlist(self.students[2], self.course_class)
+        join_waitlist(self.students[3], self.course_class)
+        # 加入候补后选了同一时间的另一门课
+        reserve_seat(self.students[2], self.make_class(self.course_class.teacher, code='C002'))
+
+        release_seats_and_promote(self.course_class)
+
+        head.refresh_from_db()
+        self.assertEqual(head.status, 'cancelled')
+        self.assertTrue(Enrollment.objects.filter(student=self.students[3], course_class=self.course_class).exists())
+        self.assertFalse(Enrollment.objects.filter(student=self.students[2], course_class=self.course_class).exists())
+
+    def test_promotion_is_batched(self):
+        for student in self.students[2:]:
+            join_waitlist(student, self.course_class)
+        Enrollment.objects.filter(student__in=self.students[:2]).update(status='dropped')
+
+        promoted = release_seats_and_promote(self.course_class, count=2)
+
+        self.assertEqual(promoted, 2)
+        self.assertEqual(
+            set(WaitlistEntry.objects.filter(status='promoted').values_list('student_id', flat=True)),
+            {self.students[2].pk, self.students[3].pk},
+        )
+        self.course_class.refresh_from_db()
+        self.assertEqual(self.course_class.current_students, 2)
+
+
+@override_settings(COURSES_ENROLLMENT_MODE='queued')
+class EnrollmentQueueTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course_class = self.make_class(self.make_teacher(), max_students=1)
+        self.first, self.second = self.make_students(2)
+
+    def test_enroll_view_returns_ticket(self):
+        self.client.force_login(self.first)
+        response = self.client.post(
+            reverse('courses:enroll_course', args=[self.course_class.id]),
+            {'course_class': self.course_class.id},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 202)
+        ticket_id = response.json()['ticket_id']
+        self.assertFalse(Enrollment.objects.exists())
+
+        status = self.client.get(reverse('courses:enrollment_ticket', args=[ticket_id])).json()
+        self.assertEqual(status['status'], 'queued')
+        self.assertEqual(status['position'], 1)
+
+    def test_drain_is_fifo_per_class(self):
+        first = enqueue_enrollment(self.first, self.course_class)
+        second = enqueue_enrollment(self.second, self.course_class)
+
+        self.assertEqual(drain_queue(), 2)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, 'admitted')
+        self.assertEqual(second.status, 'rejected')
+        self.assertEqual(first.enrollment.student, self.first)
+
+    def test_duplicate_ticket_rejected(self):
+        enqueue_enrollment(self.first, self.course_class)
+        with self.assertRaises(EnrollmentError):
+            enqueue_enrollment(self.first, self.course_class)
+        self.assertEqual(EnrollmentTicket.objects.count(), 1)
+        # 约束只针对排队中的票据
+        drain_queue()
+        enqueue_enrollment(self.first, self.course_class)
+        self.assertEqual(EnrollmentTicket.objects.count(), 2)
+
+    def test_worker_checks_schedule_clash(self):
+        other = self.make_class(self.course_class.teacher, code='C002')
+        reserve_seat(self.first, other)
+        ticket = enqueue_enrollment(self.first, self.course_class)
+        drain_queue()
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.status, 'rejected')
+        self.assertIn('冲突', ticket.message)
+
+    def test_unexpected_error_fails_only_that_ticket(self):
+        first = enqueue_enrollment(self.first, self.course_class)
+        second = enqueue_enrollment(self.second, self.course_class)
+
+        def reserve(student, course_class, remarks=None):
+            if student == self.first:
+                raise RuntimeError('boom')
+            return reserve_seat(student, course_class, remarks=remarks)
+
+        with mock.patch('courses.queueing.reserve_seat', side_effect=reserve):
+            self.assertEqual(drain_queue(), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('failed', 'admitted'))
+        self.assertIn('boom', first.message)
+
+
+class EnrollmentTransitionTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = self.make_teacher()
+        self.course_class = self.make_class(self.teacher)
+        self.student = self.make_students(1)[0]
+        self.enrollment = reserve_seat(self.student, self.course_class)
+
+    def test_retried_reject_releases_once(self):
+        self.client.force_login(self.teacher)
+        url = reverse('courses:approve_enrollment', args=[self.enrollment.id])
+        self.client.post(url, {'action': 'reject'})
+        self.client.post(url, {'action': 'reject'})
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.status, 'rejected')
+        self.course_class.refresh_from_db()
+        self.assertEqual(self.course_class.current_students, 0)
+
+    def test_invalid_transitions_rejected(self):
+        with self.assertRaises(EnrollmentError):
+            transition_enrollment(self.enrollment, 'drop')
+        transition_enrollment(self.enrollment, 'approve')
+        with self.assertRaises(EnrollmentError):
+            cancel_enrollment(self.enrollment)
+        self.course_class.refresh_from_db()
+        self.assertEqual(self.course_class.current_students, 1)
+
+    def test_teacher_cannot_review_other_class(self):
+        self.client.force_login(self.make_teacher('other'))
+        self.client.post(reverse('courses:approve_enrollment', args=[self.enrollment.id]), {'action': 'approve'})
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.status, 'pending')
+
+
+class BulkReviewTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = self.make_teacher()
+        self.classes = [self.make_class(self.teacher, max_students=600, code=f'C00{i}') for i in range(2)]
+        self.foreign = self.make_class(self.make_teacher('other'), max_students=10, code='C009')
+        students = self.make_students(1000)
+        Enrollment.objects.bulk_create([
+            Enrollment(student=student, course_class=self.classes[i % 2]) for i, student in enumerate(students)
+        ] + [Enrollment(student=student, course_class=self.foreign) for student in students[:10]])
+        CourseClass.objects.filter(pk__in=[c.pk for c in self.classes]).update(current_students=500)
+        CourseClass.objects.filter(pk=self.foreign.pk).update(current_students=10)
+        self.client.force_login(self.teacher)
+
+    def test_bulk_reject_uses_constant_queries(self):
+        ids = list(Enrollment.objects.values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('courses:bulk_review'), {'action': 'reject', 'enrollment_ids': ids})
+        self.assertLess(len(queries), 30)
+
+        self.assertEqual(Enrollment.objects.filter(status='rejected').count(), 1000)
+        self.assertEqual(Enrollment.objects.filter(course_class=self.foreign, status='pending').count(), 10)
+        self.assertEqual(reconcile_counters().classes_drifted, 0)
+
+    def test_bulk_approve_skips_processed(self):
+        first = Enrollment.objects.filter(course_class=self.classes[0]).first()
+        transition_enrollment(first, 'reject')
+        ids = list(Enrollment.objects.filter(course_class=self.classes[0]).values_list('pk', flat=True))
+
+        self.client.post(reverse('courses:bulk_review'), {'action': 'approve', 'enrollment_ids': ids})
+
+        self.assertEqual(Enrollment.objects.filter(status='approved').count(), 499)
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'rejected')
+
+    def queue_pages(self):
+        path = reverse('courses:approval_queue')
+        pages = []
+        query = ''
+        while query is not None:
+            response = self.client.get(path + query)
+            self.assertEqual(response.status_code, 200)
+            pages.append(list(response.context['enrollments']))
+            query = response.context['next_page_url']
+        return pages
+
+    def test_queue_paginated_for_superuser(self):
+        self.client.force_login(User.objects.create_superuser(username='root', password='x'))
+        pages = self.queue_pages()
+        self.assertEqual(len(pages), 21)
+        self.assertTrue(all(len(page) == 50 for page in pages[:-1]))
+        rows = [enrollment for page in pages for enrollment in page]
+        self.assertEqual(len({enrollment.pk for enrollment in rows}), 1010)
+        # 同一班次的申请连续排列
+        class_ids = [enrollment.course_class_id for enrollment in rows]
+        self.assertEqual(class_ids, sorted(class_ids))
+
+    def test_queue_limited_to_own_classes(self):
+        rows = [enrollment for page in self.queue_pages() for enrollment in page]
+        self.assertEqual(len(rows), 1000)
+        self.assertNotIn(self.foreign.pk, {enrollment.course_class_id for enrollment in rows})
+
+
+@override_settings(COURSES_DASHBOARD_STATS=True)
+class DashboardStatsTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = self.make_teacher()
+        self.course_class = self.make_class(self.teacher)
+        self.students = self.make_students(3)
+        rebuild_dashboard_stats()
+
+    def assertStatsCurrent(self):
+        with self.assertNumQueries(1):
+            stats = admin_dashboard_stats()
+        self.assertEqual(stats, compute_admin_stats())
+
+    def test_aggregates_in_three_queries(self):
+        with self.assertNumQueries(3):
+            stats = compute_admin_stats()
+        self.assertEqual(stats['total_users'], 4)
+        self.assertEqual(stats['total_students'], 3)
+        self.assertEqual(stats['total_teachers'], 1)
+        self.assertEqual(stats['total_courses'], 1)
+
+    def test_signals_keep_stats_current(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollments = [reserve_seat(student, self.course_class) for student in self.students]
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_enrollment(enrollments[0], 'approve')
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_transition([enrollments[1].pk], 'reject')
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_enrollment(enrollments[2])
+        self.assertStatsCurrent()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[0].user_type = 'teacher'
+            self.students[0].save()
+            self.make_teacher('second')
+            Course.objects.create(course_code='C100', course_name='新课程', semester='秋季', academic_year='2024')
+        with self.captureOnCommitCallbacks(execute=True):
+            # 级联删除该学生的选课记录
+            self.students[0].delete()
+            self.course_class.course.delete()
+        self.assertStatsCurrent()
+
+    def test_rebuild_creates_missing_row(self):
+        DashboardStats.objects.all().delete()
+        self.assertEqual(admin_dashboard_stats(), compute_admin_stats())
+        self.assertTrue(DashboardStats.objects.exists())
+
+
+class DashboardCacheTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = self.make_teacher()
+        self.course_class = self.make_class(self.teacher)
+        self.other_class = self.make_class(self.make_teacher('other'), code='C002')
+        self.student, self.bystander = self.make_students(2)
+        # 命中计数在进程内累积，不能带到下一个测试
+        reset_dashboard_cache_stats()
+
+    def dashboard(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse('courses:dashboard')).context
+
+    def test_repeat_visit_hits_cache(self):
+        self.dashboard(self.student)
+        with CaptureQueriesContext(connection) as queries:
+            context = self.client.get(reverse('courses:dashboard')).context
+        business, cached = split_queries(queries)
+        # 只有会话与用户两条业务查询；缓存只读不写：版本号、片段、选课快照、推荐构建号、班次展示数据
+        self.assertEqual(business, 2)
+        self.assertLessEqual(cached, 5)
+        self.assertFalse([query for query in queries if not query['sql'].startswith('SELECT')])
+        self.assertEqual(len(context['available_courses']), 2)
+        stats = dashboard_cache_stats()
+        self.assertEqual(stats['student'], {'hits': 1, 'misses': 1})
+        self.assertEqual(stats['available'], {'hits': 1, 'misses': 1})
+
+    def test_enrollment_invalidates_affected_fragments(self):
+        self.dashboard(self.teacher)
+        self.dashboard(self.bystander)
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment = reserve_seat(self.student, self.course_class)
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_enrollment(enrollment, 'approve')
+
+        self.assertEqual(self.dashboard(self.teacher)['total_students'], 1)
+        self.assertEqual(len(self.dashboard(self.student)['my_enrollments']), 1)
+        self.assertEqual(self.dashboard(self.student)['available_courses'], [self.other_class])
+        self.assertEqual(self.dashboard(self.bystander)['available_courses'][0].current_students, 1)
+        # 无关学生的已选课程片段没有失效
+        self.assertEqual(dashboard_cache_stats()['student']['hits'], 2)
+
+    def test_available_list_only_invalidated_when_membership_changes(self):
+        small = self.make_class(self.teacher, max_students=1, code='C003')
+        self.dashboard(self.bystander)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_seat(self.student, self.course_class)
+        available = self.dashboard(self.bystander)['available_courses']
+        self.assertEqual(available[0].current_students, 1)
+        self.assertEqual(dashboard_cache_stats()['available'], {'hits': 1, 'misses': 1})
+
+        # 班次满员后移出候选列表
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment = reserve_seat(self.student, small)
+        self.assertNotIn(small, self.dashboard(self.bystander)['available_courses'])
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_enrollment(enrollment, 'reject')
+        self.assertIn(small, self.dashboard(self.bystander)['available_courses'])
+        self.assertEqual(dashboard_cache_stats()['available'], {'hits': 1, 'misses': 3})
+
+    def test_class_and_course_edits_invalidate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_enrollment(reserve_seat(self.student, self.course_class), 'approve')
+        self.dashboard(self.student)
+        self.dashboard(self.teacher)
+
+        new_teacher = self.make_teacher('new')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course_class.teacher = new_teacher
+            self.course_class.save()
+            self.course_class.course.course_name = '新名称'
+            self.course_class.course.save()
+
+        self.assertEqual(self.dashboard(self.teacher)['my_classes'], [])
+        self.assertEqual(self.dashboard(new_teacher)['my_classes'], [self.course_class])
+        enrollment = self.dashboard(self.student)['my_enrollments'][0]
+        self.assertEqual(enrollment.course_class.course.course_name, '新名称')
+
+
+class RecommendationTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        teacher = self.make_teacher()
+        self.a, self.b, self.c, self.d = [self.make_class(teacher, code=f'R00{i}') for i in range(4)]
+        students = self.make_students(6)
+        for i, student in enumerate(students):
+            StudentProfile.objects.create(
+                user=student, student_id=f'S{i}', name=student.username, gender='M', grade='2024',
+                major='计算机' if i < 4 else '数学', class_name='1班', enrollment_date='2024-09-01',
+            )
+        self.newcomer, self.math_newcomer = students[3], students[5]
+        Enrollment.objects.bulk_create(
+            [Enrollment(student=student, course_class=self.a) for student in students[:3]]
+            + [Enrollment(student=student, course_class=self.b) for student in students[:2]]
+            + [Enrollment(student=students[4], course_class=self.c)]
+        )
+        build_recommendations()
+
+    def test_ranked_by_major_popularity(self):
+        self.assertEqual(recommend_classes(self.newcomer), [self.a, self.b, self.c, self.d])
+        self.assertEqual(recommend_classes(self.math_newcomer)[0], self.c)
+        # 没有档案的学生按全体学生的热度排序
+        self.assertEqual(recommend_classes(self.make_students(1, 'guest')[0])[0], self.a)
+
+    def test_excludes_taken_and_full_classes(self):
+        CourseClass.objects.filter(pk=self.b.pk).update(current_students=F('max_students'))
+        with CaptureQueriesContext(connection) as queries:
+            recommended = recommend_classes(self.newcomer, {self.a.pk}, {self.a.course_id})
+        business, cached = split_queries(queries)
+        self.assertEqual(business, 1)
+        # 构建号、推荐数据各读一次缓存；之后构建号不变时只读构建号
+        self.assertLessEqual(cached, 2)
+        self.assertEqual(recommended, [self.c, self.d])
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_command_requires_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, '共享缓存'):
+            call_command('build_recommendations', stdout=io.StringIO())
+
+    def test_dashboard_uses_recommendations(self):
+        self.client.force_login(self.math_newcomer)
+        context = self.client.get(reverse('courses:dashboard')).context
+        self.assertEqual(context['available_courses'][0], self.c)
+
+
+class AsyncDashboardTests(CourseDataMixin, TransactionTestCase):
+    # 异步视图的查询在线程池的独立连接中执行，需要数据真正提交
+    def setUp(self):
+        super().setUp()
+        self.teacher = self.make_teacher()
+        self.course_class = self.make_class(self.teacher)
+        self.student = self.make_students(1)[0]
+        transition_enrollment(reserve_seat(self.student, self.course_class), 'approve')
+        self.admin = User.objects.create_user(username='admin', password='x', user_type='admin')
+
+    def contexts(self, user, fields):
+        self.client.force_login(user)
+        sync = self.client.get(reverse('courses:dashboard')).context
+        cache.clear()
+        response = self.client.get(reverse('courses:dashboard_async'))
+        self.assertEqual(response.status_code, 200)
+        return [{field: sync[field] for field in fields}, {field: response.context[field] for field in fields}]
+
+    def test_matches_sync_view(self):
+        sync, async_ = self.contexts(self.admin, ['total_users', 'total_courses', 'total_enrollments'])
+        self.assertEqual(sync, async_)
+        self.assertEqual(async_['total_enrollments'], 1)
+
+        sync, async_ = self.contexts(self.teacher, ['my_classes', 'total_students', 'my_courses'])
+        self.assertEqual(sync, async_)
+        self.assertEqual(async_['my_classes'], [self.course_class])
+
+        sync, async_ = self.contexts(self.student, ['my_enrollments', 'available_courses'])
+        self.assertEqual(sync, async_)
+        self.assertEqual(len(async_['my_enrollments']), 1)
+
+    def test_requires_login(self):
+        response = self.client.get(reverse('courses:dashboard_async'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_pool_connections_are_reused(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('courses:dashboard_async'))
+        created = []
+
+        def count(sender, connection, **kwargs):
+            created.append(connection.alias)
+        connection_created.connect(count)
+        try:
+            for _ in range(3):
+                self.client.get(reverse('courses:dashboard_async'))
+        finally:
+            connection_created.disconnect(count)
+        # 线程池中的连接在请求之间复用，不再每条查询重新连接
+        self.assertLessEqual(len(created), 1)
+
+
+class KeysetPaginationTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='admin', password='x', user_type='admin')
+        course_class = self.make_class(self.make_teacher())
+        students = self.make_students(25)
+        Enrollment.objects.bulk_create([
+            Enrollment(student=student, course_class=course_class, status='rejected' if i % 5 == 0 else 'pending')
+            for i, student in enumerate(students)
+        ])
+        # 同一时刻的记录按 id 区分先后
+        Enrollment.objects.filter(pk__in=[e.pk for e in Enrollment.objects.all()[:10]]).update(
+            enroll_time=timezone.now()
+        )
+        self.expected = list(Enrollment.objects.filter(status='pending').order_by('-enroll_time', '-id'))
+        self.client.force_login(self.admin)
+
+    def walk(self, url, forward=True):
+        pages = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            # 翻页不做 COUNT(*)，页面上的总数来自缓存
+            self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries) and pages)
+            pages.append(list(response.context['enrollments']))
+            next_url = response.context['next_page_url' if forward else 'previous_page_url']
+            url = next_url and reverse('courses:enrollment_list') + next_url
+        return pages
+
+    def test_walk_forward_and_back_with_filter(self):
+        pages = self.walk(reverse('courses:enrollment_list') + '?status=pending')
+        self.assertEqual([len(page) for page in pages], [10, 10])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        response = self.client.get(reverse('courses:enrollment_list') + '?status=pending')
+        last = reverse('courses:enrollment_list') + response.context['last_page_url']
+        self.assertEqual(sum(reversed(self.walk(last, forward=False)), []), self.expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('courses:enrollment_list') + '?cursor=forged')
+        self.assertEqual(response.status_code, 404)
+
+
+class CachedCountTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='admin', password='x', user_type='admin')
+        self.course_class = self.make_class(self.make_teacher())
+        self.students = self.make_students(3)
+        Enrollment.objects.bulk_create([
+            Enrollment(student=student, course_class=self.course_class) for student in self.students[:2]
+        ])
+        self.client.force_login(self.admin)
+
+    def total(self, params=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('courses:enrollment_list') + params)
+        counted = any('COUNT(' in query['sql'].upper() for query in queries)
+        return response.context['paginator'].total, counted
+
+    def test_count_cached_until_write(self):
+        self.assertEqual(self.total('?status=pending'), ((2, False), True))
+        self.assertEqual(self.total('?status=pending'), ((2, False), False))
+        self.assertEqual(self.total('?status=approved'), ((0, False), True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_seat(self.students[2], self.course_class)
+        self.assertEqual(self.total('?status=pending'), ((3, False), True))
+
+    def test_write_in_other_process_invalidates(self):
+        # 文件缓存是跨进程共享的后端；测试数据库在内存中，数据库缓存无法跨进程
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(self.total('?status=pending'), ((2, False), True))
+            Enrollment.objects.create(student=self.students[2], course_class=self.course_class)
+            # worker 进程换的版本号 web 进程也能看到
+            worker = multiprocessing.get_context('fork').Process(target=bump_count_version, args=(Enrollment,))
+            worker.start()
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+            self.assertEqual(self.total('?status=pending'), ((3, False), True))
+
+    @override_settings(COURSES_COUNT_ESTIMATE_THRESHOLD=1)
+    def test_unfiltered_uses_estimate(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_row_count(Enrollment), 2)
+        self.assertEqual(self.total(), ((2, True), False))
+        # 带筛选条件时仍精确统计
+        self.assertEqual(self.total('?status=pending'), ((2, False), True))
+
+
+class CourseSearchTests(CourseDataMixin, TestCase):
+    def make_course(self, code, name, description=''):
+        return Course.objects.create(
+            course_code=code, course_name=name, description=description, semester='秋季', academic_year='2024'
+        )
+
+    def test_bigram_tokens(self):
+        self.assertEqual(tokenize('数据库 CS-101'), ['数据', '据库', '库', 'cs', 's', '10', '01', '1'])
+        self.assertEqual(query_terms('库'), [('库', True)])
+        self.assertEqual(query_terms('数据 数据'), [('数据', False)])
+
+    def test_ranked_search(self):
+        in_description = self.make_course('C1', '软件工程', '介绍数据库设计')
+        in_name = self.make_course('C2', '数据库原理')
+        self.make_course('C3', '操作系统')
+        self.assertEqual(search_course_ids('数据库'), [in_name.pk, in_description.pk])
+        # 单字查询和课程代码
+        self.assertEqual(search_course_ids('原'), [in_name.pk])
+        self.assertEqual(search_course_ids('c3'), [Course.objects.get(course_code='C3').pk])
+        self.assertEqual(search_course_ids('!!'), [])
+
+    def test_index_follows_save_and_delete(self):
+        course = self.make_course('C1', '数据库原理')
+        course.course_name = '编译原理'
+        course.save()
+        self.assertEqual(search_course_ids('数据库'), [])
+        self.assertEqual(search_course_ids('编译'), [course.pk])
+        course.delete()
+        self.assertEqual(search_course_ids('编译'), [])
+
+    def test_course_list_pages_by_rank(self):
+        courses = [self.make_course(f'C{i}', f'数据库{i}') for i in range(12)]
+        self.make_course('X1', '操作系统')
+        self.client.force_login(User.objects.create_user(username='admin', password='x', user_type='admin'))
+        url = reverse('courses:course_list')
+        response = self.client.get(url, {'search': '数据库'})
+        self.assertEqual(response.context['paginator'].total, (12, False))
+        first = list(response.context['courses'])
+        self.assertEqual(len(first), 10)
+        response = self.client.get(url + response.context['next_page_url'])
+        second = list(response.context['courses'])
+        self.assertEqual({c.pk for c in first + second}, {c.pk for c in courses})
+        self.assertFalse(response.context['page_obj'].has_next())
+
+
+class ClassSearchTests(CourseDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = self.make_teacher('zhang')
+        self.course_class = self.make_class(self.teacher, code='CS101')
+        self.other = self.make_class(self.make_teacher('li'), code='MA201')
+
+    def test_document_fields(self):
+        for text in ('cs101-01', '课程cs', 'zhang', 'a101'):
+            self.assertIn(self.course_class.pk, search_class_ids(text), text)
+        self.assertEqual(search_class_ids('ma2'), [self.other.pk])
+
+    def test_related_changes_reindex(self):
+        course = self.course_class.course
+        course.course_name = '数据结构'
+        course.save()
+        self.assertEqual(search_class_ids('数据结构'), [self.course_class.pk])
+
+        TeacherProfile.objects.create(
+            user=self.teacher, teacher_id='T001', name='张三', gender='M', department='计算机',
+            title='讲师', hire_date=date(2020, 9, 1),
+        )
+        self.assertEqual(search_class_ids('张三'), [self.course_class.pk])
+
+        self.teacher.username = 'zhangsan'
+        self.teacher.save()
+        self.assertEqual(search_class_ids('zhangsan'), [self.course_class.pk])
+        # 只更新人数时不重建文档
+        with CaptureQueriesContext(connection) as queries:
+            self.course_class.save(update_fields=['current_students'])
+        self.assertFalse([q for q in queries if 'search' in q['sql']])
+
+        self.course_class.delete()
+        self.assertEqual(search_class_ids('zhangsan'), [])
+
+    def test_class_list_search(self):
+        self.client.force_login(User.objects.create_user(username='admin', password='x', user_type='admin'))
+        response = self.client.get(reverse('courses:class_list'), {'search': 'li'})
+        self.assertEqual([c.pk for c in response.context['classes']], [self.other.pk])
+
+
+class QueryPlanTests(CourseDataMixin, TestCase):
+    """courses 视图发出的每条查询都要走索引
+
+    依次以管理员、教师、学生身份请求各页面，对捕获到的每条 SELECT 执行
+    EXPLAIN QUERY PLAN；计划中出现不带索引的 SCAN（全表扫描）即失败。没有
+    ANALYZE 统计信息时 SQLite 按大表估算代价，计划与数据量无关。
+    """
+
+    # 本身就要读出全表的查询（正则匹配整条 SQL）
+    ALLOWED_FULL_READS = [
+        # 班次表单的课程下拉框列出全部课程
+        r'^SELECT [^()]* FROM "courses_course"$',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='admin', password='x', user_type='admin')
+        self.teacher = self.make_teacher()
+        TeacherProfile.objects.create(
+            user=self.teacher, teacher_id='T001', name='张三', gender='M', department='计算机',
+            title='讲师', hire_date=date(2020, 9, 1),
+        )
+        self.student = self.make_students(1)[0]
+        StudentProfile.objects.create(
+            user=self.student, student_id='S001', name='李四', gender='F', grade='2024', major='计算机',
+            class_name='1班', enrollment_date=date(2024, 9, 1),
+        )
+        self.course_class = self.make_class(self.teacher)
+        self.enrollment = reserve_seat(self.student, self.course_class)
+        now = timezone.now()
+        self.round = AllocationRound.objects.create(
+            name='第一轮', opens_at=now - timedelta(days=1), closes_at=now + timedelta(days=1),
+        )
+        self.round.classes.add(self.course_class)
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+        return [detail for detail in details if re.match(r'SCAN \w+(?: AS \w+)?$', detail)]
+
+    def assertIndexed(self, user, urls):
+        self.client.force_login(user)
+        for url in urls:
+            with self.subTest(user=user.username, url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                failures = []
+                for query in queries:
+                    sql = query['sql']
+                    # 统计信息等系统表的查询不算
+                    if not sql.startswith('SELECT') or 'sqlite_' in sql:
+                        continue
+                    if any(re.match(pattern, sql) for pattern in self.ALLOWED_FULL_READS):
+                        continue
+                    scans = self.full_scans(sql)
+                    if scans:
+                        failures.append(f'{", ".join(scans)}: {sql}')
+                self.assertFalse(failures, '\n'.join(failures))
+
+    def test_admin_pages(self):
+        course_id, class_id = self.course_class.course_id, self.course_class.pk
+        self.assertIndexed(self.admin, [
+            reverse('courses:dashboard'),
+            reverse('courses:user_list'),
+            reverse('courses:user_list') + '?user_type=student',
+            reverse('courses:user_detail', args=[self.student.pk]),
+            reverse('courses:user_detail', args=[self.teacher.pk]),
+            reverse('courses:user_edit', args=[self.student.pk]),
+            reverse('courses:course_list'),
+            reverse('courses:course_list') + '?search=课程',
+            reverse('courses:course_detail', args=[course_id]),
+            reverse('courses:course_update', args=[course_id]),
+            reverse('courses:class_list'),
+            reverse('courses:class_list') + '?search=teacher',
+            reverse('courses:class_detail', args=[class_id]),
+            reverse('courses:class_update', args=[class_id]),
+            reverse('courses:enrollment_list'),
+            reverse('courses:enrollment_list') + '?status=pending',
+            reverse('courses:approval_queue'),
+        ])
+
+    def test_teacher_pages(self):
+        self.assertIndexed(self.teacher, [
+            reverse('courses:dashboard'),
+            reverse('courses:enrollment_list'),
+            reverse('courses:enrollment_list') + '?status=pending',
+            reverse('courses:approval_queue'),
+            reverse('courses:class_detail', args=[self.course_class.pk]),
+        ])
+
+    def test_student_pages(self):
+        self.assertIndexed(self.student, [
+            reverse('courses:dashboard'),
+            reverse('courses:course_list'),
+            reverse('courses:class_list'),
+            reverse('courses:class_detail', args=[self.course_class.pk]),
+            reverse('courses:enrollment_list'),
+            reverse('courses:enrollment_list') + '?status=approved',
+            reverse('courses:allocation_round_list'),
+            reverse('courses:allocation_preferences', args=[self.round.pk]),
+        ])
+
+
+class DetailQueryBudgetTests(CourseDataMixin, TestCase):
+    """课程、班次详情页的查询数是固定的，与选课人数无关"""
+
+    # (页面, 身份) -> 查询数，含会话、登录用户等框架查询
+    QUERY_BUDGET = {
+        ('class', 'admin'): 5, ('class', 'teacher'): 5, ('class', 'student'): 6,
+        ('course', 'admin'): 5, ('course', 'teacher'): 5, ('course', 'student'): 4,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='admin', password='x', user_type='admin')
+        self.teacher = self.make_teacher()
+        TeacherProfile.objects.create(
+            user=self.teacher, teacher_id='T001', name='张三', gender='M', department='计算机',
+            title='讲师', hire_date=date(2020, 9, 1),
+        )
+        self.course_class = self.make_class(self.teacher, max_students=100)
+        self.other_class = self.make_class(self.teacher, max_students=100, code='C002', course=self.course_class.course)
+        self.viewer = self.make_students(1, prefix='viewer')[0]
+
+    def enroll(self, count, prefix):
+        students = self.make_students(count, prefix=prefix)
+        # 一半学生有档案
+        StudentProfile.objects.bulk_create([
+            StudentProfile(
+                user=student, student_id=f'S-{prefix}{i}', name=student.username, gender='M', grade='2024',
+                major='计算机', class_name='1班', enrollment_date=date(2024, 9, 1),
+            )
+            for i, student in enumerate(students[::2])
+        ])
+        Enrollment.objects.bulk_create([
+            Enrollment(student=student, course_class=(self.course_class, self.other_class)[i % 2])
+            for i, student in enumerate(students)
+        ])
+
+    def query_counts(self):
+        counts = {}
+        for role, user in (('admin', self.admin), ('teacher', self.teacher), ('student', self.viewer)):
+            self.client.force_login(user)
+            for page, url in (
+                ('class', reverse('courses:class_detail', args=[self.course_class.pk])),
+                ('course', reverse('courses:course_detail', args=[self.course_class.course_id])),
+            ):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                counts[page, role] = len(queries)
+        return counts
+
+    def test_budget_independent_of_roster(self):
+        self.enroll(4, 'small')
+        self.assertEqual(self.query_counts(), self.QUERY_BUDGET)
+        self.enroll(60, 'large')
+        self.assertEqual(self.query_counts(), self.QUERY_BUDGET)
+
+    def test_roster_shows_profiles(self):
+        self.enroll(2, 'roster')
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('courses:course_detail', args=[self.course_class.course_id]))
+        self.assertEqual(len(response.context['enrollments']), 2)
+        self.assertContains(response, 'S-roster0')
+
+
+class CapacityStatsTests(CourseDataMixin, TestCase):
+    def test_with_capacity_stats(self):
+        teacher = self.make_teacher()
+        first = self.make_class(teacher, max_students=30)
+        self.make_class(teacher, max_students=20, code='C002', course=first.course)
+        CourseClass.objects.filter(pk=first.pk).update(current_students=30)
+        empty = Course.objects.create(course_code='E1', course_name='空课程', semester='秋季', academic_year='2024')
+
+        stats = {
+            course.pk: (course.class_count, course.total_capacity, course.total_enrolled, course.remaining_spots)
+            for course in Course.objects.with_capacity_stats()
+        }
+        self.assertEqual(stats, {first.course_id: (2, 50, 30, 20), empty.pk: (0, 0, 0, 0)})
+
+    def test_course_list_queries_independent_of_courses(self):
+        teacher = self.make_teacher()
+        self.client.force_login(User.objects.create_user(username='admin', password='x', user_type='admin'))
+
+        def page_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('courses:course_list'))
+            return len(queries)
+
+        self.make_class(teacher, code='C000')
+        baseline = page_queries()
+        for i in range(1, 10):
+            self.make_class(teacher, code=f'C{i:03d}')
+        cache.clear()
+        self.assertEqual(page_queries(), baseline)
+
+
+class ExportTests(CourseDataMixin, TestCase):
+    """名单导出：流式输出，查询数与行数无关"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='admin', password='x', user_type='admin')
+        self.teacher = self.make_teacher()
+        self.course_class = self.make_class(self.teacher, max_students=100)
+        self.other_class = self.make_class(self.make_teacher('other'), code='C002', course=self.course_class.course)
+        self.student = self.make_students(1)[0]
+        StudentProfile.objects.create(
+            user=self.student, student_id='S001', name='李四', gender='F', grade='2024', major='计算机',
+            class_name='1班', enrollment_date=date(2024, 9, 1),
+        )
+        self.enrollment = reserve_seat(self.student, self.course_class)
+
+    def export(self, url, user, **params):
+        self.client.force_login(user)
+        response = self.client.get(url, params)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def csv_rows(self, content):
+        self.assertTrue(content.startswith('\ufeff'.encode()))
+        return list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+
+    def test_class_roster_csv(self):
+        url = reverse('courses:class_roster_export', args=[self.course_class.pk])
+        response, content = self.export(url, self.teacher)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        header, row = self.csv_rows(content)
+        self.assertEqual(header[:2], ['学号', '姓名'])
+        self.assertEqual(row[:3], ['S001', '李四', self.student.username])
+        self.assertEqual(row[header.index('选课状态')], '待审核')
+
+    def test_course_export_xlsx(self):
+        response, content = self.export(
+            reverse('courses:course_enrollment_export', args=[self.course_class.course_id]), self.admin, format='xlsx',
+        )
+        self.assertEqual(response['Content-Type'], FORMATS['xlsx'])
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('李四', sheet)
+        self.assertEqual(sheet.count('<row>'), 2)
+
+    def test_teacher_exports_only_own_classes(self):
+        for student in self.make_students(2, prefix='other'):
+            reserve_seat(student, self.other_class)
+        url = reverse('courses:course_enrollment_export', args=[self.course_class.course_id])
+        _, content = self.export(url, self.teacher)
+        self.assertEqual(len(self.csv_rows(content)), 2)
+        response, _ = self.export(reverse('courses:class_roster_export', args=[self.other_class.pk]), self.teacher)
+        self.assertRedirects(response, reverse('courses:enrollment_list'))
+
+    def test_student_cannot_export_roster(self):
+        for url in (
+            reverse('courses:class_roster_export', args=[self.course_class.pk]),
+            reverse('courses:course_enrollment_export', args=[self.course_class.course_id]),
+        ):
+            response, _ = self.export(url, self.student)
+            self.assertRedirects(response, reverse('courses:enrollment_list'))
+
+    def test_superuser_exports_rosters(self):
+        superuser = User.objects.create_superuser(username='root', password='x')
+        for url, rows in (
+            (reverse('courses:class_roster_export', args=[self.course_class.pk]), 2),
+            (reverse('courses:course_enrollment_export', args=[self.course_class.course_id]), 2),
+            (reverse('courses:enrollment_export'), 2),
+        ):
+            response, content = self.export(url, superuser)
+            self.assertTrue(response.streaming)
+            self.assertEqual(len(self.csv_rows(content)), rows)
+
+    def test_formula_values_escaped(self):
+        StudentProfile.objects.filter(user=self.student).update(
+            student_id='\t=1+1', name='=HYPERLINK("http://x","y")'
+        )
+        self.student.username = '@cmd'
+        self.student.save()
+        url = reverse('courses:class_roster_export', args=[self.course_class.pk])
+        _, content = self.export(url, self.teacher)
+        row = self.csv_rows(content)[1]
+        self.assertEqual(row[:3], ["'\t=1+1", '\'=HYPERLINK("http://x","y")', "'@cmd"])
+        # XLSX 的内联字符串不会被当作公式，原样导出
+        _, content = self.export(url, self.teacher, format='xlsx')
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('>=HYPERLINK(', sheet)
+        self.assertIn('>@cmd<', sheet)
+        self.assertNotIn("'@cmd", sheet)
+
+    def test_enrollment_export_uses_list_filters(self):
+        reserve_seat(self.make_students(1, prefix='more')[0], self.course_class)
+        transition_enrollment(self.enrollment, 'approve')
+        _, content = self.export(reverse('courses:enrollment_export'), self.admin, status='approved')
+        rows = self.csv_rows(content)
+        self.assertEqual([row[0] for row in rows[1:]], ['S001'])
+        # 学生只导出自己的记录
+        _, content = self.export(reverse('courses:enrollment_export'), self.student)
+        self.assertEqual(len(self.csv_rows(content)), 2)
+
+    def test_queries_independent_of_rows(self):
+        url = reverse('courses:class_roster_export', args=[self.course_class.pk])
+
+        def export_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.export(url, self.admin)
+            return len(queries)
+
+        # 首次请求还要建立会话
+        export_queries()
+        baseline = export_queries()
+        for student in self.make_students(30, prefix='bulk'):
+            reserve_seat(student, self.course_class)
+        self.assertEqual(export_queries(), baseline)
+
+
+class DeletionJobTests(CourseDataMixin, TestCase):
+    """删除课程、用户只提交后台任务，由 worker 分批删除"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='admin', password='x', user_type='admin')
+        self.teacher = self.make_teacher()
+        self.course_class = self.make_class(self.teacher, max_students=100)
+        self.client.force_login(self.admin)
+
+    def enroll(self, count, prefix, course_class=None):
+        for student in self.make_students(count, prefix=prefix):
+            reserve_seat(student, course_class or self.course_class)
+
+    def delete_course(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('courses:course_delete', args=[self.course_class.course_id]))
+        self.assertRedirects(response, reverse('courses:course_list'), fetch_redirect_response=False)
+        return len(queries)
+
+    def test_course_request_is_independent_of_enrollments(self):
+        self.enroll(1, 'few')
+        few = self.delete_course()
+        DeletionJob.objects.all().delete()
+        self.enroll(30, 'many')
+        self.assertEqual(self.delete_course(), few)
+        # 请求本身不删除任何数据
+        self.assertTrue(Course.objects.filter(pk=self.course_class.course_id).exists())
+        self.assertEqual(Enrollment.objects.count(), 31)
+
+    def test_queued_course_is_closed(self):
+        student = self.make_students(1)[0]
+        self.delete_course()
+        self.course_class.refresh_from_db()
+        self.assertFalse(self.course_class.is_active)
+        self.assertNotIn(self.course_class.course, self.client.get(reverse('courses:course_list')).context['courses'])
+        self.assertNotIn(self.course_class, self.client.get(reverse('courses:class_list')).context['classes'])
+
+        with self.assertRaises(EnrollmentError) as raised:
+            reserve_seat(student, self.course_class)
+        self.assertEqual(raised.exception.code, 'closed')
+        self.client.force_login(student)
+        response = self.client.post(reverse('courses:enroll_course', args=[self.course_class.pk]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Enrollment.objects.filter(student=student).exists())
+
+    def test_worker_deletes_course_in_batches(self):
+        self.enroll(7, 'student')
+        waiting = self.make_students(1, prefix='waiting')[0]
+        WaitlistEntry.objects.create(student=waiting, course_class=self.course_class)
+        self.delete_course()
+        # 重复提交不会产生第二个任务
+        self.delete_course()
+        self.assertEqual(DeletionJob.objects.filter(status='queued').count(), 1)
+
+        self.assertEqual(drain_deletion_jobs(batch_size=3), 1)
+        job = DeletionJob.objects.get()
+        self.assertEqual((job.status, job.deleted, job.total, job.progress), ('done', 10, 10, 100))
+        self.assertFalse(Course.objects.exists())
+        self.assertFalse(Enrollment.objects.exists())
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+    def test_student_deletion_releases_seats(self):
+        student = self.make_students(1)[0]
+        reserve_seat(student, self.course_class)
+        self.client.post(reverse('courses:admin_delete_user', args=[student.pk]), {'confirm_delete_data': 'true'})
+        student.refresh_from_db()
+        self.assertFalse(student.is_active)
+        self.assertEqual(seat_count(self.course_class), 1)
+
+        drain_deletion_jobs()
+        self.assertFalse(User.objects.filter(pk=student.pk).exists())
+        self.assertEqual(seat_count(self.course_class), 0)
+
+    def test_teacher_deletion_removes_classes(self):
+        other = self.make_class(self.teacher, code='C002')
+        self.enroll(3, 'student', other)
+        self.client.post(reverse('courses:admin_delete_user', args=[self.teacher.pk]), {'confirm_delete_data': 'true'})
+        drain_deletion_jobs(batch_size=2)
+        self.assertFalse(User.objects.filter(pk=self.teacher.pk).exists())
+        self.assertFalse(CourseClass.objects.exists())
+        self.assertFalse(Enrollment.objects.exists())
+        # 课程本身保留
+        self.assertEqual(Course.objects.count(), 2)
+
+    def test_stale_running_job_reclaimed(self):
+        self.enroll(2, 'student')
+        self.delete_course()
+        # 模拟 worker 领取后崩溃
+        DeletionJob.objects.update(status='running', heartbeat_at=timezone.now())
+        self.assertEqual(drain_deletion_jobs(), 0)
+        DeletionJob.objects.update(heartbeat_at=timezone.now() - timedelta(seconds=301))
+        self.assertEqual(drain_deletion_jobs(), 1)
+        self.assertEqual(DeletionJob.objects.get().status, 'done')
+        self.assertFalse(Course.objects.exists())
+
+    def test_failed_step_marks_job_failed(self):
+        self.enroll(2, 'student')
+        self.delete_course()
+        with mock.patch('courses.deletion.delete_batch', side_effect=RuntimeError('磁盘已满')):
+            self.assertEqual(drain_deletion_jobs(), 1)
+        job = DeletionJob.objects.get()
+        self.assertEqual((job.status, job.message), ('failed', '磁盘已满'))
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(COURSES_DELETION_MODE='sync')
+    def test_sync_mode_deletes_in_request(self):
+        self.enroll(2, 'student')
+        self.delete_course()
+        self.assertFalse(Course.objects.exists())
+        self.assertEqual(DeletionJob.objects.get().status, 'done')
+
+
+class ConcurrentTransitionTests(CourseDataMixin, TransactionTestCase):
+    """同一条选课记录被并发地重复流转，只能生效一次"""
+
+    THREADS = 20
+
+    def setUp(self):
+        super().setUp()
+        self.course_class = self.make_class(self.make_teacher(), max_students=10)
+        self.student = self.make_students(1)[0]
+        self.enrollment = reserve_seat(self.student, self.course_class)
+
+    def hammer(self, operation):
+        def attempt():
+            while True:
+                try:
+                    enrollment = Enrollment.objects.select_related('course_class').get(pk=self.enrollment.pk)
+                except Enrollment.DoesNotExist:
+                    return EnrollmentError('', code='stale')
+                try:
+                    return operation(enrollment)
+                except OperationalError:
+                    time.sleep(0.001)
+
+        results = run_concurrently(attempt, [()] * self.THREADS)
+        self.assertFalse([r for r in results if isinstance(r, Exception) and not isinstance(r, EnrollmentError)])
+        return sum(not isinstance(r, Exception) for r in results)
+
+    def assertSeats(self, expected):
+        self.course_class.refresh_from_db()
+        self.assertEqual(self.course_class.current_students, expected)
+
+    def test_parallel_reject(self):
+        self.assertEqual(self.hammer(lambda e: transition_enrollment(e, 'reject')), 1)
+        self.assertSeats(0)
+
+    def test_parallel_approve(self):
+        self.assertEqual(self.hammer(lambda e: transition_enrollment(e, 'approve')), 1)
+        self.assertSeats(1)
+
+    def test_parallel_drop(self):
+        transition_enrollment(self.enrollment, 'approve')
+        self.assertEqual(self.hammer(lambda e: transition_enrollment(e, 'drop')), 1)
+        self.assertSeats(0)
+
+    def test_parallel_cancel(self):
+        self.assertEqual(self.hammer(cancel_enrollment), 1)
+        self.assertSeats(0)
+        self.assertFalse(Enrollment.objects.exists())
+
+
+class ConcurrentReserveSeatTests(CourseDataMixin, TransactionTestCase):
+    """并发选课压测：数百个请求同时抢占名额，不允许超卖"""
+
+    def reserve(self, student_id, class_id):
+        while True:
+            try:
+                student = User.objects.get(pk=student_id)
+                course_class = CourseClass.objects.select_related('course').get(pk=class_id)
+                return reserve_seat(student, course_class)
+            except OperationalError:
+                # SQLite 在读锁升级为写锁冲突时会直接报错，稍后重试即可
+                time.sleep(0.001)
+
+    def test_no_oversell_under_concurrency(self):
+        teacher = self.make_teacher()
+        course_class = self.make_class(teacher, max_students=50)
+        students = self.make_students(300)
+
+        results = run_concurrently(
+            self.reserve, [(s.pk, course_class.pk) for s in students]
+        )
+
+        succeeded = [r for r in results if isinstance(r, Enrollment)]
+        rejected = [r for r in results if isinstance(r, EnrollmentError)]
+        self.assertEqual(len(succeeded) + len(rejected), len(students))
+        self.assertEqual(len(succeeded), 50)
+
+        course_class.refresh_from_db()
+        self.assertEqual(course_class.current_students, 50)
+        self.assertEqual(Enrollment.objects.filter(course_class=course_class).count(), 50)
+
+    def test_same_student_racing_for_one_course(self):
+        teacher = self.make_teacher()
+        course_class = self.make_class(teacher, max_students=100)
+        student = self.make_students(1)[0]
+
+        results = run_concurrently(
+            self.reserve, [(student.pk, course_class.pk)] * 50
+        )
+
+        self.assertEqual(sum(isinstance(r, Enrollment) for r in results), 1)
+        course_class.refresh_from_db()
+        self.assertEqual(course_class.current_students, 1)
@@ -0,0 +1,115 @@
+"""选课记录的状态流转
+
+每次流转都是一条带“期望当前状态”条件的 UPDATE（取消申请为带条件的
+DELETE），只有真正改到一行时才调整班次人数并递补候补名单。并发的重复点击、
+重试的 POST 都只会有一个生效，其余得到 code='stale' 的 EnrollmentError。
+
+    pending  --approve--> approved
+    pending  --reject---> rejected   （释放名额）
+    approved --drop-----> dropped    （释放名额）
+    pending  --cancel---> 删除记录    （释放名额）
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CourseClass, Enrollment
+from .seats import EnrollmentError
+from .signals import enrollments_bulk_changed
+from .waitlist import release_seats_and_promote
+
+# 动作 -> (期望的当前状态, 目标状态, 是否释放名额)
+TRANSITIONS = {
+    'approve': ('pending', 'approved', False),
+    'reject': ('pending', 'rejected', True),
+    'drop': ('approved', 'dropped', True),
+}
+
+STALE_MESSAGE = '该选课记录的状态已发生变化，请刷新页面后重试。'
+
+
+def transition_enrollment(enrollment, action):
+    """对选课记录执行 action，成功时同步更新 enrollment 实例并返回它"""
+    try:
+        expected, target, frees_seat = TRANSITIONS[action]
+    except KeyError:
+        raise EnrollmentError('无效的操作。', code='invalid')
+
+    changes = {'status': target}
+    if action == 'approve':
+        changes['approve_time'] = timezone.now()
+
+    with transaction.atomic():
+        updated = Enrollment.objects.filter(pk=enrollment.pk, status=expected).update(**changes)
+        if not updated:
+            raise EnrollmentError(STALE_MESSAGE, code='stale')
+        if frees_seat:
+            # 释放的名额在同一事务内递补给候补名单
+            release_seats_and_promote(enrollment.course_class)
+        # QuerySet.update() 不触发 post_save，由这里通知快照失效
+        student_id, class_id = enrollment.student_id, enrollment.course_class_id
+        transaction.on_commit(lambda: enrollments_bulk_changed.send(
+            sender=Enrollment, student_ids={student_id}, class_ids={class_id},
+            status_counts={expected: -1, target: 1},
+        ))
+
+    for field, value in changes.items():
+        setattr(enrollment, field, value)
+    return enrollment
+
+
+def cancel_enrollment(enrollment):
+    """学生取消待审核的申请：删除记录并释放名额"""
+    with transaction.atomic():
+        deleted, _ = Enrollment.objects.filter(pk=enrollment.pk, status='pending').delete()
+        if not deleted:
+            raise EnrollmentError(STALE_MESSAGE, code='stale')
+        release_seats_and_promote(enrollment.course_class)
+
+
+def bulk_transition(enrollment_ids, action, teacher=None):
+    """对一批选课记录执行同一动作，返回实际流转的记录数
+
+    只处理仍处于期望状态的记录（teacher 不为空时仅限其本人的班次），其余
+    静默跳过。状态用一条 UPDATE 修改；需要释放名额时每个班次只做一次聚合的
+    计数更新，并按释放数递补候补名单。
+    """
+    try:
+        expected, target, frees_seat = TRANSITIONS[action]
+    except KeyError:
+        raise EnrollmentError('无效的操作。', code='invalid')
+
+    changes = {'status': target}
+    if action == 'approve':
+        changes['approve_time'] = timezone.now()
+
+    with transaction.atomic():
+        queryset = Enrollment.objects.filter(pk__in=enrollment_ids, status=expected)
+        if teacher is not None:
+            queryset = queryset.filter(course_class__teacher=teacher)
+        rows = list(queryset.select_for_update(of=('self',)).order_by('pk').values_list(
+            'pk', 'student_id', 'course_class_id'
+        ))
+        if not rows:
+            return 0
+
+        updated = Enrollment.objects.filter(
+            pk__in=[pk for pk, _, _ in rows], status=expected
+        ).update(**changes)
+        if updated != len(rows):
+            # 行已加锁，只有在不支持行锁的数据库上才可能被并发修改
+            raise EnrollmentError(STALE_MESSAGE, code='stale')
+
+        if frees_seat:
+            freed = Counter(class_id for _, _, class_id in rows)
+            for course_class in CourseClass.objects.filter(pk__in=freed).order_by('pk'):
+                release_seats_and_promote(course_class, freed[course_class.pk])
+
+        student_ids = {student_id for _, student_id, _ in rows}
+        class_ids = {class_id for _, _, class_id in rows}
+        status_counts = {expected: -len(rows), target: len(rows)}
+        transaction.on_commit(lambda: enrollments_bulk_changed.send(
+            sender=Enrollment, student_ids=student_ids, class_ids=class_ids, status_counts=status_counts,
+        ))
+    return len(rows)
@@ -6,6 +6,7 @@ app_name = 'courses'
 urlpatterns = [
     # 仪表板
     path('dashboard/', views.dashboard_view, name='dashboard'),
+    path('dashboard/async/', views.dashboard_async_view, name='dashboard_async'),
 
     # 用户管理（管理员）- 放在前面避免与其他路由冲突
     path('users/', views.UserListView.as_view(), name='user_list'),
@@ -13,6 +14,7 @@ urlpatterns = [
     path('users/<int:pk>/', views.UserDetailView.as_view(), name='user_detail'),
     path('users/<int:pk>/edit/', views.user_edit_view, name='user_edit'),
     path('users/<int:pk>/delete/', views.admin_delete_user_view, name='admin_delete_user'),
+    path('deletions/<int:job_id>/', views.deletion_job_view, name='deletion_job'),
 
     # 课程管理
     path('', views.CourseListView.as_view(), name='course_list'),
@@ -20,6 +22,7 @@ urlpatterns = [
     path('create/', views.CourseCreateView.as_view(), name='course_create'),
     path('<int:pk>/update/', views.CourseUpdateView.as_view(), name='course_update'),
     path('<int:pk>/delete/', views.CourseDeleteView.as_view(), name='course_delete'),
+    path('<int:course_id>/export/', views.course_enrollment_export_view, name='course_enrollment_export'),
 
     # 课程班次管理
     path('classes/', views.CourseClassListView.as_view(), name='class_list'),
@@ -27,15 +30,26 @@ urlpatterns = [
     path('classes/create/', views.CourseClassCreateView.as_view(), name='class_create'),
     path('classes/<int:pk>/update/', views.CourseClassUpdateView.as_view(), name='class_update'),
     path('classes/<int:pk>/delete/', views.CourseClassDeleteView.as_view(), name='class_delete'),
+    path('classes/<int:class_id>/export/', views.class_roster_export_view, name='class_roster_export'),
     path('classes/<int:class_id>/unenroll/', views.class_unenroll_view, name='class_unenroll'),
+    path('classes/<int:class_id>/waitlist/join/', views.waitlist_join_view, name='waitlist_join'),
+    path('classes/<int:class_id>/waitlist/leave/', views.waitlist_leave_view, name='waitlist_leave'),
 
     # 选课管理
     path('enrollments/', views.EnrollmentListView.as_view(), name='enrollment_list'),
     path('enroll/<int:class_id>/', views.enroll_course_view, name='enroll_course'),
+    path('enrollments/export/', views.EnrollmentExportView.as_view(), name='enrollment_export'),
+    path('enrollments/queue/', views.ApprovalQueueView.as_view(), name='approval_queue'),
+    path('enrollments/bulk-review/', views.bulk_review_view, name='bulk_review'),
+    path('enrollments/tickets/<int:ticket_id>/', views.enrollment_ticket_view, name='enrollment_ticket'),
     path('enrollments/<int:enrollment_id>/approve/', views.approve_enrollment_view, name='approve_enrollment'),
     path('enrollments/<int:enrollment_id>/grade/', views.grade_enrollment_view, name='grade_enrollment'),
     path('enrollments/<int:enrollment_id>/cancel/', views.enrollment_cancel_view, name='enrollment_cancel'),
 
+    # 抽签选课
+    path('allocation/', views.allocation_round_list_view, name='allocation_round_list'),
+    path('allocation/<int:round_id>/', views.allocation_preferences_view, name='allocation_preferences'),
+
     # 公告管理
     path('announcements/create/', views.AnnouncementCreateView.as_view(), name='announcement_create'),
 ]
\ No newline at end of file
@@ -1,19 +1,43 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.db import transaction
 from django.http import JsonResponse, HttpResponse
 from django.contrib.auth import get_user_model
+from django.contrib.auth.views import redirect_to_login
 from django.utils import timezone
 from django.db import models
 
-from .models import Course, CourseClass, Enrollment, Announcement
+from .models import (
+    AllocationRound, Course, CourseClass, DeletionJob, Enrollment, EnrollmentPreference, EnrollmentTicket,
+    WaitlistEntry, Announcement,
+)
+from .batching import group_commit_enabled, reserve_seat_grouped
+from .dashboard import (
+    admin_dashboard_stats, admin_dashboard_stats_async, student_dashboard, student_dashboard_async,
+    teacher_dashboard, teacher_dashboard_async,
+)
+from .deletion import (
+    background_deletion_enabled, enqueue_course_deletion, enqueue_user_deletion, run_deletion_job,
+)
+from .export import export_response
+from .pagination import KeysetPaginationMixin, RankedPaginator
+from .queueing import enqueue_enrollment, queue_position, queued_mode_enabled
+from .schedule import check_schedule_conflict
+from .search import search_class_ids, search_course_ids, search_limit
+from .seats import EnrollmentError, check_eligibility, reserve_seat
+from .snapshot import get_enrollment_snapshot
+from .transitions import bulk_transition, cancel_enrollment, transition_enrollment
+from .waitlist import (
+    join_waitlist, leave_waitlist, waitlist_position,
+)
 from .forms import (
     CourseForm, CourseClassForm, EnrollmentForm, StudentEnrollmentForm,
-    GradeForm, AnnouncementForm
+    GradeForm, AnnouncementForm, AllocationPreferenceForm
 )
 from users.forms import (
     UserUpdateForm, StudentProfileUpdateForm, TeacherProfileUpdateForm,
@@ -94,35 +118,11 @@ class DashboardView(LoginRequiredMixin):
     def get(self, request, *args, **kwargs):
         user = request.user
         if user.is_superuser or user.user_type == 'admin':
-            return render(request, 'admin/dashboard.html', {
-                'total_users': User.objects.count(),
-                'total_students': User.objects.filter(user_type='student').count(),
-                'total_teachers': User.objects.filter(user_type='teacher').count(),
-                'total_courses': Course.objects.count(),
-                'total_enrollments': Enrollment.objects.filter(status='approved').count(),
-                'pending_enrollments': Enrollment.objects.filter(status='pending').count(),
-            })
+            return render(request, 'admin/dashboard.html', admin_dashboard_stats())
         elif user.user_type == 'teacher':
-            return render(request, 'teacher/dashboard.html', {
-                'user': user,
-                'my_classes': CourseClass.objects.filter(teacher=user),
-                'total_students': Enrollment.objects.filter(
-                    course_class__teacher=user, status='approved'
-                ).count(),
-                'my_courses': Course.objects.filter(classes__teacher=user).distinct(),
-            })
+            return render(request, 'teacher/dashboard.html', {'user': user, **teacher_dashboard(user)})
         else:
-            return render(request, 'student/dashboard.html', {
-                'user': user,
-                'my_enrollments': Enrollment.objects.filter(
-                    student=user, status='approved'
-                ).select_related('course_class__course'),
-                'available_courses': CourseClass.objects.filter(
-                    current_students__lt=models.F('max_students')
-                ).exclude(
-                    enrollments__student=user
-                ).select_related('course', 'teacher')[:10],
-            })
+            return render(request, 'student/dashboard.html', {'user': user, **student_dashboard(user, request)})
 
 
 @login_required
@@ -132,6 +132,30 @@ def dashboard_view(request):
     return dashboard.get(request)
 
 
+def _request_user(request):
+    user = request.user
+    # 访问属性即触发 request.user 的延迟加载（会话与用户查询），让它在同步线程中完成；
+    # 赋值只为表明这里有意丢弃结果
+    _ = user.is_authenticated
+    return user
+
+
+async def dashboard_async_view(request):
+    """仪表板视图的异步版本：相互独立的统计与列表查询并发执行"""
+    user = await sync_to_async(_request_user)(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    if user.is_superuser or user.user_type == 'admin':
+        template_name, context = 'admin/dashboard.html', await admin_dashboard_stats_async()
+    elif user.user_type == 'teacher':
+        template_name, context = 'teacher/dashboard.html', {'user': user, **await teacher_dashboard_async(user)}
+    else:
+        template_name = 'student/dashboard.html'
+        context = {'user': user, **await student_dashboard_async(user, request)}
+    return await sync_to_async(render)(request, template_name, context)
+
+
 class IsAdminMixin(UserPassesTestMixin):
     """管理员权限检查"""
     def test_func(self):
@@ -151,41 +175,59 @@ class IsStudentMixin(UserPassesTestMixin):
 
 
 # 课程管理视图
-class CourseListView(LoginRequiredMixin, ListView):
+class CourseListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Course
     template_name = 'courses/course_list.html'
     context_object_name = 'courses'
     paginate_by = 10
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        queryset = Course.objects.all().order_by('-created_at')
+        queryset = Course.objects.with_capacity_stats().filter(is_active=True).order_by('-created_at')
         search = self.request.GET.get('search')
-        if search:
+        # 全文检索按相关度排序的课程主键，索引不可用时退回 icontains
+        self.search_ids = search_course_ids(search) if search else None
+        if search and self.search_ids is None:
             queryset = queryset.filter(
                 models.Q(course_name__icontains=search) |
                 models.Q(course_code__icontains=search)
             )
         return queryset
 
+    def get_keyset_paginator(self, queryset, page_size):
+        if self.search_ids is not None:
+            return RankedPaginator(queryset, self.search_ids, page_size, search_limit())
+        return super().get_keyset_paginator(queryset, page_size)
+
 
 class CourseDetailView(LoginRequiredMixin, DetailView):
     model = Course
     template_name = 'courses/course_detail.html'
     context_object_name = 'course'
 
+    def get_queryset(self):
+        return Course.objects.with_capacity_stats()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        classes = self.object.classes.all().select_related('teacher')
-        context['classes'] = classes
+        context['classes'] = self.object.classes.all().select_related('teacher').order_by('class_code')
 
-        # 计算统计数据
-        total_capacity = sum(cls.max_students for cls in classes)
-        total_enrolled = sum(cls.current_students for cls in classes)
-        remaining_spots = max(0, total_capacity - total_enrolled)
+        # 统计数据随课程一并查出
+        course = self.object
+        context['class_count'] = course.class_count
+        context['total_capacity'] = course.total_capacity
+        context['total_enrolled'] = course.total_enrolled
+        context['remaining_spots'] = course.remaining_spots
 
-        context['total_capacity'] = total_capacity
-        context['total_enrolled'] = total_enrolled
-        context['remaining_spots'] = remaining_spots
+        # 选课学生名单：学生档案随记录一并取出，查询数与人数无关
+        user = self.request.user
+        if user.user_type in ('admin', 'teacher'):
+            enrollments = Enrollment.objects.filter(course_class__course=self.object).select_related(
+                'student__studentprofile', 'course_class'
+            ).order_by('course_class__class_code', 'enroll_time', 'id')
+            if user.user_type == 'teacher':
+                enrollments = enrollments.filter(course_class__teacher=user)
+            context['enrollments'] = list(enrollments)
 
         return context
 
@@ -217,35 +259,37 @@ class CourseDeleteView(LoginRequiredMixin, IsAdminMixin, DeleteView):
     template_name = 'courses/course_confirm_delete.html'
     success_url = reverse_lazy('courses:course_list')
 
+    def get_queryset(self):
+        return Course.objects.with_capacity_stats()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        course = self.get_object()
-
-        # 计算统计数据
-        class_count = course.classes.count()
-        total_enrolled = sum(cls.current_students for cls in course.classes.all())
-
-        context['class_count'] = class_count
-        context['total_enrolled'] = total_enrolled
-
+        # 统计数据随课程一并查出
+        context['class_count'] = self.object.class_count
+        context['total_enrolled'] = self.object.total_enrolled
         return context
 
-    def delete(self, request, *args, **kwargs):
-        messages.success(request, '课程删除成功！')
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        # 课程连同班次、选课记录由后台任务分批删除，请求只提交任务
+        job = enqueue_course_deletion(self.object, requested_by=self.request.user)
+        _deletion_submitted(self.request, job)
+        return redirect(self.success_url)
 
 
 # 课程班次管理视图
-class CourseClassListView(LoginRequiredMixin, ListView):
+class CourseClassListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = CourseClass
     template_name = 'courses/class_list.html'
     context_object_name = 'classes'
     paginate_by = 10
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        queryset = CourseClass.objects.all().select_related('course', 'teacher').order_by('-created_at')
+        queryset = CourseClass.objects.filter(is_active=True).select_related('course', 'teacher').order_by('-created_at')
         search = self.request.GET.get('search')
-        if search:
+        # 与课程列表相同：先查检索索引，不可用时退回三表连接的 icontains
+        self.search_ids = search_class_ids(search) if search else None
+        if search and self.search_ids is None:
             queryset = queryset.filter(
                 models.Q(class_code__icontains=search) |
                 models.Q(course__course_name__icontains=search) |
@@ -253,19 +297,51 @@ class CourseClassListView(LoginRequiredMixin, ListView):
             )
         return queryset
 
+    def get_keyset_paginator(self, queryset, page_size):
+        if self.search_ids is not None:
+            return RankedPaginator(queryset, self.search_ids, page_size, search_limit())
+        return super().get_keyset_paginator(queryset, page_size)
+
 
 class CourseClassDetailView(LoginRequiredMixin, DetailView):
     model = CourseClass
     template_name = 'courses/class_detail.html'
     context_object_name = 'class'
 
+    def get_queryset(self):
+        # 页面多处读取课程、教师及其档案
+        return CourseClass.objects.select_related('course', 'teacher__teacherprofile')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['enrollments'] = self.object.enrollments.all().select_related('student')
-        context['announcements'] = self.object.announcements.filter(is_active=True).order_by('-created_at')
+        context['announcements'] = self.object.announcements.filter(
+            is_active=True
+        ).select_related('author').order_by('-created_at')
+        user = self.request.user
+        if user.user_type == 'student':
+            # 学生只看到自己的选课状态，不需要整个名单
+            context['my_enrollment'] = Enrollment.objects.filter(student=user, course_class=self.object).first()
+            entry = WaitlistEntry.objects.filter(
+                student=user, course_class=self.object, status='waiting'
+            ).first()
+            context['waitlist_entry'] = entry
+            context['waitlist_position'] = waitlist_position(entry) if entry else None
+        else:
+            context['enrollments'] = list(self.object.enrollments.select_related(
+                'student__studentprofile'
+            ).order_by('enroll_time', 'id'))
         return context
 
 
+def _warn_unparsed_schedule(request, form):
+    if form.schedule_error:
+        messages.warning(
+            request,
+            f'上课时间无法识别（{form.schedule_error}），该班次不参与上课时间冲突检测。'
+            '格式示例：周一/周三 1-2节、周二 14:00-16:00 1-8周',
+        )
+
+
 class CourseClassCreateView(LoginRequiredMixin, IsAdminMixin, CreateView):
     model = CourseClass
     form_class = CourseClassForm
@@ -274,6 +350,7 @@ class CourseClassCreateView(LoginRequiredMixin, IsAdminMixin, CreateView):
 
     def form_valid(self, form):
         messages.success(self.request, '课程班次创建成功！')
+        _warn_unparsed_schedule(self.request, form)
         return super().form_valid(form)
 
 
@@ -285,19 +362,21 @@ class CourseClassUpdateView(LoginRequiredMixin, IsAdminMixin, UpdateView):
 
     def form_valid(self, form):
         messages.success(self.request, '课程班次更新成功！')
+        _warn_unparsed_schedule(self.request, form)
         return super().form_valid(form)
 
 
 # 选课管理视图
-class EnrollmentListView(LoginRequiredMixin, ListView):
+class EnrollmentListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Enrollment
     template_name = 'courses/enrollment_list.html'
     context_object_name = 'enrollments'
     paginate_by = 10
+    keyset_ordering = ('-enroll_time', '-id')
 
     def get_queryset(self):
         user = self.request.user
-        if user.user_type == 'admin':
+        if user.is_superuser or user.user_type == 'admin':
             queryset = Enrollment.objects.all().select_related('student', 'course_class__course', 'course_class__teacher')
         elif user.user_type == 'teacher':
             queryset = Enrollment.objects.filter(
@@ -314,46 +393,72 @@ class EnrollmentListView(LoginRequiredMixin, ListView):
 
         return queryset.order_by('-enroll_time')
 
+    def get_count_scope(self):
+        # 教师、学生只能看到与自己相关的记录
+        user = self.request.user
+        owner = '' if user.is_superuser or user.user_type == 'admin' else f'{user.user_type}:{user.pk}'
+        return f'{super().get_count_scope()}:{owner}'
+
+
+# 名单导出：流式输出，?format=xlsx 导出 Excel，默认 CSV
+class EnrollmentExportView(EnrollmentListView):
+    """按选课列表当前的筛选条件导出全部记录（不分页）"""
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.get_queryset().order_by('-enroll_time', '-id')
+        return export_response(queryset, '选课记录', request.GET.get('format', 'csv'))
+
 
 @login_required
-def enroll_course_view(request, class_id):
-    """学生选课"""
-    if request.user.user_type != 'student':
-        messages.error(request, '只有学生可以进行选课操作。')
-        return redirect('courses:class_list')
+def class_roster_export_view(request, class_id):
+    """导出班次的选课名单（管理员或该班次的授课教师）"""
+    course_class = get_object_or_404(CourseClass.objects.select_related('course'), id=class_id)
+    user = request.user
+    is_admin = user.is_superuser or user.user_type == 'admin'
+    if not is_admin and not (user.user_type == 'teacher' and course_class.teacher_id == user.id):
+        messages.error(request, '您没有权限导出该班次的名单。')
+        return redirect('courses:enrollment_list')
 
-    course_class = get_object_or_404(CourseClass, id=class_id)
+    queryset = Enrollment.objects.filter(course_class=course_class).order_by('enroll_time', 'id')
+    filename = f'{course_class.course.course_code}-{course_class.class_code}-名单'
+    return export_response(queryset, filename, request.GET.get('format', 'csv'))
 
-    # 检查是否已选过该课程
-    if Enrollment.objects.filter(student=request.user, course_class=course_class).exists():
-        messages.error(request, '您已经选过这门课程了。')
-        return redirect('courses:class_detail', pk=class_id)
 
-    # 检查是否选过同一课程的其他班次
-    existing_enrollments = Enrollment.objects.filter(
-        student=request.user,
-        course_class__course=course_class.course
-    ).exclude(status='rejected')
+@login_required
+def course_enrollment_export_view(request, course_id):
+    """导出课程各班次的选课名单；教师只导出自己授课的班次"""
+    course = get_object_or_404(Course, id=course_id)
+    user = request.user
+    is_admin = user.is_superuser or user.user_type == 'admin'
+    if not is_admin and user.user_type != 'teacher':
+        messages.error(request, '您没有权限导出该课程的名单。')
+        return redirect('courses:enrollment_list')
 
-    if existing_enrollments.exists():
-        course_name = course_class.course.course_name
-        messages.error(request, f'您已经选过《{course_name}》的其他班次了，不能重复选择同一门课程。')
-        return redirect('courses:class_detail', pk=class_id)
+    queryset = Enrollment.objects.filter(course_class__course=course)
+    if not is_admin:
+        queryset = queryset.filter(course_class__teacher=user)
+    queryset = queryset.order_by('course_class__class_code', 'enroll_time', 'id')
+    return export_response(queryset, f'{course.course_code}-名单', request.GET.get('format', 'csv'))
 
-    # 检查名额
-    if course_class.is_full:
-        messages.error(request, '该课程班次已满，无法选课。')
-        return redirect('courses:class_detail', pk=class_id)
 
-    # 检查是否有待处理的申请
-    pending_enrollments = Enrollment.objects.filter(
-        student=request.user,
-        status='pending'
-    ).count()
+@login_required
+def enroll_course_view(request, class_id):
+    """学生选课"""
+    if request.user.user_type != 'student':
+        messages.error(request, '只有学生可以进行选课操作。')
+        return redirect('courses:class_list')
 
-    # 限制每个学生最多同时有5个待处理申请
-    if pending_enrollments >= 5:
-        messages.error(request, f'您已有 {pending_enrollments} 个待处理的选课申请，请等待审核完成后再选课。')
+    course_class = get_object_or_404(CourseClass.objects.select_related('course'), id=class_id, is_active=True)
+
+    # 预检查，尽早给出提示；最终以 reserve_seat 在事务内的复查为准
+    snapshot = get_enrollment_snapshot(request.user, request)
+    try:
+        check_eligibility(request.user, course_class, snapshot)
+        check_schedule_conflict(request.user, course_class)
+        if course_class.is_full:
+            raise EnrollmentError('该课程班次已满，无法选课。', code='full')
+    except EnrollmentError as e:
+        messages.error(request, e.message)
         return redirect('courses:class_detail', pk=class_id)
 
     if request.method == 'POST':
@@ -361,22 +466,23 @@ def enroll_course_view(request, class_id):
         post_data = request.POST.copy()
         post_data.pop('student', None)
 
-        form = StudentEnrollmentForm(post_data, student=request.user)
+        form = StudentEnrollmentForm(post_data, student=request.user, snapshot=snapshot)
         if form.is_valid():
-            with transaction.atomic():
-                enrollment = form.save(commit=False)
-                enrollment.student = request.user
-                enrollment.course_class = course_class
-                enrollment.save()
+            remarks = form.cleaned_data.get('remarks')
+            if queued_mode_enabled():
+                return _enqueue_enrollment_response(request, course_class, remarks)
 
-                # 更新选课人数
-                course_class.current_students += 1
-                course_class.save()
+            reserve = reserve_seat_grouped if group_commit_enabled() else reserve_seat
+            try:
+                reserve(request.user, course_class, remarks=remarks)
+            except EnrollmentError as e:
+                messages.error(request, e.message)
+                return redirect('courses:class_detail', pk=class_id)
 
-                messages.success(request, '选课申请已提交，请等待审核。')
-                return redirect('courses:enrollment_list')
+            messages.success(request, '选课申请已提交，请等待审核。')
+            return redirect('courses:enrollment_list')
     else:
-        form = StudentEnrollmentForm(student=request.user)
+        form = StudentEnrollmentForm(student=request.user, snapshot=snapshot)
         form.fields['course_class'].initial = course_class.id
 
     return render(request, 'courses/enroll_form.html', {
@@ -385,6 +491,46 @@ def enroll_course_view(request, class_id):
     })
 
 
+def _enqueue_enrollment_response(request, course_class, remarks):
+    """排队模式：写入票据后立即返回票号"""
+    is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    try:
+        ticket = enqueue_enrollment(request.user, course_class, remarks=remarks)
+    except EnrollmentError as e:
+        if is_ajax:
+            return JsonResponse({'error': e.message}, status=409)
+        messages.error(request, e.message)
+        return redirect('courses:class_detail', pk=course_class.id)
+
+    if is_ajax:
+        return JsonResponse({
+            'ticket_id': ticket.id,
+            'status': ticket.status,
+            'status_url': reverse('courses:enrollment_ticket', args=[ticket.id]),
+        }, status=202)
+    messages.info(request, f'选课申请已进入排队，票号 {ticket.id}，处理结果稍后可在选课记录中查看。')
+    return redirect('courses:enrollment_list')
+
+
+@login_required
+def enrollment_ticket_view(request, ticket_id):
+    """查询排队选课票据的处理状态（JSON）"""
+    ticket = get_object_or_404(EnrollmentTicket, id=ticket_id)
+    if ticket.student_id != request.user.id and not (
+        request.user.is_superuser or request.user.user_type == 'admin'
+    ):
+        return JsonResponse({'error': '您没有权限查看该票据。'}, status=403)
+
+    return JsonResponse({
+        'ticket_id': ticket.id,
+        'course_class_id': ticket.course_class_id,
+        'status': ticket.status,
+        'message': ticket.message,
+        'position': queue_position(ticket),
+        'enrollment_id': ticket.enrollment_id,
+    })
+
+
 @login_required
 def approve_enrollment_view(request, enrollment_id):
     """审核选课申请"""
@@ -392,31 +538,85 @@ def approve_enrollment_view(request, enrollment_id):
         messages.error(request, '您没有权限进行此操作。')
         return redirect('courses:enrollment_list')
 
-    enrollment = get_object_or_404(Enrollment, id=enrollment_id)
-    action = request.POST.get('action')
-
-    if action == 'approve':
-        enrollment.status = 'approved'
-        enrollment.approve_time = timezone.now()
-        messages.success(request, '选课申请已通过。')
-    elif action == 'reject':
-        enrollment.status = 'rejected'
-        # 如果已计算在选课人数中，需要减去
-        if enrollment.course_class.current_students > 0:
-            enrollment.course_class.current_students -= 1
-            enrollment.course_class.save()
-        messages.success(request, '选课申请已拒绝。')
-    elif action == 'drop':
-        enrollment.status = 'dropped'
-        if enrollment.course_class.current_students > 0:
-            enrollment.course_class.current_students -= 1
-            enrollment.course_class.save()
-        messages.success(request, '学生已退课。')
-
-    enrollment.save()
+    enrollment = get_object_or_404(Enrollment.objects.select_related('course_class'), id=enrollment_id)
+    if request.user.user_type == 'teacher' and enrollment.course_class.teacher_id != request.user.id:
+        messages.error(request, '您只能审核自己班次的选课申请。')
+        return redirect('courses:enrollment_list')
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        try:
+            transition_enrollment(enrollment, action)
+        except EnrollmentError as e:
+            messages.error(request, e.message)
+        else:
+            messages.success(request, {
+                'approve': '选课申请已通过。',
+                'reject': '选课申请已拒绝。',
+                'drop': '学生已退课。',
+            }[action])
     return redirect('courses:enrollment_list')
 
 
+class ApprovalQueueView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    """待审核选课申请，按班次分组，可批量通过或拒绝
+
+    按 (班次, 申请时间) 键集分页，同一班次的申请在页内连续，跨页的班次在下一页
+    接着列出。
+    """
+    template_name = 'courses/approval_queue.html'
+    context_object_name = 'enrollments'
+    paginate_by = 50
+    keyset_ordering = ('course_class_id', 'enroll_time', 'id')
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        if not (user.is_superuser or user.user_type in ['admin', 'teacher']):
+            messages.error(request, '您没有权限进行此操作。')
+            return redirect('courses:enrollment_list')
+        return super().get(request, *args, **kwargs)
+
+    def is_admin(self):
+        user = self.request.user
+        return user.is_superuser or user.user_type == 'admin'
+
+    def get_queryset(self):
+        pending = Enrollment.objects.filter(status='pending').select_related('student', 'course_class__course')
+        if not self.is_admin():
+            pending = pending.filter(course_class__teacher=self.request.user)
+        return pending
+
+    def get_count_scope(self):
+        owner = '' if self.is_admin() else f'teacher:{self.request.user.pk}'
+        return f'{super().get_count_scope()}:{owner}'
+
+
+@login_required
+def bulk_review_view(request):
+    """批量审核：对勾选的申请统一通过或拒绝"""
+    user = request.user
+    if not (user.is_superuser or user.user_type in ['admin', 'teacher']):
+        messages.error(request, '您没有权限进行此操作。')
+        return redirect('courses:enrollment_list')
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        enrollment_ids = [int(pk) for pk in request.POST.getlist('enrollment_ids') if pk.isdigit()]
+        teacher = None if user.is_superuser or user.user_type == 'admin' else user
+        try:
+            processed = bulk_transition(enrollment_ids, action, teacher=teacher)
+        except EnrollmentError as e:
+            messages.error(request, e.message)
+        else:
+            label = '通过' if action == 'approve' else '拒绝'
+            skipped = len(enrollment_ids) - processed
+            message = f'已{label} {processed} 条选课申请。'
+            if skipped:
+                message += f'{skipped} 条已被处理或无权审核，已跳过。'
+            messages.success(request, message)
+    return redirect('courses:approval_queue')
+
+
 @login_required
 def grade_enrollment_view(request, enrollment_id):
     """录入成绩"""
@@ -444,11 +644,12 @@ def grade_enrollment_view(request, enrollment_id):
 
 
 # 用户管理视图（管理员专用）
-class UserListView(LoginRequiredMixin, IsAdminMixin, ListView):
+class UserListView(LoginRequiredMixin, IsAdminMixin, KeysetPaginationMixin, ListView):
     model = User
     template_name = 'users/user_list.html'
     context_object_name = 'users'
     paginate_by = 10
+    keyset_ordering = ('-date_joined', '-id')
 
     def get_queryset(self):
         queryset = User.objects.all().order_by('-date_joined')
@@ -573,21 +774,21 @@ def class_unenroll_view(request, class_id):
     """学生申请退课"""
     if request.user.user_type != 'student':
         messages.error(request, '只有学生可以进行退课操作。')
-        return redirect('class_detail', pk=class_id)
+        return redirect('courses:class_detail', pk=class_id)
 
     course_class = get_object_or_404(CourseClass, id=class_id)
     enrollment = get_object_or_404(Enrollment, student=request.user, course_class=course_class)
 
     if enrollment.status != 'approved':
         messages.error(request, '只能退已审核通过的选课。')
-        return redirect('class_detail', pk=class_id)
+        return redirect('courses:class_detail', pk=class_id)
 
     if request.method == 'POST':
-        enrollment.status = 'dropped'
-        if course_class.current_students > 0:
-            course_class.current_students -= 1
-            course_class.save()
-        enrollment.save()
+        try:
+            transition_enrollment(enrollment, 'drop')
+        except EnrollmentError as e:
+            messages.error(request, e.message)
+            return redirect('courses:class_detail', pk=class_id)
         messages.success(request, '退课申请已提交。')
         return redirect('courses:enrollment_list')
 
@@ -607,12 +808,12 @@ def enrollment_cancel_view(request, enrollment_id):
         return redirect('courses:enrollment_list')
 
     if request.method == 'POST':
-        course_class = enrollment.course_class
-        if course_class.current_students > 0:
-            course_class.current_students -= 1
-            course_class.save()
-        enrollment.delete()
-        messages.success(request, '选课申请已取消。')
+        try:
+            cancel_enrollment(enrollment)
+        except EnrollmentError as e:
+            messages.error(request, e.message)
+        else:
+            messages.success(request, '选课申请已取消。')
         return redirect('courses:enrollment_list')
 
     return render(request, 'courses/enrollment_cancel_confirm.html', {
@@ -620,6 +821,83 @@ def enrollment_cancel_view(request, enrollment_id):
     })
 
 
+@login_required
+def waitlist_join_view(request, class_id):
+    """学生加入候补名单"""
+    if request.user.user_type != 'student':
+        messages.error(request, '只有学生可以加入候补名单。')
+        return redirect('courses:class_detail', pk=class_id)
+
+    course_class = get_object_or_404(CourseClass.objects.select_related('course'), id=class_id)
+    if request.method == 'POST':
+        try:
+            entry = join_waitlist(request.user, course_class, remarks=request.POST.get('remarks'))
+        except EnrollmentError as e:
+            messages.error(request, e.message)
+        else:
+            messages.success(request, f'已加入候补名单，当前排在第 {waitlist_position(entry)} 位。有名额释放时将自动为您提交选课申请。')
+    return redirect('courses:class_detail', pk=class_id)
+
+
+@login_required
+def waitlist_leave_view(request, class_id):
+    """学生退出候补名单"""
+    course_class = get_object_or_404(CourseClass, id=class_id)
+    if request.method == 'POST':
+        if leave_waitlist(request.user, course_class):
+            messages.success(request, '已退出候补名单。')
+        else:
+            messages.error(request, '您不在该班次的候补名单中。')
+    return redirect('courses:class_detail', pk=class_id)
+
+
+@login_required
+def allocation_round_list_view(request):
+    """正在收集志愿的抽签选课轮次"""
+    now = timezone.now()
+    rounds = AllocationRound.objects.filter(status='open', opens_at__lte=now, closes_at__gt=now)
+    return render(request, 'courses/allocation_round_list.html', {'rounds': rounds})
+
+
+@login_required
+def allocation_preferences_view(request, round_id):
+    """学生填报或修改抽签轮次的志愿，截止前可反复提交"""
+    if request.user.user_type != 'student':
+        messages.error(request, '只有学生可以填报志愿。')
+        return redirect('courses:allocation_round_list')
+
+    allocation_round = get_object_or_404(AllocationRound, id=round_id)
+    if not allocation_round.is_accepting(timezone.now()):
+        messages.error(request, '该轮次当前不接受志愿填报。')
+        return redirect('courses:allocation_round_list')
+
+    preferences = EnrollmentPreference.objects.filter(allocation_round=allocation_round, student=request.user)
+    if request.method == 'POST':
+        form = AllocationPreferenceForm(request.POST, allocation_round=allocation_round)
+        if form.is_valid():
+            # 只写志愿表，不触碰班次计数，窗口期内没有名额竞争
+            with transaction.atomic():
+                preferences.delete()
+                EnrollmentPreference.objects.bulk_create([
+                    EnrollmentPreference(
+                        allocation_round=allocation_round, student=request.user, course_class=course_class, rank=rank
+                    )
+                    for rank, course_class in enumerate(form.ranked_classes, start=1)
+                ])
+            messages.success(request, f'已保存 {len(form.ranked_classes)} 个志愿，截止后统一抽签分配。')
+            return redirect('courses:allocation_preferences', round_id=round_id)
+    else:
+        form = AllocationPreferenceForm(
+            initial={f'choice_{p.rank}': p.course_class_id for p in preferences},
+            allocation_round=allocation_round,
+        )
+
+    return render(request, 'courses/allocation_preferences.html', {
+        'form': form,
+        'allocation_round': allocation_round,
+    })
+
+
 class AnnouncementCreateView(LoginRequiredMixin, CreateView):
     model = Announcement
     form_class = AnnouncementForm
@@ -746,56 +1024,10 @@ def admin_delete_user_view(request, pk):
             messages.error(request, f'删除被阻止：{"; ".join(blocking_info)}。请确认您了解删除的后果。')
             return redirect('courses:user_list')
 
-        username = user_to_delete.username
-        try:
-            with transaction.atomic():
-                # 记录删除操作
-                messages.info(request, f'正在删除用户 {username} 及其所有相关数据...')
-
-                # 删除选课记录（如果有）
-                if user_to_delete.user_type == 'student':
-                    enrollment_count = user_to_delete.enrollment_set.count()
-                    if enrollment_count > 0:
-                        user_to_delete.enrollment_set.all().delete()
-                        messages.info(request, f'已删除 {enrollment_count} 条选课记录')
-
-                # 删除授课班级（如果有）
-                if user_to_delete.user_type == 'teacher':
-                    class_count = user_to_delete.courseclass_set.count()
-                    if class_count > 0:
-                        # 不能直接删除有学生的班级，需要先取消关联
-                        classes_with_students = user_to_delete.courseclass_set.filter(current_students__gt=0)
-                        if classes_with_students.exists():
-                            for course_class in classes_with_students:
-                                # 将班级的教师设置为空，或者重新分配
-                                course_class.teacher = None
-                                course_class.save()
-                            messages.warning(request, f'已将 {classes_with_students.count()} 个有学生的班级的教师字段清空')
-
-                        # 删除没有学生的班级
-                        empty_classes = user_to_delete.courseclass_set.filter(current_students=0)
-                        empty_count = empty_classes.count()
-                        if empty_count > 0:
-                            empty_classes.delete()
-                            messages.info(request, f'已删除 {empty_count} 个空的授课班级')
-
-                # 删除相关的档案信息
-                if hasattr(user_to_delete, 'studentprofile'):
-                    user_to_delete.studentprofile.delete()
-                    messages.info(request, '已删除学生档案')
-                elif hasattr(user_to_delete, 'teacherprofile'):
-                    user_to_delete.teacherprofile.delete()
-                    messages.info(request, '已删除教师档案')
-
-                # 删除用户
-                user_to_delete.delete()
-
-                messages.success(request, f'用户 {username} 已成功删除！')
-                return redirect('courses:user_list')
-
-        except Exception as e:
-            messages.error(request, f'删除用户失败：{str(e)}')
-            return redirect('courses:user_list')
+        # 用户连同选课记录、授课班次由后台任务分批删除，请求只停用账户并提交任务
+        job = enqueue_user_deletion(user_to_delete, requested_by=request.user)
+        _deletion_submitted(request, job)
+        return redirect('courses:user_list')
 
     # 计算相关数据统计
     stats = {}
@@ -811,4 +1043,34 @@ def admin_delete_user_view(request, pk):
     return render(request, 'users/admin_delete_user.html', {
         'user_to_delete': user_to_delete,
         'stats': stats
-    })
\ No newline at end of file
+    })
+
+
+def _deletion_submitted(request, job):
+    """提交删除任务后的提示；同步模式下直接执行任务"""
+    if not background_deletion_enabled():
+        run_deletion_job(job)
+        if job.status == 'done':
+            messages.success(request, f'{job.get_target_type_display()} {job.target_label} 已删除！')
+        else:
+            messages.error(request, f'删除失败：{job.message}')
+        return
+    messages.info(request, f'已提交删除任务 #{job.id}：{job.target_label} 及其相关数据将在后台分批删除。')
+
+
+@login_required
+def deletion_job_view(request, job_id):
+    """查询后台删除任务的进度（JSON）"""
+    if not (request.user.is_superuser or request.user.user_type == 'admin'):
+        return JsonResponse({'error': '您没有权限查看该任务。'}, status=403)
+    job = get_object_or_404(DeletionJob, id=job_id)
+    return JsonResponse({
+        'job_id': job.id,
+        'target_type': job.target_type,
+        'target_id': job.target_id,
+        'status': job.status,
+        'total': job.total,
+        'deleted': job.deleted,
+        'progress': job.progress,
+        'message': job.message,
+    })
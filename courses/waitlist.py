@@ -0,0 +1,106 @@
+"""候补名单
+
+班次满员时学生可以加入候补名单，不必反复刷新页面。退课、取消申请、拒绝或
+退选释放名额时，在同一事务内按加入顺序递补队首的学生；一次释放多个名额时
+整批递补（复用分组提交的批量写入）。
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .batching import EnrollmentRequest, apply_enrollment_batch
+from .models import Enrollment, WaitlistEntry
+from .schedule import check_schedule_conflict
+from .seats import EnrollmentError, check_eligibility, release_seats
+
+
+def join_waitlist(student, course_class, remarks=None):
+    """加入班次候补名单，返回候补记录"""
+    if not course_class.is_full:
+        raise EnrollmentError('该班次仍有名额，请直接选课。', code='not_full')
+    check_eligibility(student, course_class)
+    try:
+        with transaction.atomic():
+            return WaitlistEntry.objects.create(student=student, course_class=course_class, remarks=remarks)
+    except IntegrityError:
+        raise EnrollmentError('您已在该班次的候补名单中。', code='waiting')
+
+
+def leave_waitlist(student, course_class):
+    """退出候补名单，返回是否有记录被取消"""
+    return WaitlistEntry.objects.filter(
+        student=student, course_class=course_class, status='waiting'
+    ).update(status='cancelled') > 0
+
+
+def waitlist_position(entry):
+    """候补名次（从 1 开始），已不在候补中时返回 None"""
+    if entry.status != 'waiting':
+        return None
+    return WaitlistEntry.objects.filter(
+        course_class_id=entry.course_class_id, status='waiting', pk__lte=entry.pk
+    ).count()
+
+
+def promote_waitlist(course_class, seats):
+    """按候补顺序递补最多 seats 名学生，返回递补成功的人数
+
+    应在释放名额的同一事务内调用。已不满足选课条件的候补（已选同一课程、与
+    加入候补后选的班次上课时间冲突等）会被取消；待审核申请已达上限的学生保留
+    候补位置，本轮跳过。
+    """
+    promoted = 0
+    skipped = set()
+    with transaction.atomic():
+        while promoted < seats:
+            heads = list(
+                WaitlistEntry.objects.filter(course_class=course_class, status='waiting')
+                .exclude(pk__in=skipped)
+                .select_related('student')
+                .order_by('id')[:seats - promoted]
+            )
+            if not heads:
+                break
+
+            # 与同步选课相同的上课时间冲突检查，冲突的候补取消
+            changed = []
+            for entry in heads:
+                try:
+                    check_schedule_conflict(entry.student, course_class)
+                except EnrollmentError:
+                    entry.status = 'cancelled'
+                    changed.append(entry)
+            heads = [entry for entry in heads if entry.status == 'waiting']
+
+            results = apply_enrollment_batch([
+                EnrollmentRequest(entry.student, course_class, entry.remarks) for entry in heads
+            ]) if heads else []
+            now = timezone.now()
+            class_full = False
+            for entry, result in zip(heads, results):
+                if isinstance(result, Enrollment):
+                    entry.status = 'promoted'
+                    entry.enrollment = result
+                    entry.promoted_at = now
+                    promoted += 1
+                elif result.code == 'full':
+                    class_full = True
+                    continue
+                elif result.code == 'pending_limit':
+                    skipped.add(entry.pk)
+                    continue
+                else:
+                    entry.status = 'cancelled'
+                changed.append(entry)
+            WaitlistEntry.objects.bulk_update(changed, ['status', 'enrollment', 'promoted_at'])
+            if class_full:
+                break
+    return promoted
+
+
+def release_seats_and_promote(course_class, count=1):
+    """释放 count 个名额并在同一事务内递补候补名单，返回递补人数"""
+    with transaction.atomic():
+        released = release_seats(course_class, count)
+        if not released:
+            return 0
+        return promote_waitlist(course_class, released)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -69,6 +70,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'student_system.wsgi.application'
+ASGI_APPLICATION = 'student_system.asgi.application'
 
 
 # Database
@@ -78,13 +80,89 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # 并发写入时等待锁释放，而不是立即报 database is locked
+            'timeout': 20,
+        },
+        'TEST': {
+            # 使用文件数据库，便于并发测试中的多个线程各自建立连接
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# 设置 DB_ENGINE=postgresql 时改用本地 PostgreSQL（压测与基准测试用）
+if os.environ.get('DB_ENGINE') == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'student_system'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+    }
+
+
+# 缓存：选课快照、课表索引、仪表板片段、列表总数、课程推荐等都依赖各进程（web、
+# 排队 worker、删除 worker、管理命令）共享同一份缓存，才能互相看到失效与更新。
+# 生产环境须设置 REDIS_URL 使用 Redis（manage.py check --deploy 会检查）。
+# 未设置时退回数据库缓存表（migrate 时建立），仅供开发使用：每次读写缓存都是一条
+# SQL，每次写入还要 COUNT(*) 整张表；MAX_ENTRIES 调大，避免超出上限时按键名淘汰
+# 掉版本号等不过期的键。不要换成进程内的 LocMemCache，否则其他进程写入后这里会
+# 读到过期数据。
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'courses_cache',
+            'OPTIONS': {'MAX_ENTRIES': 10_000_000},
+        }
+    }
 
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
 
+# 选课模式：'sync' 在请求内直接处理；'queued' 只写入排队票据，
+# 由 manage.py process_enrollment_queue 启动的 worker 处理
+COURSES_ENROLLMENT_MODE = 'sync'
+
+# 同步选课时是否启用分组提交：把若干毫秒内到达的选课请求合并为一个事务写入
+COURSES_GROUP_COMMIT = False
+COURSES_GROUP_COMMIT_WINDOW_MS = 5
+
+# 管理员仪表板是否读取物化的统计行（DashboardStats），由信号增量维护，
+# 可用 manage.py rebuild_dashboard_stats 重建；关闭时每次用条件聚合实时统计
+COURSES_DASHBOARD_STATS = False
+
+# 异步仪表板并发执行查询的线程数，也是它额外占用的数据库连接数上限
+COURSES_DASHBOARD_DB_THREADS = 4
+
+# 学生仪表板推荐课程所用的学期（学年, 学期），如 ('2024', '秋季')；为 None 时
+# 取最近一学年中仍有名额的课程所在学期。推荐数据由 manage.py build_recommendations 构建
+COURSES_CURRENT_SEMESTER = None
+
+# 无筛选条件的列表估计行数不低于该值时，总数直接使用数据库统计信息中的估计值
+COURSES_COUNT_ESTIMATE_THRESHOLD = 100000
+
+# 课程全文检索最多返回的结果数（按相关度取前若干条再分页）
+COURSES_SEARCH_LIMIT = 1000
+
+# 删除课程、用户的方式：'background' 只提交删除任务，由 manage.py process_deletion_jobs
+# 启动的 worker 分批删除；'sync' 在请求内直接分批删除（未启动 worker 的开发环境使用）
+COURSES_DELETION_MODE = 'background'
+# 删除中的任务超过这么多秒没有进展（worker 崩溃或被杀），由其他 worker 重新领取
+COURSES_DELETION_STALE_SECONDS = 300
+
+# 批量审核一次可能勾选上千条选课申请，默认的 1000 个表单字段不够用
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 10000
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
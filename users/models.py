@@ -18,6 +18,11 @@ class User(AbstractUser):
     class Meta:
         verbose_name = '用户'
         verbose_name_plural = '用户'
+        indexes = [
+            # 用户列表按 (-date_joined, -id) 分页，可按用户类型筛选；也覆盖仪表板的按类型计数
+            models.Index(fields=['date_joined', 'id'], name='user_joined_idx'),
+            models.Index(fields=['user_type', 'date_joined', 'id'], name='user_type_joined_idx'),
+        ]
 
 
 class StudentProfile(models.Model):